@@ -0,0 +1 @@
+from .admins import router as admin_router
\ No newline at end of file
@@ -0,0 +1,155 @@
+import asyncio
+import io
+from datetime import date, timedelta
+from typing import List, Literal, Optional
+from fastapi import APIRouter, File, HTTPException, UploadFile, status
+from database import engine
+from functions import admin_dependency, db_dependency, generate_jwt_token, otp_generator, read_db_dependency
+from models import Admin, DepartmentDailyStats, Hospital
+from schemas.admins_schema import AdminLoginSchema, AdminSchema, AdminSchemaWithTokens, DailyActivitySchema, StaffImportResultSchema
+from schemas.users_schema import OTPSchema
+from services.cache import query_cache
+from services.load_shedding import limiters
+from services.logger import logger
+from services.rate_limit import rate_limit
+from services.redis_client import get_redis_client
+from services.send_email import send_otp_email
+from services.serializers import ORJSONResponse, daily_activity_list_adapter, dump_rows
+from services.sharding import tenant_router
+from services.staff_import import import_staff
+from sqlalchemy import func, literal, select
+
+router = APIRouter(
+    prefix="/admins",
+    tags=["Admins"],
+)
+
+redis_client = get_redis_client()
+
+@router.post("/login/", dependencies=[rate_limit("admin-login")])
+async def login_admin(request: AdminLoginSchema, db: db_dependency):
+    admin = db.query(Admin).where(Admin.username == request.username, Admin.email == request.email).first()
+    if not admin:
+        logger.warning(f"Unauthorized admin access by {request.email}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Admin not found")
+
+    new_otp = otp_generator()
+
+    try:
+        # Cache OTP in Redis for 10 minutes
+        key = f"admin:{request.email}"
+        redis_client.set(key, new_otp, ex=60 * 10)
+
+        result = await send_otp_email(recipient=request.email, otp_code=new_otp)
+        if result.get("status") != "success":
+            raise Exception("Failed to send OTP email")
+
+    except Exception as e:
+        logger.error(f"Error sending admin OTP to {request.email}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to send OTP. Please try again."
+        )
+
+    return result
+
+@router.post("/verify-otp/", response_model=AdminSchemaWithTokens, dependencies=[rate_limit("admin-verify-otp")])
+async def verify_admin_otp(request: OTPSchema, db: db_dependency):
+    key = f"admin:{request.email}"
+    stored_otp = redis_client.get(key)
+
+    if not stored_otp:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="OTP expired or not found")
+
+    if stored_otp != request.otp:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid OTP")
+
+    # Remove OTP after successful verification (prevent reuse)
+    redis_client.delete(key)
+
+    admin = db.query(Admin).filter(Admin.email == request.email).first()
+    if not admin:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Admin not found")
+
+    admin_model = AdminSchema.model_validate(admin)
+
+    return {
+        "access_token": generate_jwt_token(admin_model, token_type="access"),
+        "refresh_token": generate_jwt_token(admin_model, token_type="refresh"),
+        "admin_details": admin_model,
+    }
+
+@router.post("/staff/import", response_model=StaffImportResultSchema)
+async def import_staff_csv(current_admin: admin_dependency, file: UploadFile = File(...), dry_run: bool = False):
+    """
+    Bulk import staff from a CSV upload (work_id, first_name, last_name, email, occupation, department, hospital_id).
+    Existing staff are updated by work_id; invalid rows are reported and skipped.
+    """
+    source = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+
+    try:
+        # COPY and the upsert are blocking, keep them off the event loop
+        excluded = await asyncio.to_thread(tenant_router.hospitals_off_default)
+        result = await asyncio.to_thread(import_staff, engine, source, dry_run, excluded)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be UTF-8 encoded CSV")
+    finally:
+        source.detach()
+
+    logger.info(f"Admin {current_admin.username} imported staff from {file.filename}")
+    return result
+
+
+@router.get("/analytics/daily", response_model=List[DailyActivitySchema], response_class=ORJSONResponse)
+async def get_daily_activity(
+    current_admin: admin_dependency,
+    db: read_db_dependency,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    hospital_id: Optional[str] = None,
+    group_by: Literal["department", "hospital"] = "department",
+):
+    """
+    Daily message and active-user counts per hospital department (or per hospital).
+    Reads only the rollup tables maintained by services.rollups; defaults to the last 30 days.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=30)
+
+    stats = DepartmentDailyStats
+    if group_by == "hospital":
+        # Each user-day is attributed to one department, so summing departments keeps users distinct
+        columns = (
+            stats.day,
+            Hospital.hospital_id,
+            literal(None).label("department"),
+            func.sum(stats.message_count).label("message_count"),
+            func.sum(stats.active_users).label("active_users"),
+        )
+    else:
+        columns = (stats.day, Hospital.hospital_id, stats.department, stats.message_count, stats.active_users)
+
+    stmt = (
+        select(*columns)
+        .join(Hospital, Hospital.id == stats.hospital_id)
+        .where(stats.day >= start, stats.day <= end)
+        .order_by(stats.day, Hospital.hospital_id)
+    )
+    if hospital_id is not None:
+        stmt = stmt.where(Hospital.hospital_id == hospital_id)
+    if group_by == "hospital":
+        stmt = stmt.group_by(stats.day, Hospital.hospital_id)
+
+    return ORJSONResponse(dump_rows(daily_activity_list_adapter, db.execute(stmt).all()))
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_admin: admin_dependency):
+    """Hit/miss counters of the query cache for this worker, per cached endpoint."""
+    return query_cache.stats.snapshot()
+
+
+@router.get("/load/stats")
+async def get_load_stats(current_admin: admin_dependency):
+    """Current adaptive concurrency limit, queue and shed counts of each route class on this worker."""
+    return {name: limiter.snapshot() for name, limiter in limiters.items()}
@@ -0,0 +1,28 @@
+"""Drop the messages (room_id, id) index
+
+Revision ID: 0b7e3d9a5c42
+Revises: f2a9c4e6b813
+Create Date: 2026-10-19 23:41:17.502964
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e3d9a5c42'
+down_revision: Union[str, Sequence[str], None] = 'f2a9c4e6b813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index('ix_messages_room_id_id', table_name='messages')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_messages_room_id_id', 'messages', ['room_id', 'id'], unique=False)
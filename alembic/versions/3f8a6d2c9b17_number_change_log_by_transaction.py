@@ -0,0 +1,32 @@
+"""Number change log entries by transaction
+
+Revision ID: 3f8a6d2c9b17
+Revises: 0b7e3d9a5c42
+Create Date: 2026-10-20 10:14:52.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a6d2c9b17'
+down_revision: Union[str, Sequence[str], None] = '0b7e3d9a5c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Entries written so far carry no transaction and cannot be served from a transaction cursor
+    op.execute('DELETE FROM change_log')
+    op.add_column('change_log', sa.Column('xact_id', sa.BigInteger(), nullable=True))
+    op.create_index(op.f('ix_change_log_xact_id'), 'change_log', ['xact_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_change_log_xact_id'), table_name='change_log')
+    op.drop_column('change_log', 'xact_id')
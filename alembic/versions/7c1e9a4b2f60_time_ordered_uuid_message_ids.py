@@ -0,0 +1,55 @@
+"""Time-ordered native UUID ids for messages
+
+Revision ID: 7c1e9a4b2f60
+Revises: d06efdfa9460
+Create Date: 2026-10-19 10:12:04.518233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e9a4b2f60'
+down_revision: Union[str, Sequence[str], None] = 'd06efdfa9460'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The foreign key has to go while both sides change type
+    op.drop_constraint('message_senders_message_id_fkey', 'message_senders', type_='foreignkey')
+
+    # Unique constraints duplicated by the primary key index (created by the first two migrations)
+    op.execute("ALTER TABLE messages DROP CONSTRAINT IF EXISTS messages_id_key1")
+    op.execute("ALTER TABLE messages DROP CONSTRAINT IF EXISTS messages_id_key")
+
+    # Existing ids are uuid4 strings and cast as-is, new rows get UUIDv7 from the application
+    op.alter_column('messages', 'id', type_=sa.Uuid(), postgresql_using='id::uuid')
+    op.alter_column('message_senders', 'message_id', type_=sa.Uuid(), postgresql_using='message_id::uuid')
+
+    op.create_foreign_key(
+        'message_senders_message_id_fkey', 'message_senders', 'messages',
+        ['message_id'], ['id'], ondelete='CASCADE',
+    )
+    op.create_index(op.f('ix_message_senders_message_id'), 'message_senders', ['message_id'], unique=False)
+    op.create_index('ix_messages_room_id_id', 'messages', ['room_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_room_id_id', table_name='messages')
+    op.drop_index(op.f('ix_message_senders_message_id'), table_name='message_senders')
+    op.drop_constraint('message_senders_message_id_fkey', 'message_senders', type_='foreignkey')
+
+    op.alter_column('message_senders', 'message_id', type_=sa.String(), postgresql_using='message_id::text')
+    op.alter_column('messages', 'id', type_=sa.String(), postgresql_using='id::text')
+
+    op.create_unique_constraint('messages_id_key', 'messages', ['id'])
+    op.create_foreign_key(
+        'message_senders_message_id_fkey', 'message_senders', 'messages',
+        ['message_id'], ['id'], ondelete='CASCADE',
+    )
@@ -0,0 +1,28 @@
+"""Index messages by room and timestamp
+
+Revision ID: 9e2b6f41d8a3
+Revises: 5a9d0c3e7b21
+Create Date: 2026-10-19 17:48:10.635902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e2b6f41d8a3'
+down_revision: Union[str, Sequence[str], None] = '5a9d0c3e7b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_room_id_timestamp', 'messages', ['room_id', 'timestamp'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_room_id_timestamp', table_name='messages')
@@ -0,0 +1,36 @@
+"""Hospital shard routing table
+
+Revision ID: a7d3c5e1f924
+Revises: 9e2b6f41d8a3
+Create Date: 2026-10-19 19:04:37.518230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3c5e1f924'
+down_revision: Union[str, Sequence[str], None] = '9e2b6f41d8a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('hospital_shards',
+    sa.Column('hospital_id', sa.String(), nullable=False),
+    sa.Column('shard', sa.String(), nullable=False),
+    sa.Column('read_only', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('hospital_id')
+    )
+    op.create_index(op.f('ix_hospital_shards_shard'), 'hospital_shards', ['shard'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_hospital_shards_shard'), table_name='hospital_shards')
+    op.drop_table('hospital_shards')
@@ -0,0 +1,41 @@
+"""Unique participant per room
+
+Revision ID: b3f5d2a81c47
+Revises: 7c1e9a4b2f60
+Create Date: 2026-10-19 11:40:27.903114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f5d2a81c47'
+down_revision: Union[str, Sequence[str], None] = '7c1e9a4b2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keep the earliest row of any duplicated membership before enforcing uniqueness
+    op.execute(
+        """
+        DELETE FROM participants p
+        USING participants d
+        WHERE p.room_id = d.room_id
+          AND p.participant_id = d.participant_id
+          AND p.participant_type = d.participant_type
+          AND p.id > d.id
+        """
+    )
+    op.create_unique_constraint(
+        'uq_participants_room_member', 'participants', ['room_id', 'participant_id', 'participant_type']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_participants_room_member', 'participants', type_='unique')
@@ -0,0 +1,100 @@
+"""Partition messages by month on timestamp
+
+Revision ID: e41a7c9d3b15
+Revises: b3f5d2a81c47
+Create Date: 2026-10-19 14:05:51.227640
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41a7c9d3b15'
+down_revision: Union[str, Sequence[str], None] = 'b3f5d2a81c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created ahead of the current month, services.partitions keeps this window moving
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A foreign key cannot reference the id of a partitioned table on its own (the partition key
+    # must be part of every unique constraint); the relationship is enforced by the ORM instead
+    op.drop_constraint('message_senders_message_id_fkey', 'message_senders', type_='foreignkey')
+
+    op.rename_table('messages', 'messages_legacy')
+    op.execute("ALTER INDEX messages_pkey RENAME TO messages_legacy_pkey")
+    op.execute("ALTER INDEX ix_messages_room_id_id RENAME TO ix_messages_legacy_room_id_id")
+    op.execute("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_room_id_fkey TO messages_legacy_room_id_fkey")
+
+    op.execute(
+        """
+        CREATE TABLE messages (
+            id UUID NOT NULL,
+            content VARCHAR NOT NULL,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            room_id VARCHAR NOT NULL REFERENCES chats (id),
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+        """
+    )
+    op.create_index('ix_messages_room_id_id', 'messages', ['room_id', 'id'], unique=False)
+
+    # One partition per month from the oldest existing message up to MONTHS_AHEAD months from now
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            part_month DATE;
+        BEGIN
+            FOR part_month IN
+                SELECT generate_series(
+                    date_trunc('month', LEAST(COALESCE(MIN("timestamp"), now()), now())),
+                    date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+                    interval '1 month'
+                )::date
+                FROM messages_legacy
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                    'messages_p' || to_char(part_month, 'YYYY_MM'),
+                    part_month,
+                    (part_month + interval '1 month')::date
+                );
+            END LOOP;
+        END $$;
+        """
+    )
+
+    op.execute('INSERT INTO messages (id, content, "timestamp", room_id) SELECT id, content, "timestamp", room_id FROM messages_legacy')
+    op.drop_table('messages_legacy')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table('messages_plain',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('room_id', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['room_id'], ['chats.id'], name='messages_plain_room_id_fkey'),
+    sa.PrimaryKeyConstraint('id', name='messages_plain_pkey')
+    )
+    op.execute('INSERT INTO messages_plain (id, content, "timestamp", room_id) SELECT id, content, "timestamp", room_id FROM messages')
+
+    # Dropping the parent drops every attached partition with it
+    op.drop_table('messages')
+    op.rename_table('messages_plain', 'messages')
+    op.execute("ALTER INDEX messages_plain_pkey RENAME TO messages_pkey")
+    op.execute("ALTER TABLE messages RENAME CONSTRAINT messages_plain_room_id_fkey TO messages_room_id_fkey")
+    op.create_index('ix_messages_room_id_id', 'messages', ['room_id', 'id'], unique=False)
+
+    op.create_foreign_key(
+        'message_senders_message_id_fkey', 'message_senders', 'messages',
+        ['message_id'], ['id'], ondelete='CASCADE',
+    )
@@ -0,0 +1,28 @@
+"""Index messages by timestamp and id
+
+Revision ID: f2a9c4e6b813
+Revises: c5e8f2a4d716
+Create Date: 2026-10-19 23:05:41.218337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a9c4e6b813'
+down_revision: Union[str, Sequence[str], None] = 'c5e8f2a4d716'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_timestamp_id', 'messages', ['timestamp', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_timestamp_id', table_name='messages')
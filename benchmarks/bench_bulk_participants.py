@@ -0,0 +1,108 @@
+"""
+Latency of POST /chats/{room_id}/participants/bulk for a large onboarding request: the work_ids
+resolved in one IN query and the participants inserted as multi-row VALUES in one transaction,
+against adding the same participants one ORM row at a time.
+
+The bulk insert relies on Postgres ON CONFLICT, so a Postgres database with the schema applied is
+required. Seeded rows use the HOSP-BENCH-PARTICIPANTS hospital and are deleted afterwards.
+
+Run from the project root:
+    python -m benchmarks.bench_bulk_participants --database-url postgresql://... --participants 5000
+"""
+import argparse
+import time
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from chats.chats import insert_participants, resolve_hospital_users
+from models import ChatRoom, Hospital, Participant, User, create_chat_id
+
+BENCH_HOSPITAL = "HOSP-BENCH-PARTICIPANTS"
+
+
+def seed(engine, participants: int) -> list:
+    with Session(engine) as db:
+        db.execute(insert(Hospital).on_conflict_do_nothing(), [{
+            "hospital_id": BENCH_HOSPITAL, "name": "Bench hospital", "email": "bench-participants@example.com",
+            "phone_number": "(555) 000-0000", "location": "Bench",
+        }])
+        hospital_pk = db.execute(select(Hospital.id).where(Hospital.hospital_id == BENCH_HOSPITAL)).scalar_one()
+        work_ids = [f"EMP-BENCHP-{i:07d}" for i in range(participants)]
+        db.execute(insert(User).on_conflict_do_nothing(), [
+            {"work_id": work_id, "first_name": "Charity", "last_name": "Mutembei",
+             "email": f"{work_id.lower()}@example.com", "occupation": "Doctor", "department": "Cardiology",
+             "hospital_id": hospital_pk}
+            for work_id in work_ids
+        ])
+        db.commit()
+    return work_ids
+
+
+def create_room(engine) -> str:
+    with Session(engine) as db:
+        room = ChatRoom(id=create_chat_id(), name=f"Bench onboarding {time.time_ns()}")
+        db.add(room)
+        db.commit()
+        return room.id
+
+
+def bulk_add(engine, room_id: str, work_ids: list) -> int:
+    """The endpoint's path, minus HTTP."""
+    with Session(engine) as db:
+        users = resolve_hospital_users(db, BENCH_HOSPITAL, work_ids)
+        added = insert_participants(db, ((room_id, user_id) for user_id in users.values()))
+        db.commit()
+        return added
+
+
+def row_by_row_add(engine, room_id: str, work_ids: list) -> int:
+    """One lookup and one ORM insert per participant."""
+    with Session(engine) as db:
+        for work_id in work_ids:
+            user_id = db.execute(select(User.id).where(User.work_id == work_id)).scalar_one()
+            db.add(Participant(room_id=room_id, participant_id=user_id, participant_type=User.__name__))
+        db.commit()
+        return len(work_ids)
+
+
+def cleanup(engine, room_ids: list):
+    with Session(engine) as db:
+        db.execute(delete(Participant).where(Participant.room_id.in_(room_ids)))
+        db.execute(delete(ChatRoom).where(ChatRoom.id.in_(room_ids)))
+        hospital_users = select(User.id).join(User.hospital).where(Hospital.hospital_id == BENCH_HOSPITAL)
+        db.execute(delete(User).where(User.id.in_(hospital_users)))
+        db.execute(delete(Hospital).where(Hospital.hospital_id == BENCH_HOSPITAL))
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--participants", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    work_ids = seed(engine, args.participants)
+    room_ids = []
+    try:
+        for name, func in (("bulk", bulk_add), ("row by row", row_by_row_add)):
+            best = float("inf")
+            for _ in range(args.repeat):
+                room_id = create_room(engine)
+                room_ids.append(room_id)
+                start = time.perf_counter()
+                added = func(engine, room_id, work_ids)
+                best = min(best, time.perf_counter() - start)
+            print(f"{name:>10}: {added} participants in {best * 1000:8.1f} ms (best of {args.repeat})")
+
+        # Re-sending the same request only hits the unique constraint
+        start = time.perf_counter()
+        added = bulk_add(engine, room_ids[0], work_ids)
+        print(f"{'repeat':>10}: {added} participants added in {(time.perf_counter() - start) * 1000:8.1f} ms")
+    finally:
+        cleanup(engine, room_ids)
+
+
+if __name__ == "__main__":
+    main()
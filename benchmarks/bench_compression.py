@@ -0,0 +1,89 @@
+"""
+Compression ratio and CPU cost of each response encoding on the user listing and inbox payloads,
+sent whole and streamed in chunks (flushed per chunk, as the middleware does).
+
+Run from the project root:
+    python -m benchmarks.bench_compression --rows 10000
+"""
+import argparse
+import time
+from datetime import datetime
+import orjson
+from benchmarks.bench_serialization import fast_path, make_rows
+from services.compression import ENCODERS
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def make_inbox(rooms: int) -> bytes:
+    """An inbox shaped like GET /users/chats with expand_users, 8 participants per room."""
+    user = {
+        "work_id": "EMP-22F3B1E4",
+        "first_name": "Charity",
+        "last_name": "Mutembei",
+        "email": "charity.k.mutembei@gmail.com",
+        "occupation": "Doctor",
+        "department": "Cardiology",
+        "hospital_id": "HOSP-38A2E9A1",
+    }
+    return orjson.dumps({"chats": [
+        {
+            "room_id": f"CHAT-{i:08X}",
+            "room_name": f"Ward round {i}",
+            "created_at": datetime(2026, 1, 1),
+            "last_message": {
+                "id": f"01a151d0-{i:04x}-7724-9b37-821722b3d788",
+                "content": "Patient in bed 4 moved to recovery, vitals stable",
+                "timestamp": datetime(2026, 10, 19, 8, i % 60),
+                "sender": {"id": i * 8, "type": "User", "user": {"id": i * 8, **user}},
+            },
+            "participants": [
+                {"participant_id": i * 8 + j, "participant_type": "User", "user": {"id": i * 8 + j, **user}}
+                for j in range(8)
+            ],
+        }
+        for i in range(rooms)
+    ]})
+
+
+def compress(encoding: str, payload: bytes, chunk_size: int = 0) -> bytes:
+    encoder = ENCODERS[encoding]()
+    if not chunk_size:
+        return encoder.finish(payload)
+    chunks = [encoder.encode(payload[start:start + chunk_size]) for start in range(0, len(payload), chunk_size)]
+    return b"".join(chunks) + encoder.finish()
+
+
+def measure(encoding: str, payload: bytes, chunk_size: int, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compressed = compress(encoding, payload, chunk_size)
+        best = min(best, time.perf_counter() - start)
+    return len(compressed), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = {
+        f"users x{args.rows}": fast_path(make_rows(args.rows)),
+        f"inbox x{args.rooms}": make_inbox(args.rooms),
+    }
+    for name, payload in payloads.items():
+        print(f"{name}: {len(payload) / 1024:.1f} KiB")
+        for encoding in ENCODERS:
+            for mode, chunk_size in (("whole", 0), ("streamed", STREAM_CHUNK_SIZE)):
+                size, elapsed = measure(encoding, payload, chunk_size, args.repeat)
+                print(
+                    f"{encoding:>6} {mode:>8}: {size / 1024:8.1f} KiB, ratio {len(payload) / size:5.1f}x, "
+                    f"{elapsed * 1000:7.2f} ms, {len(payload) / elapsed / 2**20:7.1f} MiB/s"
+                )
+
+
+if __name__ == "__main__":
+    main()
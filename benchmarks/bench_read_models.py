@@ -0,0 +1,102 @@
+"""
+Memory and latency of the user listing with full ORM entities versus the column-projection read model.
+
+Seeds a throwaway SQLite database by default; pass --database-url to measure against Postgres
+(the users/hospitals tables must exist).
+
+Run from the project root:
+    python -m benchmarks.bench_read_models --rows 100000
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from models import Base, Hospital, User
+from schemas.users_schema import UserSchema
+from services.read_models import list_users
+from services.serializers import dump_rows, user_list_adapter
+
+
+def seed(engine, rows: int, hospitals: int = 20):
+    Base.metadata.create_all(engine, tables=[Hospital.__table__, User.__table__])
+    with Session(engine) as db:
+        db.execute(insert(Hospital), [
+            {"hospital_id": f"HOSP-BENCH{h:03d}", "name": f"Hospital {h}", "email": f"h{h}@example.com",
+             "phone_number": f"(555) 000-{h:04d}", "location": "Bench"}
+            for h in range(hospitals)
+        ])
+        db.execute(insert(User), [
+            {"work_id": f"EMP-BENCH-{i:07d}", "first_name": "Charity", "last_name": "Mutembei",
+             "email": f"bench{i}@example.com", "occupation": "Doctor", "department": "Cardiology",
+             "hospital_id": i % hospitals + 1}
+            for i in range(rows)
+        ])
+        db.commit()
+
+
+def orm_listing(engine) -> bytes:
+    """The listing as originally written: ORM entities, the hospital loaded through the relationship."""
+    with Session(engine) as db:
+        users = [
+            UserSchema(
+                work_id=user.work_id,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                email=user.email,
+                occupation=user.occupation,
+                department=user.department,
+                hospital_id=user.hospital.hospital_id,
+            )
+            for user in db.query(User).all()
+        ]
+        return user_list_adapter.dump_json(users)
+
+
+def read_model_listing(engine) -> bytes:
+    with Session(engine) as db:
+        return dump_rows(user_list_adapter, list_users(db))
+
+
+def measure(func, engine):
+    # Timed and memory-traced separately, tracemalloc slows allocation-heavy code several times over
+    gc.collect()
+    start = time.perf_counter()
+    body = func(engine)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    func(engine)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--database-url", help="measure an existing database instead of a seeded SQLite file")
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        seed(engine, args.rows)
+
+    # Warm up connections and statement caches
+    read_model_listing(engine)
+    orm_listing(engine)
+
+    for name, func in (("ORM entities", orm_listing), ("read model", read_model_listing)):
+        elapsed, peak, size = measure(func, engine)
+        print(f"{name:>13}: {elapsed * 1000:8.1f} ms, peak {peak / 2**20:7.1f} MiB, {size / 2**20:.1f} MiB response")
+
+
+if __name__ == "__main__":
+    main()
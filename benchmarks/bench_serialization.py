@@ -0,0 +1,88 @@
+"""
+Per-row serialization cost of the user listing, before and after the orjson/TypeAdapter path.
+
+Run from the project root:
+    python -m benchmarks.bench_serialization --rows 10000
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from schemas.users_schema import UserSchema
+from services.serializers import ORJSONResponse, dump_rows, user_list_adapter
+
+# Stands in for the Core rows returned by the users listing query (attribute access, like sqlalchemy Row)
+UserRow = namedtuple("UserRow", ["work_id", "first_name", "last_name", "email", "occupation", "department", "hospital_id"])
+
+# FastAPI validates a returned list against response_model with an adapter like this one
+response_field_adapter = TypeAdapter(List[UserSchema])
+
+
+def make_rows(count: int) -> list:
+    return [
+        UserRow(
+            work_id=f"EMP-{i:08X}",
+            first_name="Charity",
+            last_name="Mutembei",
+            email=f"user{i}@example.com",
+            occupation="Doctor",
+            department="Cardiology",
+            hospital_id="HOSP-38A2E9A1",
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_path(rows: list) -> bytes:
+    """Hand-built UserSchema per row, re-validated and encoded by FastAPI's default JSONResponse."""
+    users = [
+        UserSchema(
+            work_id=row.work_id,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            email=row.email,
+            occupation=row.occupation,
+            department=row.department,
+            hospital_id=row.hospital_id,
+        )
+        for row in rows
+    ]
+    validated = response_field_adapter.validate_python(users, from_attributes=True)
+    content = jsonable_encoder(validated)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(rows: list) -> bytes:
+    return ORJSONResponse(dump_rows(user_list_adapter, rows)).body
+
+
+def measure(func, rows: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+
+    # Both paths must produce the same document
+    assert json.loads(legacy_path(rows[:10])) == json.loads(fast_path(rows[:10]))
+
+    for name, func in (("legacy", legacy_path), ("orjson+adapter", fast_path)):
+        elapsed = measure(func, rows, args.repeat)
+        print(f"{name:>16}: {elapsed * 1000:8.2f} ms total, {elapsed / args.rows * 1e6:6.2f} µs/row")
+
+
+if __name__ == "__main__":
+    main()
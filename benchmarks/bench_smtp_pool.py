@@ -0,0 +1,108 @@
+"""
+Sends a batch of OTP-style emails to a local SMTP stand-in and compares pooled connections
+against opening a new connection per email. The stand-in can drop connections to exercise reconnects.
+
+Run from the project root:
+    python -m benchmarks.bench_smtp_pool --emails 500 --pool-size 2 --drop-every 100
+"""
+import argparse
+import asyncio
+import time
+import aiosmtplib
+from services.send_email import OTP_EMAIL_TEMPLATE, SMTPConnectionPool, build_message
+
+
+class SMTPStandIn:
+    """Minimal in-process SMTP server that accepts every message and counts connections."""
+
+    def __init__(self, drop_every: int = 0):
+        self.drop_every = drop_every
+        self.connections = 0
+        self.disconnects = 0
+        self.messages = 0
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        writer.write(b"220 localhost ESMTP stand-in\r\n")
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                if command in (b"EHLO", b"HELO"):
+                    writer.write(b"250-localhost\r\n250 8BITMIME\r\n")
+                elif command == b"DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    await reader.readuntil(b"\r\n.\r\n")
+                    self.messages += 1
+                    writer.write(b"250 OK queued\r\n")
+                    if self.drop_every and self.messages % self.drop_every == 0:
+                        # Simulate the server timing out an idle connection
+                        await writer.drain()
+                        break
+                elif command == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.disconnects += 1
+            writer.close()
+
+
+def make_messages(count: int) -> list:
+    return [
+        build_message(f"user{i}@example.com", "Your OTP Code – DiagnoXis", OTP_EMAIL_TEMPLATE.render(otp_code=f"{i:06d}"))
+        for i in range(count)
+    ]
+
+
+async def run(args):
+    messages = make_messages(args.emails)
+
+    # New connection per email, as FastMail did
+    server = SMTPStandIn()
+    port = await server.start()
+    start = time.perf_counter()
+    for message in messages:
+        await aiosmtplib.send(message, hostname="127.0.0.1", port=port, start_tls=False)
+    per_email = time.perf_counter() - start
+    print(f"   per-email connect: {per_email:6.2f}s, {server.connections} connections for {server.messages} emails")
+    await server.stop()
+
+    # Pooled connections
+    server = SMTPStandIn(drop_every=args.drop_every)
+    port = await server.start()
+    pool = SMTPConnectionPool(size=args.pool_size, hostname="127.0.0.1", port=port, start_tls=False)
+    start = time.perf_counter()
+    await asyncio.gather(*(pool.send_message(message) for message in messages))
+    pooled = time.perf_counter() - start
+    await pool.close()
+    print(f"              pooled: {pooled:6.2f}s, {server.connections} connections for {server.messages} emails")
+    await server.stop()
+
+    assert server.messages == len(messages), "every email must be delivered despite dropped connections"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--drop-every", type=int, default=0, help="stand-in closes the connection after this many emails")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Chat load generator: thousands of WebSocket clients across many rooms, messages sent at a fixed
+rate over WebSocket and/or HTTP, and end-to-end delivery latency measured on every receiving client.
+
+Participants come from the ChatRoom/Participant tables (use --seed to create load-test rooms first),
+and tokens are minted locally with functions.generate_jwt_token, so the server must share the same
+DATABASE_URL and ACCESS_SECRET_KEY/ALGORITHM.
+
+Run from the project root, against a server started by the tool on fakeredis:
+    python -m benchmarks.chat_load --spawn-server --seed --rooms 200 --members 10 --rate 500 --duration 30
+
+or against an already running server (local Redis):
+    python -m benchmarks.chat_load --base-url http://127.0.0.1:8000 --rooms 200 --rate 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import httpx
+import orjson
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+LOAD_PREFIX = "LOAD"
+
+
+@dataclass
+class Stats:
+    sent: int = 0
+    send_errors: int = 0
+    connect_errors: int = 0
+    expected: int = 0
+    delivered: int = 0
+    latencies: List[float] = field(default_factory=list)
+    # client_ref -> time the message was sent
+    in_flight: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class Client:
+    room_id: str
+    token: str
+    websocket: Optional[object] = None
+
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def seed_load_rooms(rooms: int, members: int):
+    """Create a load-test hospital, staff and rooms (idempotent)."""
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+    from database import engine, init_db
+    from models import ChatRoom, Hospital, Participant, User
+
+    init_db()
+    with Session(engine) as db:
+        hospital = db.execute(select(Hospital).where(Hospital.hospital_id == f"HOSP-{LOAD_PREFIX}")).scalar()
+        if hospital is None:
+            hospital = Hospital(
+                hospital_id=f"HOSP-{LOAD_PREFIX}", name="Load Test Hospital", email="load@example.com",
+                phone_number="(000) 000-0000", location="localhost",
+            )
+            db.add(hospital)
+            db.flush()
+
+        existing_users = set(db.execute(select(User.work_id).where(User.hospital_id == hospital.id)).scalars())
+        users = []
+        for i in range(rooms * members):
+            work_id = f"EMP-{LOAD_PREFIX}-{i:06d}"
+            if work_id not in existing_users:
+                users.append(User(
+                    work_id=work_id, first_name="Load", last_name=f"User{i}", email=f"load{i}@example.com",
+                    occupation="Nurse", department=f"Ward {i % 20}", hospital_id=hospital.id,
+                ))
+        db.add_all(users)
+        db.flush()
+        user_ids = dict(db.execute(select(User.work_id, User.id).where(User.hospital_id == hospital.id)).all())
+
+        existing_rooms = set(db.execute(select(ChatRoom.id).where(ChatRoom.id.like(f"CHAT-{LOAD_PREFIX}-%"))).scalars())
+        for r in range(rooms):
+            room_id = f"CHAT-{LOAD_PREFIX}-{r:05d}"
+            if room_id in existing_rooms:
+                continue
+            db.add(ChatRoom(id=room_id, name=f"Load room {r}"))
+            db.add_all(
+                Participant(room_id=room_id, participant_id=user_ids[f"EMP-{LOAD_PREFIX}-{r * members + m:06d}"], participant_type=User.__name__)
+                for m in range(members)
+            )
+        db.commit()
+
+
+def load_clients(rooms: int, max_clients: int) -> List[Client]:
+    """One client per room participant, with a freshly minted access token."""
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+    from database import engine
+    from functions import generate_jwt_token
+    from models import ChatRoom, Hospital, Participant, User
+    from schemas.users_schema import UserSchema
+
+    with Session(engine) as db:
+        room_ids = select(ChatRoom.id).order_by(ChatRoom.id).limit(rooms).scalar_subquery()
+        rows = db.execute(
+            select(Participant.room_id, User.work_id, User.first_name, User.last_name, User.email,
+                   User.occupation, User.department, Hospital.hospital_id)
+            .join(User, (User.id == Participant.participant_id) & (Participant.participant_type == User.__name__))
+            .join(Hospital, Hospital.id == User.hospital_id)
+            .where(Participant.room_id.in_(room_ids))
+            .limit(max_clients)
+        ).all()
+
+    return [
+        Client(
+            room_id=row.room_id,
+            token=generate_jwt_token(UserSchema(
+                work_id=row.work_id, first_name=row.first_name, last_name=row.last_name, email=row.email,
+                occupation=row.occupation, department=row.department, hospital_id=row.hospital_id,
+            )),
+        )
+        for row in rows
+    ]
+
+
+async def receive_loop(client: Client, stats: Stats):
+    try:
+        async for raw in client.websocket:
+            now = time.perf_counter()
+            client_ref = orjson.loads(raw).get("client_ref")
+            sent_at = stats.in_flight.get(client_ref)
+            if sent_at is not None:
+                stats.delivered += 1
+                stats.latencies.append(now - sent_at)
+    except ConnectionClosed:
+        pass
+
+
+async def open_clients(clients: List[Client], ws_url: str, stats: Stats, concurrency: int) -> List[asyncio.Task]:
+    semaphore = asyncio.Semaphore(concurrency)
+    receivers = []
+
+    async def open_one(client: Client):
+        async with semaphore:
+            try:
+                client.websocket = await connect(
+                    f"{ws_url}/chats/ws/{client.room_id}?token={client.token}",
+                    ping_interval=None, open_timeout=30, max_queue=None,
+                )
+            except Exception:
+                stats.connect_errors += 1
+                return
+            receivers.append(asyncio.create_task(receive_loop(client, stats)))
+
+    await asyncio.gather(*(open_one(client) for client in clients))
+    return receivers
+
+
+async def send_loop(clients: List[Client], base_url: str, stats: Stats, rate: float, duration: float, http_fraction: float):
+    """Open-loop sender: messages go out on schedule whether or not earlier ones were delivered."""
+    connected = [client for client in clients if client.websocket is not None]
+    members = defaultdict(int)
+    for client in connected:
+        members[client.room_id] += 1
+
+    pending = set()
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=httpx.Limits(max_connections=200)) as http:
+
+        async def send_one(client: Client, client_ref: str, content: str):
+            try:
+                if random.random() < http_fraction:
+                    response = await http.post(
+                        f"/chats/{client.room_id}/messages",
+                        json={"content": content, "client_ref": client_ref},
+                        headers={"Authorization": f"Bearer {client.token}"},
+                    )
+                    response.raise_for_status()
+                else:
+                    await client.websocket.send(orjson.dumps({"content": content, "client_ref": client_ref}).decode())
+            except Exception:
+                stats.send_errors += 1
+                stats.expected -= members[client.room_id]
+
+        start = time.perf_counter()
+        sequence = 0
+        while (elapsed := time.perf_counter() - start) < duration:
+            due = int(elapsed * rate) + 1
+            while sequence < due:
+                client = random.choice(connected)
+                client_ref = f"load-{sequence}"
+                stats.in_flight[client_ref] = time.perf_counter()
+                stats.sent += 1
+                stats.expected += members[client.room_id]
+                task = asyncio.create_task(send_one(client, client_ref, f"load message {sequence}"))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                sequence += 1
+            await asyncio.sleep(min(0.01, 1 / rate))
+
+        await asyncio.gather(*pending)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(stats: Stats, clients: int, duration: float):
+    latencies = sorted(stats.latencies)
+    dropped = stats.expected - stats.delivered
+    print(f"clients connected : {clients - stats.connect_errors}/{clients} ({stats.connect_errors} failed)")
+    print(f"messages sent     : {stats.sent} ({stats.sent / duration:.0f}/s), {stats.send_errors} send errors")
+    print(f"deliveries        : {stats.delivered}/{stats.expected} expected, {dropped} dropped "
+          f"({dropped / stats.expected * 100 if stats.expected else 0:.2f}%)")
+    for pct in (50, 90, 99, 99.9):
+        print(f"{'latency p' + str(pct):<18}: {percentile(latencies, pct) * 1000:8.2f} ms")
+    print(f"latency max       : {(latencies[-1] if latencies else float('nan')) * 1000:8.2f} ms")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while time.monotonic() < deadline:
+            try:
+                await http.get("/openapi.json")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+async def run(args):
+    raise_file_limit()
+    server = None
+    base_url = args.base_url
+
+    if args.seed:
+        seed_load_rooms(args.rooms, args.members)
+
+    if args.spawn_server:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        # A single worker, so the in-process fakeredis is shared by every connection
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            env={**os.environ, "REDIS_URL": os.environ.get("REDIS_URL", "fakeredis://")},
+        )
+
+    try:
+        await wait_for_server(base_url)
+        clients = load_clients(args.rooms, args.clients)
+        if not clients:
+            raise SystemExit("No room participants found, run with --seed to create load-test rooms")
+
+        stats = Stats()
+        ws_url = base_url.replace("http", "ws", 1)
+        started = time.perf_counter()
+        receivers = await open_clients(clients, ws_url, stats, args.connect_concurrency)
+        print(f"opened {len(receivers)} WebSockets in {time.perf_counter() - started:.1f}s")
+
+        await send_loop(clients, base_url, stats, args.rate, args.duration, args.http_fraction)
+        # Let in-flight messages arrive before counting what was dropped
+        await asyncio.sleep(args.drain)
+
+        for client in clients:
+            if client.websocket is not None:
+                await client.websocket.close()
+        for task in receivers:
+            task.cancel()
+
+        report(stats, len(clients), args.duration)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn-server", action="store_true", help="start uvicorn for the duration of the run (fakeredis unless REDIS_URL is set)")
+    parser.add_argument("--seed", action="store_true", help="create load-test rooms and participants first")
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--members", type=int, default=10, help="participants per seeded room")
+    parser.add_argument("--clients", type=int, default=5000, help="maximum WebSocket clients to open")
+    parser.add_argument("--rate", type=float, default=200, help="messages per second across all rooms")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to send for")
+    parser.add_argument("--http-fraction", type=float, default=0.0, help="share of messages sent over HTTP instead of WebSocket")
+    parser.add_argument("--drain", type=float, default=5, help="seconds to wait for deliveries after sending stops")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,336 @@
-from fastapi import APIRouter
+import asyncio
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from functions import admin_dependency, authenticate_user_ws, bearer_hospital_id, db_dependency, read_db_dependency, user_dependency
+from models import ChatMessage, ChatRoom, Hospital, MessageSender, Participant, User, create_chat_id
+from schemas.chats_schema import (
+    BulkParticipantResultSchema,
+    BulkParticipantSchema,
+    BulkRoomCreateResultSchema,
+    BulkRoomCreateSchema,
+    ChatMessageSchema,
+    MessageCreateSchema,
+    RoomMessageSchema,
+)
+from services.chat_hub import chat_hub
+from services.exports import MEDIA_TYPES, ExportFormat, stream_messages
+from services.logger import logger
+from services.memberships import member_ref, membership_index, record_memberships, session_shard
+from services.notifications import digest_notifier, presence
+from services.read_models import is_room_participant, list_room_messages
+from services.serializers import ORJSONResponse, dump_rows, room_message_list_adapter
+from services.sharding import tenant_router
+from services.sync import participant_key, record_changes
+from sqlalchemy import Engine, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 
 router = APIRouter(
     prefix="/chats",
     tags=['Chats']
-)
\ No newline at end of file
+)
+
+PARTICIPANT_TYPE_USER = User.__name__
+
+
+def resolve_hospital_users(db: Session, hospital_id: str, work_ids: Iterable[str]) -> Dict[str, int]:
+    """
+    Map work_ids to User.id in a single IN query, limited to staff of the given hospital.
+    Raises a 400 listing every work_id that could not be resolved.
+    """
+    work_ids = set(work_ids)
+    if not work_ids:
+        return {}
+
+    rows = db.execute(
+        select(User.work_id, User.id)
+        .join(User.hospital)
+        .where(Hospital.hospital_id == hospital_id, User.work_id.in_(work_ids))
+    ).all()
+    users = {work_id: user_id for work_id, user_id in rows}
+
+    missing = sorted(work_ids - users.keys())
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Unknown users for this hospital", "work_ids": missing},
+        )
+    return users
+
+
+def save_message(engine: Engine, room_id: str, sender_id: int, content: str) -> dict:
+    """Persist a message with its sender in a short-lived session and return its published form."""
+    with Session(engine) as db:
+        message = ChatMessage(room_id=room_id, content=content)
+        message.sender_association = MessageSender(sender_id=sender_id, sender_type=PARTICIPANT_TYPE_USER)
+        db.add(message)
+        db.flush()
+
+        payload = {
+            "id": message.id,
+            "room_id": room_id,
+            "content": content,
+            "timestamp": message.timestamp,
+            "sender": {"id": sender_id, "type": PARTICIPANT_TYPE_USER},
+        }
+        db.commit()
+    return payload
+
+
+def check_room_member(db: Session, room_id: str, user_id: int) -> bool:
+    """SISMEMBER against the Redis membership index, the participants table while it is not built."""
+    is_member = membership_index.is_member(room_id, member_ref(session_shard(db), PARTICIPANT_TYPE_USER, user_id))
+    if is_member is None:
+        is_member = is_room_participant(db, room_id, user_id)
+    return is_member
+
+
+def authorize_room_member(db: Session, room_id: str, work_id: str) -> int:
+    """Return the caller's User.id, or raise a 403 unless they take part in the room."""
+    user_id = membership_index.user_id(db, work_id)
+    if user_id is None or not check_room_member(db, room_id, user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a participant of this room")
+    return user_id
+
+
+def authenticate_room_member(engine: Engine, token: str, room_id: str) -> Optional[User]:
+    """Resolve the token's user and check they take part in the room, without holding a connection afterwards."""
+    with Session(engine) as db:
+        user = authenticate_user_ws(token, db)
+        if user is None or not check_room_member(db, room_id, user.id):
+            return None
+        db.expunge(user)
+        return user
+
+
+def insert_participants(db: Session, memberships: Iterable[tuple]) -> int:
+    """
+    Multi-row insert of (room_id, user_id) memberships.
+    Rows already present are skipped by the unique constraint; returns how many were inserted.
+    The inserted rows reach the Redis membership index and the change log once the session commits.
+    """
+    now = datetime.now()
+    rows = [
+        {"room_id": room_id, "participant_id": user_id, "participant_type": PARTICIPANT_TYPE_USER, "joined_at": now}
+        for room_id, user_id in memberships
+    ]
+    if not rows:
+        return 0
+
+    stmt = (
+        insert(Participant)
+        .on_conflict_do_nothing(constraint="uq_participants_room_member")
+        .returning(Participant.room_id, Participant.participant_id)
+    )
+    # A list of parameter sets is sent as batched multi-row VALUES (insertmanyvalues)
+    inserted = db.execute(stmt, rows).all()
+    shard = session_shard(db)
+    record_memberships(db, ((room_id, member_ref(shard, PARTICIPANT_TYPE_USER, user_id)) for room_id, user_id in inserted))
+    record_changes(db, (
+        ("participant", participant_key(room_id, PARTICIPANT_TYPE_USER, user_id), room_id)
+        for room_id, user_id in inserted
+    ))
+    return len(inserted)
+
+
+@router.post("/rooms/bulk", response_model=BulkRoomCreateResultSchema)
+async def create_rooms_bulk(request: BulkRoomCreateSchema, db: db_dependency, current_user: user_dependency):
+    """
+    Create many chat rooms with their participants in one transaction.
+    Rooms whose name already exists are kept and only receive the missing participants, provided
+    the caller takes part in them: names are unique across hospitals, so otherwise it is a 403.
+    """
+    rooms: Dict[str, set] = {}
+    for room in request.rooms:
+        rooms.setdefault(room.name, set()).update(room.participants)
+    users = resolve_hospital_users(db, current_user.hospital_id, set().union(*rooms.values()))
+
+    existing = dict(db.execute(select(ChatRoom.name, ChatRoom.id).where(ChatRoom.name.in_(rooms))).all())
+    for room_id in existing.values():
+        authorize_room_member(db, room_id, current_user.work_id)
+
+    now = datetime.now()
+    new_rooms = [{"id": create_chat_id(), "name": name, "created_at": now} for name in rooms if name not in existing]
+    created = []
+    if new_rooms:
+        created = db.execute(
+            insert(ChatRoom)
+            .on_conflict_do_nothing(index_elements=[ChatRoom.name])
+            .returning(ChatRoom.id),
+            new_rooms,
+        ).all()
+    record_changes(db, (("chat", room_id, room_id) for room_id, in created))
+
+    room_ids = dict(db.execute(select(ChatRoom.name, ChatRoom.id).where(ChatRoom.name.in_(rooms))).all())
+    created_ids = {room_id for room_id, in created}
+    for name, room_id in room_ids.items():
+        # Created by a concurrent request since the check above; the transaction rolls back on a 403
+        if name not in existing and room_id not in created_ids:
+            authorize_room_member(db, room_id, current_user.work_id)
+
+    added = insert_participants(
+        db,
+        ((room_ids[name], users[work_id]) for name, work_ids in rooms.items() for work_id in work_ids),
+    )
+    db.commit()
+
+    logger.info(f"{current_user.work_id} bulk created {len(created)} rooms with {added} participants")
+    return {
+        "created_rooms": len(created),
+        "existing_rooms": len(rooms) - len(created),
+        "participants_added": added,
+        "rooms": [{"room_id": room_ids[name], "room_name": name} for name in rooms],
+    }
+
+
+@router.post("/{room_id}/participants/bulk", response_model=BulkParticipantResultSchema)
+async def add_participants_bulk(room_id: str, request: BulkParticipantSchema, db: db_dependency, current_user: user_dependency):
+    """Add many staff members to an existing room the caller takes part in, skipping those already in it."""
+    if db.execute(select(ChatRoom.id).where(ChatRoom.id == room_id)).first() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found")
+    authorize_room_member(db, room_id, current_user.work_id)
+
+    users = resolve_hospital_users(db, current_user.hospital_id, request.work_ids)
+    added = insert_participants(db, ((room_id, user_id) for user_id in users.values()))
+    db.commit()
+
+    logger.info(f"{current_user.work_id} added {added} participants to {room_id}")
+    return {"room_id": room_id, "participants_added": added, "already_present": len(users) - added}
+
+
+@router.post("/{room_id}/messages", response_model=ChatMessageSchema)
+async def send_message(room_id: str, request: MessageCreateSchema, db: db_dependency, current_user: user_dependency):
+    """Send a message over HTTP; it is delivered to the room's WebSocket members like any other."""
+    # Served from Redis once the membership index and the work_id mapping are warm, the session stays unused
+    user_id = authorize_room_member(db, room_id, current_user.work_id)
+    # The tenant's shard, the message is written on its own short-lived session
+    engine = db.get_bind()
+    db.close()
+
+    payload = await run_in_threadpool(save_message, engine, room_id, user_id, request.content)
+    payload["client_ref"] = request.client_ref
+    await chat_hub.publish(room_id, payload)
+    digest_notifier.schedule(room_id, payload, tenant_router.shard_of(engine))
+    return payload
+
+
+@router.get("/{room_id}/messages", response_model=List[RoomMessageSchema], response_class=ORJSONResponse)
+async def get_room_messages(
+    room_id: str,
+    db: read_db_dependency,
+    current_user: user_dependency,
+    before: Optional[datetime] = None,
+    before_id: Optional[UUID] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Room history, newest first. Pass the timestamp and id of the oldest message received as
+    `before` and `before_id` to page back.
+    """
+    authorize_room_member(db, room_id, current_user.work_id)
+
+    rows = list_room_messages(db, room_id, before, limit, before_id=before_id)
+    return ORJSONResponse(dump_rows(room_message_list_adapter, rows))
+
+
+@router.websocket("/ws/{room_id}")
+async def chat_websocket(websocket: WebSocket, room_id: str, token: str):
+    """
+    Live chat for one room. Clients send {"content": ..., "client_ref": ...} and receive every
+    message published to the room, their own included.
+    """
+    hospital_id = bearer_hospital_id(f"Bearer {token}")
+    engine = await run_in_threadpool(tenant_router.engine_for, hospital_id)
+    user = await run_in_threadpool(authenticate_room_member, engine, token, room_id)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    queue = await chat_hub.join(room_id)
+    # Connected members are left out of email digests
+    shard = tenant_router.shard_of(engine)
+    member = member_ref(shard, PARTICIPANT_TYPE_USER, user.id)
+    await presence.connect(member)
+
+    async def forward_messages():
+        while True:
+            await websocket.send_text(await queue.get())
+
+    forwarder = asyncio.create_task(forward_messages())
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                # A bad frame only gets an error back, the connection stays open
+                await websocket.send_json({"error": 'Expected a JSON object like {"content": "..."}'})
+                continue
+            content = str(data.get("content") or "").strip()
+            if not content:
+                continue
+            if tenant_router.route(hospital_id)[1]:
+                # The hospital is being moved to another shard, the client reconnects once it is done
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                break
+            payload = await run_in_threadpool(save_message, engine, room_id, user.id, content)
+            payload["client_ref"] = data.get("client_ref")
+            await chat_hub.publish(room_id, payload)
+            digest_notifier.schedule(room_id, payload, shard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        await chat_hub.leave(room_id, queue)
+        await presence.disconnect(member)
+
+
+@router.get("/export")
+async def export_chat_history(
+    current_admin: admin_dependency,
+    hospital_id: str,
+    room_id: Optional[str] = None,
+    export_format: ExportFormat = "ndjson",
+    gzip: bool = False,
+):
+    """
+    Compliance export, admins only: stream the full message history of one room of the hospital,
+    or of every room of the hospital when no room is given, as NDJSON or CSV.
+    """
+    if room_id is not None:
+        # Only rooms with at least one participant from the hospital can be exported under it
+        with tenant_router.session(hospital_id, write=False) as db:
+            room = db.execute(
+                select(Participant.room_id)
+                .join(User, (User.id == Participant.participant_id) & (Participant.participant_type == PARTICIPANT_TYPE_USER))
+                .join(User.hospital)
+                .where(Participant.room_id == room_id, Hospital.hospital_id == hospital_id)
+                .limit(1)
+            ).first()
+        if room is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found")
+
+    scope = room_id or hospital_id
+    filename = f"chats-{scope}.{export_format}" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    logger.info(f"Admin {current_admin.username} exporting chat history for {scope} as {export_format}")
+    # The generator opens its own connection, so the export outlives the request
+    return StreamingResponse(
+        stream_messages(
+            tenant_router.read_engine_for(hospital_id),
+            room_id=room_id,
+            hospital_id=None if room_id else hospital_id,
+            export_format=export_format,
+            compress=gzip,
+        ),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[export_format],
+        headers=headers,
+    )
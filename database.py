@@ -1,19 +1,87 @@
 import os
+import time
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
 from models import Base
+from services.logger import logger
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read-only replica; read traffic falls back to the primary when unset or unreachable
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+READ_DB_STATEMENT_TIMEOUT_MS = int(os.getenv("READ_DB_STATEMENT_TIMEOUT_MS", DB_STATEMENT_TIMEOUT_MS))
+# How long to route reads to the primary after the replica failed to hand out a connection
+READ_REPLICA_RETRY_SECONDS = int(os.getenv("READ_REPLICA_RETRY_SECONDS", 30))
+
+
+def build_engine(url: str, statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS):
+    """Create an engine with the pool settings taken from the environment."""
+    connect_args = {}
+    if make_url(url).get_backend_name() == "postgresql" and statement_timeout_ms > 0:
+        # Applied per connection so runaway queries cannot hold a pooled connection forever
+        connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
 
 # engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-engine = create_engine(DATABASE_URL)
+engine = build_engine(DATABASE_URL)
+
+read_engine = (
+    build_engine(READ_DATABASE_URL, READ_DB_STATEMENT_TIMEOUT_MS)
+    if READ_DATABASE_URL and READ_DATABASE_URL != DATABASE_URL
+    else engine
+)
+
+_replica_down_until = 0.0
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def get_read_session():
+    """
+    Yield a session bound to the read replica.
+    Falls back to the primary when no replica is configured or it cannot hand out a connection.
+    """
+    global _replica_down_until
+
+    if read_engine is not engine and time.monotonic() >= _replica_down_until:
+        session = Session(read_engine)
+        try:
+            # Check out the connection up front so an unreachable replica is detected here,
+            # the same connection is then reused for the request's queries
+            session.connection()
+        except DBAPIError as e:
+            session.close()
+            _replica_down_until = time.monotonic() + READ_REPLICA_RETRY_SECONDS
+            logger.warning(f"Read replica unavailable, falling back to primary: {e}")
+        else:
+            with session:
+                yield session
+            return
+
+    with Session(engine) as session:
+        yield session
@@ -4,13 +4,16 @@ import os
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from pydantic import BaseModel
-from database import get_session
-from fastapi import Depends, HTTPException, status
-from typing import Annotated, Literal, Type
+from database import get_read_session, get_session
+from fastapi import Depends, HTTPException, Request, status
+from typing import Annotated, Literal, Optional, Type
 from sqlalchemy.orm import Session
 from models import Base, User
+from schemas.admins_schema import AdminSchema
 from schemas.users_schema import UserSchema
+from services.dataloader import Loaders
 from services.logger import logger
+from services.sharding import DEFAULT_SHARD, SHARD_ROUTE_TTL, tenant_router
 import random
 import string
 
@@ -19,9 +22,10 @@ ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_SECRET_KEY = os.getenv("ACCESS_SECRET_KEY")
 REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY")
 
-db_dependency = Annotated[Session, Depends(get_session)]
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
 def otp_generator():
     return ''.join(random.choices(string.digits, k=6))
 
@@ -73,6 +77,59 @@ def decode_jwt_token(token: str, model: type[BaseModel], token_type: Literal["ac
     except Exception as e:
         raise jwt.InvalidTokenError(f"Invalid token: {str(e)}")
     
+def bearer_hospital_id(authorization: Optional[str]) -> Optional[str]:
+    """Hospital of a user access token; None for admin, missing or invalid tokens."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_jwt_token(token, UserSchema).hospital_id
+    except jwt.InvalidTokenError:
+        return None
+
+def tenant_shard(request: Request) -> str:
+    """Shard of the caller's hospital; refuses writes while the hospital is being moved."""
+    shard, read_only = tenant_router.route(bearer_hospital_id(request.headers.get("authorization")))
+    if read_only and request.method not in SAFE_METHODS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hospital data is being migrated, please retry shortly",
+            headers={"Retry-After": str(int(SHARD_ROUTE_TTL))},
+        )
+    return shard
+
+def get_tenant_session(request: Request):
+    """Session on the shard holding the caller's hospital, taken from the access token."""
+    if not tenant_router.sharded:
+        yield from get_session()
+        return
+    with Session(tenant_router.engines[tenant_shard(request)]) as session:
+        yield session
+
+def get_tenant_read_session(request: Request):
+    """Read session for the caller's hospital: the replica on the default shard, the shard itself elsewhere."""
+    if not tenant_router.sharded:
+        yield from get_read_session()
+        return
+    shard, _ = tenant_router.route(bearer_hospital_id(request.headers.get("authorization")))
+    if shard == DEFAULT_SHARD:
+        yield from get_read_session()
+        return
+    with Session(tenant_router.engines[shard]) as session:
+        yield session
+
+db_dependency = Annotated[Session, Depends(get_tenant_session)]
+read_db_dependency = Annotated[Session, Depends(get_tenant_read_session)]
+
+def get_loaders(db: db_dependency, hospitals_db: Session = Depends(get_session)) -> Loaders:
+    """
+    Batching loaders shared by everything resolved for one request, on the request's session.
+    Hospitals are read from the default shard; the session only connects if one is loaded.
+    """
+    return Loaders(db, hospitals_db)
+
+loaders_dependency = Annotated[Loaders, Depends(get_loaders)]
+
 def get_current_user(model: type[BaseModel]):
     async def dependency(token: str = Depends(oauth2_scheme)):
         try:
@@ -124,4 +181,5 @@ def authenticate_user(model: Type[BaseModel], table: Type[Base]):
     return authenticate_websocket_token
 
 authenticate_user_ws = authenticate_user(UserSchema, User)
-user_dependency = Annotated[UserSchema, Depends(get_current_user(UserSchema))]
\ No newline at end of file
+user_dependency = Annotated[UserSchema, Depends(get_current_user(UserSchema))]
+admin_dependency = Annotated[AdminSchema, Depends(get_current_user(AdminSchema))]
\ No newline at end of file
@@ -1,15 +1,32 @@
 from typing import List
 from fastapi import APIRouter
-from functions import db_dependency
-from models import Hospital
-from schemas.hospitals_schema import HospitalBase
+from functions import loaders_dependency
+from schemas.hospitals_schema import HospitalBase, HospitalBatchResultSchema, HospitalBatchSchema
+from services.cache import cached, fenced_read_session
+from services.read_models import list_hospitals
+from services.serializers import ORJSONResponse, dump_rows, hospital_list_adapter
 
 router = APIRouter(
     prefix="/hospital",
     tags=['Hospitals']
 )
 
-@router.get("/", response_model=List[HospitalBase])
-async def get_hospital(db: db_dependency):
-    hospitals = db.query(Hospital).all()
-    return hospitals
\ No newline at end of file
+@router.get("/", response_model=List[HospitalBase], response_class=ORJSONResponse)
+@cached("hospital:*")
+async def get_hospital():
+    # Every hospital row is kept on the default shard, so the cached listing is the same for every tenant.
+    # Misses read the replica once it has caught up with the last invalidating commit, the primary before that.
+    # Column projection serialized straight to bytes, no ORM entities are built
+    with fenced_read_session() as db:
+        return ORJSONResponse(dump_rows(hospital_list_adapter, list_hospitals(db)))
+
+
+@router.post("/batch", response_model=HospitalBatchResultSchema, response_class=ORJSONResponse)
+async def get_hospitals_batch(request: HospitalBatchSchema, loaders: loaders_dependency):
+    """Resolve many readable hospital_ids in one query; unknown ids are listed in `missing`."""
+    hospital_ids = list(dict.fromkeys(request.hospital_ids))
+    hospitals = await loaders.hospitals.load_many(hospital_ids)
+    return ORJSONResponse({
+        "hospitals": [hospital for hospital in hospitals if hospital is not None],
+        "missing": [hospital_id for hospital_id, hospital in zip(hospital_ids, hospitals) if hospital is None],
+    })
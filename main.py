@@ -3,8 +3,22 @@ from database import init_db
 from users import users_router
 from chats import chat_router
 from hospitals import hospital_router
+from admins import admin_router
+from sync import sync_router
 from contextlib import asynccontextmanager
+import asyncio
 from services.dummy_data import generate_data
+from services.send_email import smtp_pool
+from services.chat_hub import chat_hub
+from services.compression import CompressionMiddleware
+from services.load_shedding import LoadSheddingMiddleware
+from services.profiling import ProfilingMiddleware
+from services.partitions import ensure_message_partitions, run_partition_maintenance
+from services.rollups import run_rollup_refresher
+from services.sharding import tenant_router
+from services.sync import run_change_log_pruner
+from services.memberships import membership_index
+from services.notifications import digest_notifier, presence
 from sqlalchemy.orm import Session
 from database import engine
 from fastapi.middleware.cors import CORSMiddleware
@@ -14,6 +28,8 @@ async def lifespan(app: FastAPI):
     try:
         print("Initializing the Database")
         init_db()
+        ensure_message_partitions(engine)
+        tenant_router.init_shards()
         print("Database Initialized")
 
         with Session(engine) as db:
@@ -22,10 +38,35 @@ async def lifespan(app: FastAPI):
         print(f"Error creating database tables: {e}")
         raise
     
+    shard_engines = list(tenant_router.engines.values())
+    background_tasks = [
+        *(asyncio.create_task(run_partition_maintenance(shard_engine)) for shard_engine in shard_engines),
+        *(asyncio.create_task(run_rollup_refresher(shard_engine)) for shard_engine in shard_engines),
+        *(asyncio.create_task(run_change_log_pruner(shard_engine)) for shard_engine in shard_engines),
+        # Chat authorization uses the participants table until the Redis membership index is loaded
+        asyncio.create_task(asyncio.to_thread(membership_index.ensure_built, *shard_engines)),
+        asyncio.create_task(presence.run_heartbeat()),
+        asyncio.create_task(digest_notifier.run()),
+    ]
+
     yield
 
+    for task in background_tasks:
+        task.cancel()
+
+    # Close the pooled SMTP connections and the chat pub/sub connection cleanly on shutdown
+    await smtp_pool.close()
+    await chat_hub.close()
+
 app = FastAPI(lifespan=lifespan)
 
+# Innermost, so a profile covers the request's own work and not its wait for a concurrency slot
+app.add_middleware(ProfilingMiddleware)
+# Added before CORS so shed responses still carry the CORS headers
+app.add_middleware(LoadSheddingMiddleware)
+# Outside the load shedder, compression time does not count towards a route class's latency
+app.add_middleware(CompressionMiddleware)
+
 origins = [
     "http://localhost:3000"
 ]
@@ -40,4 +81,6 @@ app.add_middleware(
 
 app.include_router(users_router)
 app.include_router(hospital_router)
-app.include_router(chat_router)
\ No newline at end of file
+app.include_router(chat_router)
+app.include_router(admin_router)
+app.include_router(sync_router)
\ No newline at end of file
@@ -1,14 +1,45 @@
-from datetime import datetime
+from datetime import date, datetime
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import DateTime, Integer, String, ForeignKey, func, select
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Index, Integer, String, ForeignKey, UniqueConstraint, Uuid, func, select
 from sqlalchemy.ext.hybrid import hybrid_property
 from typing import List
+import os
+import threading
+import time
 import uuid
 
 
 class Base(DeclarativeBase):
     pass
 
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_seq = 0
+
+def uuid7() -> uuid.UUID:
+    """
+    RFC 9562 UUIDv7: a 48-bit millisecond timestamp, a 12-bit counter for ids created in the same
+    millisecond, then random bits. Ids sort by creation time, so primary key inserts stay append-only.
+    """
+    global _uuid7_last_ms, _uuid7_seq
+
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _uuid7_last_ms:
+            _uuid7_last_ms = ms
+            # Start the counter in the lower half to leave room for more ids in this millisecond
+            _uuid7_seq = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            _uuid7_seq += 1
+            if _uuid7_seq > 0xFFF:
+                # Counter exhausted, borrow the next millisecond to stay monotonic
+                _uuid7_last_ms += 1
+                _uuid7_seq = 0
+        ms, seq = _uuid7_last_ms, _uuid7_seq
+
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (seq << 64) | (0b10 << 62) | rand_b)
+
 def create_hospital_id() -> str:
     prefix = "HOSP"
     uuid_str = str(uuid.uuid4()).replace("-", "")[:8].upper()
@@ -103,32 +134,56 @@ class ChatRoom(Base):
 
 class ChatMessage(Base):
     __tablename__ = "messages"
-
-    id: Mapped[str] = mapped_column(String, primary_key=True, unique=True, default=lambda: str(uuid.uuid4()))
+    __table_args__ = (
+        # Latest message per room (inbox) and (timestamp, id)-ordered history pages
+        Index("ix_messages_room_id_timestamp", "room_id", "timestamp"),
+        # The analytics rollups fold messages in (timestamp, id) order
+        Index("ix_messages_timestamp_id", "timestamp", "id"),
+        # Monthly range partitions are managed by services.partitions
+        {"postgresql_partition_by": 'RANGE ("timestamp")'},
+    )
+
+    # The partition key has to be part of the primary key of a partitioned table
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid7)
     content: Mapped[str] = mapped_column(String, nullable=False)
-    timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.now)
 
     room_id: Mapped[str] = mapped_column(String, ForeignKey("chats.id"))
     room: Mapped["ChatRoom"] = relationship(back_populates="messages")
 
-    sender_association: Mapped["MessageSender"] = relationship("MessageSender", back_populates="message", uselist=False)
+    # No database foreign key can point at messages.id alone once the table is partitioned,
+    # so the join is declared here and deletes cascade through the ORM
+    sender_association: Mapped["MessageSender"] = relationship(
+        "MessageSender",
+        back_populates="message",
+        uselist=False,
+        primaryjoin="ChatMessage.id == foreign(MessageSender.message_id)",
+        cascade="all, delete-orphan",
+    )
 
 
 class MessageSender(Base):
     __tablename__ = "message_senders"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    message_id: Mapped[str] = mapped_column(String, ForeignKey("messages.id", ondelete="CASCADE"))
+    message_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False, index=True)
     sender_id: Mapped[int] = mapped_column(Integer, nullable=False)
     sender_type: Mapped[str] = mapped_column(String, nullable=False)
 
-    message: Mapped["ChatMessage"] = relationship("ChatMessage", back_populates="sender_association")
+    message: Mapped["ChatMessage"] = relationship(
+        "ChatMessage",
+        back_populates="sender_association",
+        primaryjoin="ChatMessage.id == foreign(MessageSender.message_id)",
+    )
 
     def __repr__(self):
         return f"MessageSender(type={self.sender_type}, sender_id={self.sender_id})"
     
 class Participant(Base):
     __tablename__ = "participants"
+    __table_args__ = (
+        UniqueConstraint("room_id", "participant_id", "participant_type", name="uq_participants_room_member"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     room_id: Mapped[str] = mapped_column(String, ForeignKey("chats.id", ondelete="CASCADE"))
@@ -140,3 +195,62 @@ class Participant(Base):
 
     def __repr__(self):
         return f"Participant(type={self.participant_type}, participant_id={self.participant_id}, room_id={self.room_id})"
+
+
+class UserDailyActivity(Base):
+    """Rollup: messages sent per user per day, maintained by services.rollups."""
+    __tablename__ = "user_daily_activity"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    hospital_id: Mapped[int] = mapped_column(Integer, ForeignKey("hospitals.id", ondelete="CASCADE"), nullable=False)
+    department: Mapped[str] = mapped_column(String, nullable=False)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class DepartmentDailyStats(Base):
+    """Rollup: messages and distinct active users per hospital department per day, maintained by services.rollups."""
+    __tablename__ = "department_daily_stats"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    hospital_id: Mapped[int] = mapped_column(Integer, ForeignKey("hospitals.id", ondelete="CASCADE"), primary_key=True)
+    department: Mapped[str] = mapped_column(String, primary_key=True)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    active_users: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class RollupWatermark(Base):
+    """(timestamp, id) of the last message folded into the rollups, so each refresh only reads newer messages."""
+    __tablename__ = "rollup_watermarks"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    last_message_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False)
+    last_timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class HospitalShard(Base):
+    """Tenant routing: the database shard holding a hospital's users and chat data, kept on the default database."""
+    __tablename__ = "hospital_shards"
+
+    hospital_id: Mapped[str] = mapped_column(String, primary_key=True)
+    shard: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    # Set while the hospital is being moved, writes are refused until the move completes
+    read_only: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class ChangeLogEntry(Base):
+    """Delta sync feed: one row per committed change to a synced entity, appended by services.sync."""
+    __tablename__ = "change_log"
+
+    # Sync cursors on SQLite, which commits one writer at a time
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    # Writing transaction on Postgres; cursors follow these, up to the oldest transaction still running
+    xact_id: Mapped[int] = mapped_column(BigInteger, nullable=True, index=True)
+    entity: Mapped[str] = mapped_column(String, nullable=False)
+    entity_key: Mapped[str] = mapped_column(String, nullable=False)
+    deleted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    # Set for chat-scoped entities, so a client only receives the rooms it takes part in
+    room_id: Mapped[str] = mapped_column(String, nullable=True)
+    changed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now, index=True)
@@ -0,0 +1,40 @@
+from datetime import date
+from typing import List, Optional
+from pydantic import BaseModel
+
+class AdminSchema(BaseModel):
+    admin_id: str
+    username: str
+    email: str
+
+    class Config:
+        from_attributes = True
+
+class AdminLoginSchema(BaseModel):
+    username: str
+    email: str
+
+class AdminSchemaWithTokens(BaseModel):
+    access_token: str
+    refresh_token: str
+    admin_details: AdminSchema
+
+class StaffImportErrorSchema(BaseModel):
+    line: int
+    work_id: Optional[str] = None
+    error: str
+
+class StaffImportResultSchema(BaseModel):
+    total_rows: int
+    imported: int
+    inserted: int
+    updated: int
+    error_count: int
+    errors: List[StaffImportErrorSchema]
+
+class DailyActivitySchema(BaseModel):
+    day: date
+    hospital_id: str
+    department: Optional[str] = None
+    message_count: int
+    active_users: int
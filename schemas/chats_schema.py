@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+class BulkRoomSchema(BaseModel):
+    name: str
+    participants: List[str] = []  # work_ids of the staff to add
+
+class BulkRoomCreateSchema(BaseModel):
+    rooms: List[BulkRoomSchema] = Field(min_length=1)
+
+class BulkParticipantSchema(BaseModel):
+    work_ids: List[str] = Field(min_length=1)
+
+class RoomSummarySchema(BaseModel):
+    room_id: str
+    room_name: str
+
+class BulkRoomCreateResultSchema(BaseModel):
+    created_rooms: int
+    existing_rooms: int
+    participants_added: int
+    rooms: List[RoomSummarySchema]
+
+class BulkParticipantResultSchema(BaseModel):
+    room_id: str
+    participants_added: int
+    already_present: int
+
+class MessageCreateSchema(BaseModel):
+    content: str = Field(min_length=1)
+    client_ref: Optional[str] = None  # echoed back to the sender's clients to match deliveries
+
+class MessageSenderSchema(BaseModel):
+    id: int
+    type: str
+
+class ChatMessageSchema(BaseModel):
+    id: UUID
+    room_id: str
+    content: str
+    timestamp: datetime
+    sender: MessageSenderSchema
+    client_ref: Optional[str] = None
+
+class RoomMessageSchema(BaseModel):
+    id: UUID
+    content: str
+    timestamp: datetime
+    sender_id: Optional[int] = None
+    sender_type: Optional[str] = None
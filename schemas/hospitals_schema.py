@@ -1,8 +1,16 @@
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, Field
 
 class HospitalBase(BaseModel):
     hospital_id: str
     name: str
     email: str
     phone_number: str
-    location: str
\ No newline at end of file
+    location: str
+
+class HospitalBatchSchema(BaseModel):
+    hospital_ids: List[str] = Field(min_length=1, max_length=500)
+
+class HospitalBatchResultSchema(BaseModel):
+    hospitals: List[HospitalBase]
+    missing: List[str]
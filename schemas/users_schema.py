@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, Field
 
 class UserBaseSchema(BaseModel):
     work_id: str
@@ -35,4 +36,14 @@ class OTPResendSchema(BaseModel):
 class UserSchemaWithTokens(BaseModel):
     access_token: str
     refresh_token: str
-    user_details: UserSchema
\ No newline at end of file
+    user_details: UserSchema
+
+class UserBatchSchema(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=500)  # User.id, as in participant_id/sender_id
+
+class UserWithIdSchema(UserSchema):
+    id: int
+
+class UserBatchResultSchema(BaseModel):
+    users: List[UserWithIdSchema]
+    missing: List[int]
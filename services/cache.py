@@ -0,0 +1,318 @@
+"""
+Redis cache for serialized endpoint results, invalidated by tag when a transaction commits.
+
+Every tag has a version counter in Redis and cached entries are stored under the versions of their
+tags at the time they were read. A commit touching a tagged model bumps the versions, so later reads
+miss and recompute; entries filled from data read before the commit land under the old versions and
+are never served.
+
+Fills may read the replica (fenced_read_session): before the versions are bumped the primary's WAL
+position is recorded as the fence, and a fill only reads the replica once it has replayed past it,
+so rows from before the commit are never stored under the new versions.
+"""
+import asyncio
+import functools
+import hashlib
+import os
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, Optional, Sequence, Set
+from dotenv import load_dotenv
+from fastapi import Response
+from redis.exceptions import RedisError
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from database import engine, get_read_session, read_engine
+from models import Hospital, User
+from services.logger import logger
+from services.redis_client import get_async_redis_client, get_redis_client
+from services.serializers import ORJSONResponse
+
+load_dotenv()
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+# How long a single-flight lock is held at most, and how long other callers wait on it
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 10))
+CACHE_LOCK_POLL = 0.02
+
+TAG_PREFIX = "cache:tag:"
+# Entries hold the raw response bytes (earlier entries were latin-1 text under "cache:entry:")
+ENTRY_PREFIX = "cache:body:"
+LOCK_PREFIX = "cache:lock:"
+FENCE_KEY = "cache:fence"
+
+# The fence only moves forward, workers may record their positions out of order
+SET_FENCE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tonumber(ARGV[1]) > current then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+"""
+# WAL positions as byte offsets, comparable as numbers
+PRIMARY_WAL_POSITION_SQL = text("SELECT pg_current_wal_lsn() - '0/0'::pg_lsn")
+REPLAYED_WAL_POSITION_SQL = text("SELECT pg_last_wal_replay_lsn() - '0/0'::pg_lsn")
+
+
+def _user_tags(user: User) -> Set[str]:
+    return {"user:*"}
+
+
+def _hospital_tags(hospital: Hospital) -> Set[str]:
+    # The users listing embeds the readable hospital_id, so hospital changes reach it too
+    return {"hospital:*", "user:*"}
+
+
+# Tags invalidated by a committed change to one row of each model
+ROW_TAGS: Dict[type, Callable] = {
+    User: _user_tags,
+    Hospital: _hospital_tags,
+}
+# Tag families invalidated by bulk INSERT/UPDATE/DELETE statements, where the rows are not known
+STATEMENT_TAG_FAMILIES: Dict[type, Set[str]] = {
+    User: {"user"},
+    Hospital: {"hospital", "user"},
+}
+
+
+class CacheStats:
+    """Per-worker counters for each cached endpoint; waits are misses served by another caller's fill."""
+
+    def __init__(self):
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0, "waits": 0, "errors": 0})
+
+    def record(self, name: str, outcome: str):
+        self.counters[name][outcome] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        result = {}
+        for name, counts in self.counters.items():
+            lookups = counts["hits"] + counts["misses"]
+            result[name] = {**counts, "hit_rate": round(counts["hits"] / lookups, 4) if lookups else None}
+        return result
+
+
+class QueryCache:
+    def __init__(self, redis_client=None, sync_redis_client=None):
+        # Entries are response bytes, so this client does not decode
+        self.redis = redis_client or get_async_redis_client(decode_responses=False)
+        self.sync_redis = sync_redis_client or get_redis_client()
+        self.set_fence = self.sync_redis.register_script(SET_FENCE_SCRIPT)
+        self.stats = CacheStats()
+        # In-process single flight: concurrent misses in this worker share one computation
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _versioned_key(self, key: str, tags: Sequence[str]) -> str:
+        versions = await self.redis.mget([TAG_PREFIX + tag for tag in tags]) if tags else []
+        return f"{ENTRY_PREFIX}{key}@{'.'.join(str(int(version or 0)) for version in versions)}"
+
+    async def get_or_set(
+        self, name: str, key: str, tags: Sequence[str], producer: Callable[[], Awaitable[bytes]], ttl: int = CACHE_TTL
+    ) -> bytes:
+        """Return the cached value for key, computing it once across workers when missing."""
+        try:
+            entry_key = await self._versioned_key(key, tags)
+            value = await self.redis.get(entry_key)
+        except RedisError as e:
+            self._unavailable(name, e)
+            return await producer()
+
+        if value is not None:
+            self.stats.record(name, "hits")
+            return value
+
+        inflight = self._inflight.get(entry_key)
+        if inflight is not None:
+            self.stats.record(name, "waits")
+            return await asyncio.shield(inflight)
+        self.stats.record(name, "misses")
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[entry_key] = future
+        try:
+            value = await self._fill(name, entry_key, producer, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[entry_key]
+
+    async def _fill(self, name: str, entry_key: str, producer: Callable[[], Awaitable[bytes]], ttl: int) -> bytes:
+        # Cross-worker single flight: one worker computes, the others wait for its result
+        token = uuid.uuid4().hex.encode()
+        lock_key = LOCK_PREFIX + entry_key
+        try:
+            locked = await self.redis.set(lock_key, token, nx=True, px=int(CACHE_LOCK_TIMEOUT * 1000))
+        except RedisError as e:
+            self._unavailable(name, e)
+            return await producer()
+
+        if not locked:
+            try:
+                deadline = time.monotonic() + CACHE_LOCK_TIMEOUT
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(CACHE_LOCK_POLL)
+                    value = await self.redis.get(entry_key)
+                    if value is not None:
+                        self.stats.record(name, "waits")
+                        return value
+                    if not await self.redis.exists(lock_key):
+                        break
+            except RedisError as e:
+                self._unavailable(name, e)
+            return await producer()
+
+        try:
+            value = await producer()
+            try:
+                await self.redis.set(entry_key, value, ex=ttl)
+            except RedisError as e:
+                self._unavailable(name, e)
+            return value
+        finally:
+            try:
+                if await self.redis.get(lock_key) == token:
+                    await self.redis.delete(lock_key)
+            except RedisError as e:
+                # The lock expires after CACHE_LOCK_TIMEOUT anyway
+                logger.warning(f"Could not release the cache lock of {name}: {e}")
+
+    def _unavailable(self, name: str, error: Exception):
+        # A cache outage must not take the endpoint down with it, the fresh value is served uncached
+        logger.warning(f"Cache unavailable for {name}: {error}")
+        self.stats.record(name, "errors")
+
+    def record_fence(self):
+        """Remember the primary's WAL position; call it before bumping versions for a commit."""
+        if read_engine is engine or engine.dialect.name != "postgresql":
+            return
+        with engine.connect() as conn:
+            position = conn.execute(PRIMARY_WAL_POSITION_SQL).scalar()
+        self.set_fence(keys=[FENCE_KEY], args=[int(position)])
+
+    def fence(self) -> Optional[int]:
+        value = self.sync_redis.get(FENCE_KEY)
+        return int(value) if value is not None else None
+
+    def invalidate(self, tags: Iterable[str] = (), families: Iterable[str] = ()):
+        """Bump tag versions; every tag starting with '<family>:' is bumped for each family."""
+        tags = set(tags)
+        try:
+            if tags or families:
+                # Before the bump: a fill that sees the new versions also sees this fence
+                self.record_fence()
+            for family in families:
+                tags.update(key[len(TAG_PREFIX):] for key in self.sync_redis.scan_iter(f"{TAG_PREFIX}{family}:*"))
+                tags.add(f"{family}:*")
+            if not tags:
+                return
+            pipe = self.sync_redis.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(TAG_PREFIX + tag)
+            pipe.execute()
+        except Exception as e:
+            # Entries still expire through their TTL
+            logger.error(f"Cache invalidation failed for {sorted(tags)}: {e}")
+
+
+query_cache = QueryCache()
+
+
+def _replica_caught_up(session: Session) -> bool:
+    try:
+        fence = query_cache.fence()
+    except RedisError as e:
+        logger.warning(f"Cache fence unavailable, filling from the primary: {e}")
+        return False
+    if fence is None:
+        return True
+    replayed = session.execute(REPLAYED_WAL_POSITION_SQL).scalar()
+    return replayed is not None and replayed >= fence
+
+
+@contextmanager
+def fenced_read_session() -> Iterator[Session]:
+    """
+    Session for computing a cached value: the read replica when it has replayed every commit that
+    bumped a tag, the primary otherwise. Open it inside the cached endpoint, after its tag versions
+    were read, never as a dependency resolved before them.
+    """
+    with contextmanager(get_read_session)() as session:
+        if session.get_bind() is engine or _replica_caught_up(session):
+            yield session
+            return
+    with Session(engine) as session:
+        yield session
+
+
+def cached(*tags: str, ttl: int = CACHE_TTL, vary: Sequence[str] = ()):
+    """
+    Cache an endpoint returning a bytes-bodied response (e.g. ORJSONResponse) under the given tags.
+    `vary` names the endpoint parameters that are part of the cache key.
+    Tags may reference those parameters, e.g. "room:{room_id}"; only tags emitted by ROW_TAGS are ever invalidated.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return await func(*args, **kwargs)
+
+            params = {param: kwargs.get(param) for param in vary}
+            key = name
+            if params:
+                key += ":" + hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+            entry_tags = [tag.format(**params) for tag in tags]
+
+            response: Optional[Response] = None
+
+            async def produce() -> bytes:
+                nonlocal response
+                response = await func(*args, **kwargs)
+                return bytes(response.body)
+
+            body = await query_cache.get_or_set(name, key, entry_tags, produce, ttl)
+            return response if response is not None else ORJSONResponse(body)
+
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_row_tags(session: Session, flush_context):
+    tags = session.info.setdefault("cache_tags", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tagger = ROW_TAGS.get(type(obj))
+        if tagger is not None:
+            tags.update(tagger(obj))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_statement_tags(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    families = STATEMENT_TAG_FAMILIES.get(mapper.class_) if mapper is not None else None
+    if families:
+        orm_execute_state.session.info.setdefault("cache_tag_families", set()).update(families)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session):
+    tags = session.info.pop("cache_tags", None)
+    families = session.info.pop("cache_tag_families", None)
+    if tags or families:
+        query_cache.invalidate(tags or (), families or ())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session):
+    session.info.pop("cache_tags", None)
+    session.info.pop("cache_tag_families", None)
@@ -0,0 +1,92 @@
+import asyncio
+import os
+from typing import Dict, Optional, Set
+import orjson
+from dotenv import load_dotenv
+from services.logger import logger
+from services.redis_client import get_async_redis_client
+
+load_dotenv()
+
+# Messages buffered per WebSocket before a slow client starts losing them
+CHAT_SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", 256))
+
+
+def room_channel(room_id: str) -> str:
+    return f"chat:room:{room_id}"
+
+
+class ChatHub:
+    """
+    Fans chat messages out to the WebSockets connected to this worker.
+    A single Redis pub/sub connection per worker is subscribed to every room with a local member,
+    and each socket gets a bounded queue so one slow client cannot stall the others.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_async_redis_client()
+        self.rooms: Dict[str, Set[asyncio.Queue]] = {}
+        self.dropped = 0
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def join(self, room_id: str) -> asyncio.Queue:
+        """Register a local member of the room and return the queue its messages are delivered to."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CHAT_SEND_QUEUE_SIZE)
+        async with self._lock:
+            members = self.rooms.setdefault(room_id, set())
+            members.add(queue)
+            if len(members) == 1:
+                if self._pubsub is None:
+                    self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                await self._pubsub.subscribe(room_channel(room_id))
+                if self._listener is None or self._listener.done():
+                    self._listener = asyncio.create_task(self._listen())
+        return queue
+
+    async def leave(self, room_id: str, queue: asyncio.Queue):
+        async with self._lock:
+            members = self.rooms.get(room_id)
+            if not members:
+                return
+            members.discard(queue)
+            if not members:
+                del self.rooms[room_id]
+                await self._pubsub.unsubscribe(room_channel(room_id))
+
+    async def publish(self, room_id: str, payload: dict) -> bytes:
+        """Publish a message to every member of the room, on every worker."""
+        data = orjson.dumps(payload)
+        await self.redis.publish(room_channel(room_id), data)
+        return data
+
+    def _deliver(self, room_id: str, data: str):
+        for queue in self.rooms.get(room_id, ()):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    async def _listen(self):
+        prefix_length = len(room_channel(""))
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Chat pub/sub listener error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message and message["type"] == "message":
+                self._deliver(message["channel"][prefix_length:], message["data"])
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+
+
+chat_hub = ChatHub()
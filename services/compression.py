@@ -0,0 +1,178 @@
+"""
+Response compression negotiated from Accept-Encoding: zstd, then brotli, then gzip.
+
+Bodies are compressed as they are sent, each chunk flushed so streamed responses (exports) keep
+flowing, and nothing is buffered beyond COMPRESSION_MIN_SIZE bytes: responses that end below it go
+out uncompressed. zstd and brotli are used when their packages are installed, gzip always works.
+"""
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+# Fast levels: the payloads are dynamic, so compression time is paid on every response
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+class GzipEncoder:
+    def __init__(self, level: int = GZIP_LEVEL):
+        # wbits 31: gzip container
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def encode(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = BROTLI_QUALITY):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def encode(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = ZSTD_LEVEL):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def encode(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+# In order of preference when the client accepts several equally
+ENCODERS: Dict[str, type] = {
+    **({"zstd": ZstdEncoder} if zstandard is not None else {}),
+    **({"br": BrotliEncoder} if brotli is not None else {}),
+    "gzip": GzipEncoder,
+}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The preferred available encoding among those the client accepts with the highest q."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in ENCODERS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    return next((value for key, value in headers if key.lower() == name), None)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing HTTP response bodies of compressible content types."""
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if not COMPRESSION_ENABLED or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate((_header(scope["headers"], b"accept-encoding") or b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        encoder = None
+        # Body held back while it is still below min_size, to decide whether compressing pays off
+        pending = b""
+        passthrough = False
+
+        async def send_start(compress: bool):
+            headers, vary = [], None
+            for key, value in start.get("headers", []):
+                name = key.lower()
+                if name == b"vary":
+                    vary = value
+                elif not (compress and name == b"content-length"):
+                    headers.append((key, value))
+            if compress:
+                headers.append((b"content-encoding", encoding.encode()))
+            # Caches must keep the encodings apart
+            headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+            await send({**start, "headers": headers})
+
+        async def send_compressed(message):
+            nonlocal start, encoder, pending, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+                content_length = _header(headers, b"content-length")
+                start = message
+                passthrough = (
+                    _header(headers, b"content-encoding") is not None
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (content_length is not None and int(content_length) < self.min_size)
+                )
+                if passthrough:
+                    await send_start(False)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                pending += body
+                if len(pending) < self.min_size:
+                    if more_body:
+                        return
+                    # The whole body is small, not worth the CPU or the encoding overhead
+                    passthrough = True
+                    await send_start(False)
+                    return await send({"type": "http.response.body", "body": pending})
+                encoder = ENCODERS[encoding]()
+                await send_start(True)
+                body, pending = pending, b""
+
+            if more_body:
+                chunk = encoder.encode(body)
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": encoder.finish(body)})
+
+        await self.app(scope, receive, send_compressed)
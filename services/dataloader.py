@@ -0,0 +1,77 @@
+"""
+Request-scoped batching of lookups by key.
+
+Every load() made during one event loop iteration is queued, then resolved by a single call to the
+loader's batch function (one IN query), and each key is only fetched once per request. Code can ask
+for the rows it needs where it needs them, e.g. once per inbox room, and still issue one query.
+"""
+import asyncio
+from typing import Callable, Dict, Generic, Hashable, Iterable, List, Mapping, Optional, TypeVar
+from sqlalchemy.orm import Session
+from services.read_models import get_hospitals_by_ids, get_users_by_ids
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Keys per IN query, the rest of a large batch goes out in further queries
+MAX_BATCH_SIZE = 1000
+
+
+class DataLoader(Generic[K, V]):
+    def __init__(self, batch_load: Callable[[List[K]], Mapping[K, V]], max_batch_size: int = MAX_BATCH_SIZE):
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size
+        self._futures: Dict[K, asyncio.Future] = {}
+        self._queue: List[K] = []
+
+    def load(self, key: K) -> "asyncio.Future[Optional[V]]":
+        """The value for key, None when the batch function did not return it."""
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._queue:
+                # Runs once the callers of this iteration are suspended on their futures
+                loop.call_soon(self._dispatch)
+            self._queue.append(key)
+        return future
+
+    async def load_many(self, keys: Iterable[K]) -> List[Optional[V]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: K, value: V):
+        """Seed a value already at hand, so later loads of it skip the query."""
+        if key not in self._futures:
+            future = self._futures[key] = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = keys[start:start + self.max_batch_size]
+            try:
+                values = self.batch_load(batch)
+            except Exception as e:
+                for key in batch:
+                    # Not cached, a later load retries the key
+                    self._futures.pop(key).set_exception(e)
+                continue
+            for key in batch:
+                self._futures[key].set_result(values.get(key))
+
+
+class Loaders:
+    """
+    The loaders of one request: users through the request's session, hospitals through a session on
+    the default shard, which keeps every hospital whichever shard holds its staff.
+    """
+
+    def __init__(self, db: Session, hospitals_db: Session):
+        self.users: DataLoader[int, dict] = DataLoader(
+            lambda user_ids: {row.id: dict(row._mapping) for row in get_users_by_ids(db, user_ids)}
+        )
+        self.hospitals: DataLoader[str, dict] = DataLoader(
+            lambda hospital_ids: {
+                row.hospital_id: dict(row._mapping) for row in get_hospitals_by_ids(hospitals_db, hospital_ids)
+            }
+        )
@@ -0,0 +1,125 @@
+"""
+Streaming chat-history exports.
+
+    python -m services.exports (--room-id ID | --hospital-id HOSP-ID) [--format ndjson|csv] [--gzip] [-o FILE]
+"""
+import argparse
+import csv
+import io
+import sys
+import zlib
+from typing import Iterator, Literal, Optional
+import orjson
+from sqlalchemy import Engine, Select, select
+from models import ChatMessage, ChatRoom, Hospital, MessageSender, Participant, User
+
+ExportFormat = Literal["ndjson", "csv"]
+
+# Rows fetched per round trip from the server-side cursor, and encoded together as one chunk
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_COLUMNS = ("message_id", "room_id", "room_name", "timestamp", "sender_id", "sender_type", "content")
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_query(room_id: Optional[str] = None, hospital_id: Optional[str] = None) -> Select:
+    """Messages of one room, or of every room with a participant from the hospital, with their sender."""
+    stmt = (
+        select(
+            ChatMessage.id.label("message_id"),
+            ChatMessage.room_id,
+            ChatRoom.name.label("room_name"),
+            ChatMessage.timestamp,
+            MessageSender.sender_id,
+            MessageSender.sender_type,
+            ChatMessage.content,
+        )
+        .join(ChatRoom, ChatRoom.id == ChatMessage.room_id)
+        .outerjoin(MessageSender, MessageSender.message_id == ChatMessage.id)
+        .order_by(ChatMessage.room_id, ChatMessage.id)
+    )
+
+    if room_id is not None:
+        stmt = stmt.where(ChatMessage.room_id == room_id)
+    if hospital_id is not None:
+        hospital_rooms = (
+            select(Participant.room_id)
+            .join(User, (User.id == Participant.participant_id) & (Participant.participant_type == User.__name__))
+            .join(Hospital, Hospital.id == User.hospital_id)
+            .where(Hospital.hospital_id == hospital_id)
+        )
+        stmt = stmt.where(ChatMessage.room_id.in_(hospital_rooms))
+    return stmt
+
+
+def _encode_ndjson(rows) -> bytes:
+    return b"".join(
+        orjson.dumps(dict(zip(EXPORT_COLUMNS, row)), option=orjson.OPT_APPEND_NEWLINE)
+        for row in rows
+    )
+
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        (message_id, room_id, room_name, timestamp.isoformat(), sender_id, sender_type, content)
+        for message_id, room_id, room_name, timestamp, sender_id, sender_type, content in rows
+    )
+    return buffer.getvalue().encode("utf-8")
+
+
+def stream_messages(
+    engine: Engine,
+    room_id: Optional[str] = None,
+    hospital_id: Optional[str] = None,
+    export_format: ExportFormat = "ndjson",
+    compress: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yield the export as byte chunks.
+    Rows come from a server-side cursor one batch at a time, so memory stays flat whatever the history size.
+    """
+    encode = _encode_ndjson if export_format == "ndjson" else _encode_csv
+    # wbits=31 writes a gzip container, so the output can be decompressed by any gzip tool
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(chunk: bytes) -> bytes:
+        return compressor.compress(chunk) if compressor else chunk
+
+    if export_format == "csv":
+        yield emit((",".join(EXPORT_COLUMNS) + "\r\n").encode("utf-8"))
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            export_query(room_id=room_id, hospital_id=hospital_id)
+        )
+        for rows in result.partitions():
+            chunk = emit(encode(rows))
+            if chunk:
+                yield chunk
+
+    if compressor:
+        yield compressor.flush()
+
+
+if __name__ == "__main__":
+    from database import read_engine
+
+    parser = argparse.ArgumentParser(description="Export chat history as NDJSON or CSV")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--room-id")
+    scope.add_argument("--hospital-id", help="readable hospital id, e.g. HOSP-38A2E9A1")
+    parser.add_argument("--format", choices=list(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("-o", "--output", help="output file, defaults to stdout")
+    args = parser.parse_args()
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream_messages(read_engine, args.room_id, args.hospital_id, args.format, args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
@@ -0,0 +1,223 @@
+"""
+Per-route-class concurrency limits that adapt to latency, with a short queue and 503s beyond it.
+
+Each class (auth, listing, chat) has its own limit, so slow listings queries cannot starve logins.
+The limit follows a gradient rule: it shrinks when recent latency rises above the long-term
+baseline and grows back while latency holds. Waiting requests are bounded CoDel-style: once queue
+delay has stayed above its target for a whole interval, waiters only get the target before being
+shed, so a standing queue never builds up.
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+import orjson
+from dotenv import load_dotenv
+from services.logger import logger
+
+load_dotenv()
+
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True, slots=True)
+class LimiterConfig:
+    initial_limit: int
+    min_limit: int
+    max_limit: int
+    # Longest a request waits for a slot while the class is healthy
+    queue_timeout: float
+    max_queue: int
+    # CoDel: acceptable queue delay, and how long it may be exceeded before shedding aggressively
+    target_delay: float = 0.02
+    interval: float = 0.1
+
+
+def _config(name: str, **defaults) -> LimiterConfig:
+    prefix = f"CONCURRENCY_{name.upper()}_"
+    return LimiterConfig(**{
+        key: type(value)(os.getenv(prefix + key.upper(), value))
+        for key, value in defaults.items()
+    })
+
+
+ROUTE_CLASS_CONFIG: Dict[str, LimiterConfig] = {
+    "auth": _config("auth", initial_limit=20, min_limit=4, max_limit=100, queue_timeout=0.5, max_queue=100),
+    "listing": _config("listing", initial_limit=10, min_limit=2, max_limit=50, queue_timeout=0.25, max_queue=50),
+    "chat": _config("chat", initial_limit=50, min_limit=5, max_limit=500, queue_timeout=0.25, max_queue=500),
+}
+
+# First match wins; (methods or None for any, path pattern, route class). Unmatched routes are not limited.
+ROUTE_CLASSES: List[Tuple[Optional[set], re.Pattern, Optional[str]]] = [
+    (None, re.compile(r"^/(users|admins)/(login|verify-otp|resend-otp)/"), "auth"),
+    # Exports are long-lived streams, holding a slot for their whole duration would skew the latency
+    (None, re.compile(r"^/chats/export"), None),
+    (None, re.compile(r"^/chats/"), "chat"),
+    ({"GET"}, re.compile(r"^/(users/?$|users/chats|hospital/?$|sync/?$|admins/analytics/)"), "listing"),
+    ({"POST"}, re.compile(r"^/(users|hospital)/batch$"), "listing"),
+]
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    for methods, pattern, route_class in ROUTE_CLASSES:
+        if (methods is None or method in methods) and pattern.search(path):
+            return route_class
+    return None
+
+
+class Shed(Exception):
+    pass
+
+
+class GradientLimiter:
+    """Concurrency limit for one route class, adjusted from each request's latency."""
+
+    # Long-term latency baseline is an EMA over roughly this many samples
+    LONG_WINDOW = 500
+    # Latency may rise this much over the baseline before the limit backs off
+    TOLERANCE = 1.5
+    SMOOTHING = 0.2
+
+    def __init__(self, name: str, config: LimiterConfig):
+        self.name = name
+        self.config = config
+        self.limit = float(config.initial_limit)
+        self.in_flight = 0
+        self.long_rtt: Optional[float] = None
+        self.waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self.above_target_until: Optional[float] = None
+        self.overloaded = False
+        self.admitted = 0
+        self.shed = 0
+
+    def _update_codel(self, delay: float, now: float):
+        if delay < self.config.target_delay:
+            self.above_target_until = None
+            self.overloaded = False
+        elif self.above_target_until is None:
+            self.above_target_until = now + self.config.interval
+        elif now >= self.above_target_until:
+            self.overloaded = True
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.config.max_queue:
+            self.shed += 1
+            raise Shed()
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, time.monotonic())
+        self.waiters.append(entry)
+        timeout = self.config.target_delay if self.overloaded else self.config.queue_timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait expired, keep it
+                return
+            future.cancel()
+            self.waiters.remove(entry)
+            self._update_codel(time.monotonic() - entry[1], time.monotonic())
+            self.shed += 1
+            raise Shed()
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+                self.waiters.remove(entry)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        now = time.monotonic()
+        while self.waiters and self.in_flight < int(self.limit):
+            future, enqueued = self.waiters.popleft()
+            if future.done():
+                continue
+            self._update_codel(now - enqueued, now)
+            # The slot passes straight to the waiter, in_flight stays counted
+            self.in_flight += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    def on_sample(self, rtt: float):
+        if self.long_rtt is None:
+            self.long_rtt = rtt
+        else:
+            self.long_rtt += (rtt - self.long_rtt) / self.LONG_WINDOW
+            # Let the baseline recover after a sustained shift instead of throttling forever
+            if self.long_rtt / rtt > 2:
+                self.long_rtt *= 0.95
+
+        gradient = max(0.5, min(1.0, self.TOLERANCE * self.long_rtt / rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        # Only grow when the limit is actually being used
+        if new_limit > self.limit and self.in_flight < self.limit / 2:
+            return
+        self.limit = max(
+            self.config.min_limit,
+            min(self.config.max_limit, self.limit * (1 - self.SMOOTHING) + new_limit * self.SMOOTHING),
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "baseline_latency_ms": round(self.long_rtt * 1000, 2) if self.long_rtt is not None else None,
+            "overloaded": self.overloaded,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+limiters: Dict[str, GradientLimiter] = {name: GradientLimiter(name, config) for name, config in ROUTE_CLASS_CONFIG.items()}
+
+SHED_BODY = orjson.dumps({"detail": "Server is busy, please retry shortly"})
+
+
+class LoadSheddingMiddleware:
+    """ASGI middleware applying the route class limiters to HTTP requests; WebSockets pass through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not LOAD_SHEDDING_ENABLED or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route_class = classify(scope["method"], scope["path"])
+        if route_class is None:
+            return await self.app(scope, receive, send)
+
+        limiter = limiters[route_class]
+        try:
+            await limiter.acquire()
+        except Shed:
+            logger.warning(f"Shed {scope['method']} {scope['path']} ({route_class} limit {int(limiter.limit)})")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": SHED_BODY})
+            return
+
+        start = time.monotonic()
+        failed = False
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            limiter.release()
+            if not failed:
+                limiter.on_sample(time.monotonic() - start)
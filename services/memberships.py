@@ -0,0 +1,260 @@
+"""
+Chat room membership mirrored into Redis sets, so authorization is a SISMEMBER instead of a query.
+
+    room:members:{room_id}            -> {"default:User:12", ...}
+    member:rooms:{shard}:{type}:{id}  -> {"CHAT-...", ...}
+
+Ids are only unique within a shard, so members are qualified by the shard holding their rows.
+
+Participant rows added or removed through a Session are applied after the commit. Until the index
+has been built from the database (READY_KEY), lookups return None and callers fall back to
+the participants table.
+
+    python -m services.memberships rebuild
+"""
+import argparse
+import uuid
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import Engine, event, inspect, select
+from sqlalchemy.orm import Session
+from models import Participant, User
+from services.logger import logger
+from services.read_models import get_user_id
+from services.redis_client import get_redis_client
+from services.sharding import tenant_router
+
+# Renamed whenever the member ref format changes, so existing deployments rebuild the index
+READY_KEY = "membership:ready:sharded"
+# Bumped on every applied change, a rebuild that raced a change is redone
+CHANGES_KEY = "membership:changes"
+REBUILD_LOCK_KEY = "membership:rebuild"
+# work_id -> User.id per shard, so tokens resolve to participant ids without a query
+USER_IDS_KEY = "membership:user_ids:{shard}"
+
+REBUILD_BATCH_SIZE = 10_000
+REBUILD_ATTEMPTS = 3
+REBUILD_LOCK_TIMEOUT = 600
+
+Membership = Tuple[str, str]
+
+
+def member_ref(shard: str, participant_type: str, participant_id: int) -> str:
+    return f"{shard}:{participant_type}:{participant_id}"
+
+
+def parse_member_ref(member: str) -> Optional[Tuple[str, str, int]]:
+    """(shard, participant_type, participant_id) of a member ref; None for refs in an older format."""
+    parts = member.split(":")
+    if len(parts) != 3 or not parts[2].isdigit():
+        return None
+    return parts[0], parts[1], int(parts[2])
+
+
+def session_shard(session: Session) -> str:
+    return tenant_router.shard_of(session.get_bind())
+
+
+def room_members_key(room_id: str) -> str:
+    return f"room:members:{room_id}"
+
+
+def member_rooms_key(member: str) -> str:
+    return f"member:rooms:{member}"
+
+
+class RoomMembershipIndex:
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+
+    def apply(self, added: Iterable[Membership] = (), removed: Iterable[Membership] = ()):
+        """Mirror committed (room_id, member) changes into both directions of the index."""
+        added, removed = list(added), list(removed)
+        if not added and not removed:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for room_id, member in removed:
+                pipe.srem(room_members_key(room_id), member)
+                pipe.srem(member_rooms_key(member), room_id)
+            for room_id, member in added:
+                pipe.sadd(room_members_key(room_id), member)
+                pipe.sadd(member_rooms_key(member), room_id)
+            pipe.incr(CHANGES_KEY)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Membership index update failed, falling back to the database until rebuilt: {e}")
+            try:
+                self.redis.delete(READY_KEY)
+            except Exception:
+                pass
+
+    def is_member(self, room_id: str, member: str) -> Optional[bool]:
+        """SISMEMBER against the index; None when it is not built or Redis is unavailable."""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.exists(READY_KEY)
+            pipe.sismember(room_members_key(room_id), member)
+            ready, is_member = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Membership index unavailable: {e}")
+            return None
+        return bool(is_member) if ready else None
+
+    def rooms_of(self, member: str) -> Optional[List[str]]:
+        """Room ids of a member; None when the index is not built or Redis is unavailable."""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.exists(READY_KEY)
+            pipe.smembers(member_rooms_key(member))
+            ready, rooms = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Membership index unavailable: {e}")
+            return None
+        return list(rooms) if ready else None
+
+    def user_id(self, db: Session, work_id: str) -> Optional[int]:
+        """User.id for a work_id on the session's shard, cached in Redis after the first lookup."""
+        key = USER_IDS_KEY.format(shard=session_shard(db))
+        try:
+            cached = self.redis.hget(key, work_id)
+        except Exception as e:
+            logger.warning(f"Membership index unavailable: {e}")
+            return get_user_id(db, work_id)
+        if cached is not None:
+            return int(cached)
+
+        user_id = get_user_id(db, work_id)
+        if user_id is not None:
+            try:
+                self.redis.hset(key, work_id, user_id)
+            except Exception:
+                pass
+        return user_id
+
+    def forget_users(self, shard: str, work_ids: Iterable[str]):
+        work_ids = list(work_ids)
+        if work_ids:
+            try:
+                self.redis.hdel(USER_IDS_KEY.format(shard=shard), *work_ids)
+            except Exception as e:
+                logger.error(f"Could not drop cached user ids {work_ids}: {e}")
+
+    def rebuild(self, *engines: Engine) -> int:
+        """Reload the whole index from the participants table of every shard; returns the number of memberships."""
+        token = uuid.uuid4().hex
+        if not self.redis.set(REBUILD_LOCK_KEY, token, nx=True, ex=REBUILD_LOCK_TIMEOUT):
+            logger.info("Membership index rebuild already running elsewhere")
+            return 0
+        try:
+            for _ in range(REBUILD_ATTEMPTS):
+                # Lookups fall back to the database while the sets are being reloaded
+                self.redis.delete(READY_KEY)
+                changes = self.redis.get(CHANGES_KEY)
+                for pattern in (room_members_key("*"), member_rooms_key("*")):
+                    stale = list(self.redis.scan_iter(pattern, count=REBUILD_BATCH_SIZE))
+                    for start in range(0, len(stale), REBUILD_BATCH_SIZE):
+                        self.redis.delete(*stale[start:start + REBUILD_BATCH_SIZE])
+
+                count = 0
+                for engine in engines:
+                    shard = tenant_router.shard_of(engine)
+                    with engine.connect() as conn:
+                        result = conn.execution_options(yield_per=REBUILD_BATCH_SIZE).execute(
+                            select(Participant.room_id, Participant.participant_type, Participant.participant_id)
+                        )
+                        for batch in result.partitions():
+                            pipe = self.redis.pipeline(transaction=False)
+                            for room_id, participant_type, participant_id in batch:
+                                member = member_ref(shard, participant_type, participant_id)
+                                pipe.sadd(room_members_key(room_id), member)
+                                pipe.sadd(member_rooms_key(member), room_id)
+                            pipe.execute()
+                            count += len(batch)
+
+                # A removal committed during the load could have been re-added by it, so start over
+                if self.redis.get(CHANGES_KEY) == changes:
+                    self.redis.set(READY_KEY, 1)
+                    logger.info(f"Membership index rebuilt with {count} memberships")
+                    return count
+            logger.warning("Membership index kept changing during rebuild, lookups stay on the database")
+            return count
+        finally:
+            if self.redis.get(REBUILD_LOCK_KEY) == token:
+                self.redis.delete(REBUILD_LOCK_KEY)
+
+    def ensure_built(self, *engines: Engine):
+        try:
+            if not self.redis.exists(READY_KEY):
+                self.rebuild(*engines)
+        except Exception as e:
+            logger.error(f"Membership index rebuild failed: {e}")
+
+
+membership_index = RoomMembershipIndex()
+
+
+def record_memberships(session: Session, added: Iterable[Membership] = (), removed: Iterable[Membership] = ()):
+    """Queue changes made with bulk statements (which skip the flush hooks) for after the commit."""
+    added, removed = list(added), list(removed)
+    if added:
+        session.info.setdefault("memberships_added", []).extend(added)
+    if removed:
+        session.info.setdefault("memberships_removed", []).extend(removed)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_membership_changes(session: Session, flush_context):
+    added, removed, work_ids = [], [], []
+    shard = session_shard(session)
+    for obj in session.new:
+        if isinstance(obj, Participant):
+            added.append((obj.room_id, member_ref(shard, obj.participant_type, obj.participant_id)))
+    for obj in session.deleted:
+        if isinstance(obj, Participant):
+            removed.append((obj.room_id, member_ref(shard, obj.participant_type, obj.participant_id)))
+        elif isinstance(obj, User):
+            work_ids.append(obj.work_id)
+    for obj in session.dirty:
+        if isinstance(obj, Participant):
+            state = inspect(obj)
+            history = [state.attrs[name].history for name in ("room_id", "participant_type", "participant_id")]
+            if any(h.has_changes() for h in history):
+                room_id, participant_type, participant_id = (
+                    (h.deleted or h.unchanged)[0] for h in history
+                )
+                removed.append((room_id, member_ref(shard, participant_type, participant_id)))
+                added.append((obj.room_id, member_ref(shard, obj.participant_type, obj.participant_id)))
+        elif isinstance(obj, User) and inspect(obj).attrs.work_id.history.deleted:
+            work_ids.extend(inspect(obj).attrs.work_id.history.deleted)
+    record_memberships(session, added, removed)
+    if work_ids:
+        session.info.setdefault("memberships_forget_users", []).extend(work_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_membership_changes(session: Session):
+    added = session.info.pop("memberships_added", None)
+    removed = session.info.pop("memberships_removed", None)
+    work_ids = session.info.pop("memberships_forget_users", None)
+    if added or removed:
+        membership_index.apply(added or (), removed or ())
+    if work_ids:
+        membership_index.forget_users(session_shard(session), work_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_membership_changes(session: Session):
+    for key in ("memberships_added", "memberships_removed", "memberships_forget_users"):
+        session.info.pop(key, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat room membership index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    print(f"{membership_index.rebuild(*tenant_router.engines.values())} memberships indexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Email digests of chat messages for participants who are not connected.
+
+Each message only adds to the pending counts of its offline recipients in Redis; the first pending
+message schedules the recipient's digest one window later, so a busy room still produces at most one
+email per recipient per window. A background worker sends the due digests in batches over the pooled
+SMTP connections and holds them back during quiet hours.
+
+    notify:pending:{member}   room_id -> messages since the last digest
+    notify:preview:{member}   room_id -> latest message content
+    notify:due                member -> when its digest is due (sorted set)
+    presence:{member}         open WebSockets of the member, expires unless refreshed
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from datetime import time as dt_time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+from models import ChatRoom, Participant, User
+from services.logger import logger
+from services.memberships import READY_KEY, member_ref, parse_member_ref, room_members_key
+from services.redis_client import get_async_redis_client
+from services.send_email import build_message, smtp_pool, template_env
+from services.sharding import tenant_router
+
+load_dotenv()
+
+DIGESTS_ENABLED = os.getenv("DIGESTS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Messages arriving within this many seconds of the first pending one share a digest
+DIGEST_WINDOW_SECONDS = int(os.getenv("DIGEST_WINDOW_SECONDS", 900))
+# "HH:MM-HH:MM" in server local time, may wrap midnight; empty disables quiet hours
+DIGEST_QUIET_HOURS = os.getenv("DIGEST_QUIET_HOURS", "")
+DIGEST_POLL_SECONDS = float(os.getenv("DIGEST_POLL_SECONDS", 30))
+# Digests claimed per poll and sent over one pooled connection per batch
+DIGEST_BATCH_SIZE = int(os.getenv("DIGEST_BATCH_SIZE", 100))
+DIGEST_PREVIEW_LENGTH = 200
+# A member counts as online while one of their WebSockets refreshed this key recently
+PRESENCE_TTL = int(os.getenv("PRESENCE_TTL", 90))
+
+DUE_KEY = "notify:due"
+
+DIGEST_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en" style="margin: 0; padding: 0;">
+  <body style="margin: 0; padding: 0; background-color: #f4f4f4; font-family: Arial, sans-serif;">
+    <table width="100%" border="0" cellspacing="0" cellpadding="0" style="background-color: #f4f4f4; padding: 30px 0;">
+      <tr>
+        <td align="center">
+          <table width="500" border="0" cellspacing="0" cellpadding="0" style="background-color: #ffffff; border-radius: 10px; overflow: hidden;">
+            <tr>
+              <td style="background-color: #84cc16; color: #ffffff; text-align: center; padding: 20px 0;">
+                <h1 style="margin: 0; font-size: 22px;">{{ total }} new message{{ "s" if total != 1 }}</h1>
+              </td>
+            </tr>
+            <tr>
+              <td style="padding: 30px;">
+                <p style="font-size: 16px; color: #333333;">Hello {{ first_name }}, while you were away:</p>
+                {% for room in rooms %}
+                <p style="font-size: 15px; color: #333333; margin: 16px 0 4px;">
+                  <strong>{{ room.name }}</strong> &middot; {{ room.count }} message{{ "s" if room.count != 1 }}
+                </p>
+                <p style="font-size: 14px; color: #555555; margin: 0;">{{ room.preview }}</p>
+                {% endfor %}
+              </td>
+            </tr>
+          </table>
+        </td>
+      </tr>
+    </table>
+  </body>
+</html>
+"""
+
+DIGEST_EMAIL_TEMPLATE = template_env.from_string(DIGEST_TEMPLATE)
+
+
+def pending_key(member: str) -> str:
+    return f"notify:pending:{member}"
+
+
+def preview_key(member: str) -> str:
+    return f"notify:preview:{member}"
+
+
+def presence_key(member: str) -> str:
+    return f"presence:{member}"
+
+
+def parse_quiet_hours(value: str) -> Optional[Tuple[dt_time, dt_time]]:
+    if not value:
+        return None
+    start, end = value.split("-")
+    return dt_time.fromisoformat(start.strip()), dt_time.fromisoformat(end.strip())
+
+
+def in_quiet_hours(now: datetime, quiet_hours: Optional[Tuple[dt_time, dt_time]]) -> bool:
+    if quiet_hours is None:
+        return False
+    start, end = quiet_hours
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+class PresenceTracker:
+    """Counts each member's open WebSockets in Redis; this worker's counts are refreshed periodically."""
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_async_redis_client()
+        self.local: Counter = Counter()
+
+    async def connect(self, member: str):
+        self.local[member] += 1
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.incr(presence_key(member))
+        pipe.expire(presence_key(member), PRESENCE_TTL)
+        await pipe.execute()
+
+    async def disconnect(self, member: str):
+        self.local[member] -= 1
+        if self.local[member] <= 0:
+            del self.local[member]
+        if await self.redis.decr(presence_key(member)) <= 0:
+            await self.redis.delete(presence_key(member))
+
+    async def online(self, members: List[str]) -> List[bool]:
+        if not members:
+            return []
+        counts = await self.redis.mget([presence_key(member) for member in members])
+        return [count is not None and int(count) > 0 for count in counts]
+
+    async def run_heartbeat(self):
+        """Keep this worker's members online; if the worker dies their presence expires on its own."""
+        while True:
+            await asyncio.sleep(PRESENCE_TTL / 3)
+            if not self.local:
+                continue
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for member, connections in self.local.items():
+                    # Counts lost to an expiry are restored from what this worker still holds
+                    pipe.set(presence_key(member), connections, nx=True, ex=PRESENCE_TTL)
+                    pipe.expire(presence_key(member), PRESENCE_TTL)
+                await pipe.execute()
+            except Exception as e:
+                logger.error(f"Presence heartbeat failed: {e}")
+
+
+def _room_member_refs(engines: Iterable[Engine], room_id: str) -> List[str]:
+    # A room lives on a single shard
+    for engine in engines:
+        with Session(engine) as db:
+            rows = db.execute(
+                select(Participant.participant_type, Participant.participant_id).where(Participant.room_id == room_id)
+            ).all()
+        if rows:
+            shard = tenant_router.shard_of(engine)
+            return [member_ref(shard, participant_type, participant_id) for participant_type, participant_id in rows]
+    return []
+
+
+def _load_recipients(engines: Iterable[Engine], members: Iterable[str], room_ids: Set[str]) -> Tuple[Dict[str, User], Dict[str, str]]:
+    """Users behind the member refs (only staff get digests) and the names of the rooms involved, from every shard."""
+    user_ids: Dict[str, Dict[int, str]] = {}
+    for member in members:
+        ref = parse_member_ref(member)
+        if ref is not None and ref[1] == User.__name__:
+            user_ids.setdefault(ref[0], {})[ref[2]] = member
+    users, rooms = {}, {}
+    for engine in engines:
+        # User ids are only unique within a shard, each shard resolves its own members
+        shard_user_ids = user_ids.get(tenant_router.shard_of(engine), {})
+        with Session(engine) as db:
+            if shard_user_ids:
+                users.update(
+                    (shard_user_ids[user.id], user)
+                    for user in db.execute(select(User).where(User.id.in_(shard_user_ids))).scalars()
+                )
+            if room_ids:
+                rooms.update(db.execute(select(ChatRoom.id, ChatRoom.name).where(ChatRoom.id.in_(room_ids))).all())
+            db.expunge_all()
+    return users, rooms
+
+
+class DigestNotifier:
+    def __init__(self, engines: Iterable[Engine], presence: PresenceTracker, redis_client=None):
+        self.engines = list(engines)
+        self.presence = presence
+        self.redis = redis_client or get_async_redis_client()
+        self.quiet_hours = parse_quiet_hours(DIGEST_QUIET_HOURS)
+        self.sent = 0
+        self.failed = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, room_id: str, payload: dict, shard: str):
+        """Queue the message for offline recipients without delaying its delivery to the room."""
+        if not DIGESTS_ENABLED:
+            return
+        task = asyncio.create_task(self.enqueue(room_id, payload, shard))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _room_members(self, room_id: str) -> List[str]:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(READY_KEY)
+        pipe.smembers(room_members_key(room_id))
+        ready, members = await pipe.execute()
+        if ready:
+            return list(members)
+        return await asyncio.to_thread(_room_member_refs, self.engines, room_id)
+
+    async def enqueue(self, room_id: str, payload: dict, shard: str):
+        try:
+            sender = payload.get("sender") or {}
+            sender_ref = member_ref(shard, sender.get("type"), sender.get("id")) if sender else None
+            members = [member for member in await self._room_members(room_id) if member != sender_ref]
+            online = await self.presence.online(members)
+            offline = [member for member, is_online in zip(members, online) if not is_online]
+            if not offline:
+                return
+
+            due = time.time() + DIGEST_WINDOW_SECONDS
+            preview = str(payload.get("content", ""))[:DIGEST_PREVIEW_LENGTH]
+            pipe = self.redis.pipeline(transaction=False)
+            for member in offline:
+                pipe.hincrby(pending_key(member), room_id, 1)
+                pipe.hset(preview_key(member), room_id, preview)
+            # NX keeps the due time of the first pending message, later ones join that digest
+            pipe.zadd(DUE_KEY, {member: due for member in offline}, nx=True)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Could not queue chat notifications for {room_id}: {e}")
+
+    async def _claim_due(self) -> Dict[str, Tuple[Dict[str, str], Dict[str, str]]]:
+        members = await self.redis.zrangebyscore(DUE_KEY, "-inf", time.time(), start=0, num=DIGEST_BATCH_SIZE)
+        claimed = {}
+        for member in members:
+            # ZREM succeeds for exactly one worker, which then owns the digest
+            if not await self.redis.zrem(DUE_KEY, member):
+                continue
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hgetall(pending_key(member))
+            pipe.hgetall(preview_key(member))
+            pipe.delete(pending_key(member), preview_key(member))
+            counts, previews, _ = await pipe.execute()
+            if counts:
+                claimed[member] = (counts, previews)
+        return claimed
+
+    async def _requeue(self, member: str, counts: Dict[str, str], previews: Dict[str, str]):
+        pipe = self.redis.pipeline(transaction=False)
+        for room_id, count in counts.items():
+            pipe.hincrby(pending_key(member), room_id, int(count))
+        for room_id, preview in previews.items():
+            pipe.hsetnx(preview_key(member), room_id, preview)
+        pipe.zadd(DUE_KEY, {member: time.time() + DIGEST_WINDOW_SECONDS}, nx=True)
+        await pipe.execute()
+
+    async def send_due(self) -> int:
+        """Send one batch of due digests; returns how many were accepted by the SMTP server."""
+        claimed = await self._claim_due()
+        if not claimed:
+            return 0
+
+        room_ids = {room_id for counts, _ in claimed.values() for room_id in counts}
+        users, room_names = await asyncio.to_thread(_load_recipients, self.engines, claimed.keys(), room_ids)
+
+        members, messages = [], []
+        for member, (counts, previews) in claimed.items():
+            user = users.get(member)
+            if user is None:
+                continue
+            rooms = [
+                {"name": room_names.get(room_id, room_id), "count": int(count), "preview": previews.get(room_id, "")}
+                for room_id, count in sorted(counts.items(), key=lambda item: -int(item[1]))
+            ]
+            total = sum(room["count"] for room in rooms)
+            html_content = DIGEST_EMAIL_TEMPLATE.render(first_name=user.first_name, rooms=rooms, total=total)
+            members.append(member)
+            messages.append(build_message(user.email, f"{total} new chat message{'s' if total != 1 else ''} – DiagnoXis", html_content))
+
+        if not messages:
+            return 0
+        # One result per message even when the connection fails, so accepted digests are never requeued
+        results = await smtp_pool.send_messages(messages)
+
+        sent = 0
+        for member, error in zip(members, results):
+            if error is None:
+                sent += 1
+            else:
+                logger.warning(f"Chat digest to {member} failed, retrying next window: {error}")
+                await self._requeue(member, *claimed[member])
+        self.sent += sent
+        self.failed += len(members) - sent
+        return sent
+
+    async def run(self):
+        """Background worker: send due digests outside quiet hours, a batch at a time."""
+        if not DIGESTS_ENABLED:
+            return
+        while True:
+            try:
+                if not in_quiet_hours(datetime.now(), self.quiet_hours):
+                    # Keep draining while full batches come back
+                    while await self.send_due() >= DIGEST_BATCH_SIZE:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Chat digest worker error: {e}")
+            await asyncio.sleep(DIGEST_POLL_SECONDS)
+
+
+presence = PresenceTracker()
+digest_notifier = DigestNotifier(tenant_router.engines.values(), presence)
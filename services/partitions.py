@@ -0,0 +1,176 @@
+"""
+Monthly range partitions of the messages table.
+
+    python -m services.partitions create [--months-ahead N]
+    python -m services.partitions archive [--retention-months N] [--archive-dir DIR] [--keep-detached]
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import re
+from datetime import date, datetime
+from typing import List, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import Engine, text
+from services.logger import logger
+
+load_dotenv()
+
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", 3))
+MESSAGE_RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", 12))
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive/messages")
+# How often the background task makes sure upcoming partitions exist
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", 6 * 60 * 60))
+
+PARENT_TABLE = "messages"
+PARTITION_PATTERN = re.compile(r"^messages_p(\d{4})_(\d{2})$")
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(engine: Engine) -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :name"),
+            {"name": PARENT_TABLE},
+        ).first() is not None
+
+
+def list_partitions(conn) -> List[Tuple[str, date]]:
+    """Attached monthly partitions of messages as (name, first day of month), oldest first."""
+    rows = conn.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :name
+            """
+        ),
+        {"name": PARENT_TABLE},
+    ).scalars()
+
+    partitions = []
+    for name in rows:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(conn, month: date):
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+    )
+
+
+def ensure_message_partitions(engine: Engine, months_ahead: int = MESSAGE_PARTITIONS_AHEAD) -> List[str]:
+    """Create the partitions for the current month and the next `months_ahead` months if missing."""
+    if not is_partitioned(engine):
+        return []
+
+    current = date.today().replace(day=1)
+    months = [add_months(current, i) for i in range(months_ahead + 1)]
+    with engine.begin() as conn:
+        existing = {name for name, _ in list_partitions(conn)}
+        created = [partition_name(month) for month in months if partition_name(month) not in existing]
+        for month in months:
+            create_partition(conn, month)
+
+    for name in created:
+        logger.info(f"Created message partition {name}")
+    return created
+
+
+def archive_message_partitions(
+    engine: Engine,
+    retention_months: int = MESSAGE_RETENTION_MONTHS,
+    archive_dir: str = MESSAGE_ARCHIVE_DIR,
+    keep_detached: bool = False,
+) -> List[str]:
+    """
+    Export every partition entirely older than the retention window to a gzipped CSV
+    (messages joined with their senders), then detach it and remove its sender rows.
+    The detached table is dropped unless keep_detached is set.
+    """
+    if not is_partitioned(engine):
+        logger.warning("messages is not partitioned, nothing to archive")
+        return []
+
+    cutoff = add_months(date.today().replace(day=1), -retention_months)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    with engine.connect() as conn:
+        expired = [name for name, month in list_partitions(conn) if add_months(month, 1) <= cutoff]
+
+    archived = []
+    for name in expired:
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+        # One transaction per partition: the export and the detach succeed or fail together
+        with engine.begin() as conn:
+            cursor = conn.connection.cursor()
+            with gzip.open(path, "wb") as archive:
+                cursor.copy_expert(
+                    f"""
+                    COPY (
+                        SELECT m.id, m.room_id, m.timestamp, m.content, s.sender_id, s.sender_type
+                        FROM {name} m
+                        LEFT JOIN message_senders s ON s.message_id = m.id
+                        ORDER BY m.id
+                    ) TO STDOUT WITH (FORMAT csv, HEADER true)
+                    """,
+                    archive,
+                )
+            conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DELETE FROM message_senders s USING {name} m WHERE s.message_id = m.id"))
+            if not keep_detached:
+                conn.execute(text(f"DROP TABLE {name}"))
+
+        logger.info(f"Archived message partition {name} to {path}")
+        archived.append(name)
+    return archived
+
+
+async def run_partition_maintenance(engine: Engine, interval: int = PARTITION_MAINTENANCE_INTERVAL):
+    """Background task keeping future partitions in place so inserts never miss a partition."""
+    while True:
+        try:
+            await asyncio.to_thread(ensure_message_partitions, engine)
+        except Exception as e:
+            logger.error(f"Message partition maintenance failed at {datetime.now()}: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the messages table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create", help="create upcoming partitions")
+    create_parser.add_argument("--months-ahead", type=int, default=MESSAGE_PARTITIONS_AHEAD)
+
+    archive_parser = subparsers.add_parser("archive", help="export and detach partitions past retention")
+    archive_parser.add_argument("--retention-months", type=int, default=MESSAGE_RETENTION_MONTHS)
+    archive_parser.add_argument("--archive-dir", default=MESSAGE_ARCHIVE_DIR)
+    archive_parser.add_argument("--keep-detached", action="store_true", help="keep the detached table instead of dropping it")
+
+    args = parser.parse_args()
+    if args.command == "create":
+        print(ensure_message_partitions(engine, args.months_ahead))
+    else:
+        print(archive_message_partitions(engine, args.retention_months, args.archive_dir, args.keep_detached))
@@ -0,0 +1,236 @@
+"""
+On-demand per-request profiling.
+
+A request is profiled when it carries an admin access token in `X-Profile` (so any user's request
+can be profiled alongside its own Authorization), or when it is picked by PROFILE_SAMPLE_RATE.
+A sampler thread then records the request's stack every PROFILE_INTERVAL_MS: the running frames
+while the request holds the event loop, its await chain (marked [await]) while it waits on the
+database, the threadpool or Redis. Every SQL statement it runs is timed as well.
+
+Each profile is written to PROFILE_DIR as <id>.folded (collapsed stacks, for flamegraph.pl,
+speedscope or inferno) and <id>.json (request summary and SQL timings); the id is returned in the
+X-Profile-Id response header. Requests that are not profiled only cost a scan of their headers.
+"""
+import asyncio
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import Engine, event
+from functions import decode_jwt_token
+from schemas.admins_schema import AdminSchema
+from services.logger import logger
+
+load_dotenv()
+
+# Share of all HTTP requests profiled without being asked to, 0 turns sampling off
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 1))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_HEADER = b"x-profile"
+# Statements kept per profile; the totals still count every statement
+MAX_RECORDED_STATEMENTS = 500
+
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+_sql_hooks_lock = threading.Lock()
+_sql_hooks_installed = False
+
+
+@functools.lru_cache(maxsize=None)
+def frame_name(code) -> str:
+    filename = code.co_filename
+    if "site-packages" in filename:
+        filename = filename.rsplit("site-packages" + os.sep, 1)[-1]
+    elif filename.startswith(os.getcwd()):
+        filename = os.path.relpath(filename)
+    # ';' separates frames in the collapsed format
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class RequestProfile:
+    """Stack samples and SQL timings of one request."""
+
+    def __init__(self, method: str, path: str, marker, task: Optional[asyncio.Task]):
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        # The middleware's own frame: frames above it belong to this request
+        self.marker = marker
+        self.task = task
+        self.thread_id = threading.get_ident()
+        self.samples: Counter = Counter()
+        self.statements: List[dict] = []
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.status: Optional[int] = None
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.id}", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        self._stopped.set()
+        self._sampler.join()
+
+    def _run(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stopped.wait(interval):
+            try:
+                self._sample()
+            except Exception:
+                # The loop thread moved on while its frames were walked, skip this sample
+                pass
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        codes = []
+        while frame is not None and frame is not self.marker:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        if frame is not None:
+            stack = [frame_name(code) for code in reversed(codes)]
+        else:
+            # The loop runs something else, this request is suspended on an await
+            stack = self._await_chain()
+            if stack is None:
+                return
+        self.samples[";".join(stack)] += 1
+
+    def _await_chain(self) -> Optional[List[str]]:
+        """
+        Frames of the suspended request below the marker. Task.get_stack() only returns the task's
+        outermost coroutine frame, the rest of the chain hangs off cr_await.
+        """
+        if self.task is None:
+            return None
+        awaitable = self.task.get_coro()
+        stack = None
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                # A future or another awaitable without a frame: the bottom of the chain
+                break
+            if stack is not None:
+                stack.append(frame_name(frame.f_code))
+            elif frame is self.marker:
+                stack = []
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return stack + ["[await]"] if stack is not None else None
+
+    def record_sql(self, statement: str, seconds: float, executemany: bool):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append({
+                "statement": " ".join(statement.split()),
+                "ms": round(seconds * 1000, 3),
+                "executemany": executemany,
+            })
+
+    def save(self, directory: str = PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        root = f"{self.method} {self.path}"
+        with open(os.path.join(directory, f"{self.id}.folded"), "w") as folded:
+            for stack, count in self.samples.most_common():
+                folded.write(f"{root};{stack} {count}\n" if stack else f"{root} {count}\n")
+        with open(os.path.join(directory, f"{self.id}.json"), "w") as summary:
+            json.dump({
+                "id": self.id,
+                "method": self.method,
+                "path": self.path,
+                "status": self.status,
+                "duration_ms": round(self.duration * 1000, 3),
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "samples": sum(self.samples.values()),
+                "sql": {
+                    "count": self.sql_count,
+                    "total_ms": round(self.sql_seconds * 1000, 3),
+                    "statements": self.statements,
+                },
+            }, summary, indent=2)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_profile.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active_profile.get()
+    started = conn.info.get("profile_started")
+    if profile is not None and started:
+        profile.record_sql(statement, time.perf_counter() - started.pop(), executemany)
+
+
+def _install_sql_hooks():
+    """Engine-wide statement timing, only installed once something is profiled."""
+    global _sql_hooks_installed
+    with _sql_hooks_lock:
+        if not _sql_hooks_installed:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            _sql_hooks_installed = True
+
+
+def profile_requested(scope) -> bool:
+    """Sampled, or asked for by an admin through the profile header."""
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return True
+    token = next((value for name, value in scope["headers"] if name == PROFILE_HEADER), None)
+    if not token:
+        return False
+    try:
+        decode_jwt_token(token.decode("latin-1"), AdminSchema)
+    except Exception:
+        return False
+    return True
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the HTTP requests picked by profile_requested."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profile_requested(scope):
+            return await self.app(scope, receive, send)
+        await self._profile(scope, receive, send)
+
+    async def _profile(self, scope, receive, send):
+        _install_sql_hooks()
+        profile = RequestProfile(scope["method"], scope["path"], sys._getframe(), asyncio.current_task())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", ()), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        token = _active_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.stop()
+            _active_profile.reset(token)
+            try:
+                await asyncio.to_thread(profile.save)
+                logger.info(
+                    f"Profiled {profile.method} {profile.path} as {profile.id}: {profile.duration * 1000:.1f} ms, "
+                    f"{profile.sql_count} statements in {profile.sql_seconds * 1000:.1f} ms"
+                )
+            except OSError as e:
+                logger.error(f"Could not save profile {profile.id}: {e}")
@@ -0,0 +1,154 @@
+"""
+Sliding-window rate limits for unauthenticated endpoints, checked in one atomic Redis script.
+
+Requests are counted per client IP and per identity from the JSON body: every key other than "ip"
+names a body field (email, work_id, username), so guessing one account's OTP from many addresses
+is limited as well. Limits are written "<requests>/<seconds>", several separated by commas, and can
+be overridden per route and key with RATE_LIMIT_<ROUTE>_<KEY> (e.g. RATE_LIMIT_LOGIN_EMAIL="3/60,10/3600").
+"""
+import math
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, Request, status
+from services.logger import logger
+from services.redis_client import get_async_redis_client
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Only behind a proxy that sets X-Forwarded-For, otherwise clients could pick their own key
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+# Default limits per route and key kind
+RATE_LIMITS: Dict[str, Dict[str, str]] = {
+    "login": {"ip": "20/60,100/3600", "email": "5/60,20/3600", "work_id": "5/60,20/3600"},
+    "resend-otp": {"ip": "10/60,50/3600", "email": "3/60,10/3600"},
+    # A 6-digit OTP lives 10 minutes, these keep guessing it far out of reach
+    "verify-otp": {"ip": "20/60,100/3600", "email": "5/60,20/3600"},
+    "admin-login": {"ip": "10/60,50/3600", "email": "3/60,10/3600", "username": "3/60,10/3600"},
+    "admin-verify-otp": {"ip": "10/60,50/3600", "email": "5/60,20/3600"},
+}
+
+# KEYS: one sorted set of request times per limit
+# ARGV: request id, then limit and window (ms) for each key
+# Returns 0 when the request is admitted, otherwise milliseconds until it would be
+SLIDING_WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 * i])
+    local window = tonumber(ARGV[2 * i + 1])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local count = redis.call('ZCARD', key)
+    if count >= limit then
+        -- The request fits once enough of the oldest entries have left the window
+        local oldest = redis.call('ZRANGE', key, count - limit, count - limit, 'WITHSCORES')
+        retry_after = math.max(retry_after, tonumber(oldest[2]) + window - now)
+    end
+end
+if retry_after > 0 then
+    return retry_after
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[1])
+    redis.call('PEXPIRE', key, ARGV[2 * i + 1])
+end
+return 0
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimit:
+    limit: int
+    window: int
+
+
+def parse_limits(value: str) -> List[RateLimit]:
+    limits = []
+    for part in value.split(","):
+        if part.strip():
+            limit, window = part.split("/")
+            limits.append(RateLimit(int(limit), int(window)))
+    return limits
+
+
+def route_limits(route: str) -> Dict[str, List[RateLimit]]:
+    env_prefix = "RATE_LIMIT_" + route.upper().replace("-", "_")
+    return {
+        kind: parse_limits(os.getenv(f"{env_prefix}_{kind.upper()}", default))
+        for kind, default in RATE_LIMITS[route].items()
+    }
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_async_redis_client()
+        self.script = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+    async def hit(self, route: str, identities: Dict[str, Optional[str]], limits: Dict[str, List[RateLimit]]) -> float:
+        """Record one request against every limit; returns 0 if admitted, else seconds to wait."""
+        keys, args = [], [uuid.uuid4().hex]
+        for kind, identity in identities.items():
+            if not identity:
+                continue
+            for rate in limits.get(kind, ()):
+                keys.append(f"ratelimit:{route}:{kind}:{identity}:{rate.window}")
+                args.extend((rate.limit, rate.window * 1000))
+        if not keys:
+            return 0
+        return int(await self.script(keys=keys, args=args)) / 1000
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit(route: str):
+    """
+    Dependency rejecting a request with 429 once its client IP or an identity in its JSON body
+    exceeds the route's limits. Declare it in the route's `dependencies` so it runs first.
+    """
+    limits = route_limits(route)
+    fields = [kind for kind in limits if kind != "ip"]
+
+    async def dependency(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            body = {}
+
+        identities = {"ip": client_ip(request)}
+        for field in fields:
+            value = body.get(field)
+            identities[field] = str(value).strip().lower() if value else None
+        try:
+            retry_after = await rate_limiter.hit(route, identities, limits)
+        except Exception as e:
+            # Fail open, a Redis outage should not lock everyone out of logging in
+            logger.error(f"Rate limiter unavailable for {route}: {e}")
+            return
+
+        if retry_after:
+            logger.warning(f"Rate limited {route} for {identities}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    return Depends(dependency)
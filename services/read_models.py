@@ -0,0 +1,194 @@
+"""
+Read models for the listing endpoints.
+
+Each query selects only the columns a response needs with Core select(), so rows come back as
+plain tuples: no ORM entities, identity-map bookkeeping or relationship state on read-only paths.
+"""
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Collection, List, Optional, Sequence
+from sqlalchemy import Row, select, true, tuple_
+from sqlalchemy.orm import Session
+from models import ChatMessage, ChatRoom, Hospital, MessageSender, Participant, User
+
+
+@dataclass(slots=True)
+class MessageSummary:
+    id: uuid.UUID
+    content: str
+    timestamp: datetime
+    sender: Optional[dict]
+
+
+@dataclass(slots=True)
+class InboxRoom:
+    room_id: str
+    room_name: str
+    created_at: datetime
+    last_message: Optional[MessageSummary] = None
+    participants: List[dict] = field(default_factory=list)
+
+
+def list_hospitals(db: Session) -> Sequence[Row]:
+    return db.execute(
+        select(
+            Hospital.hospital_id,
+            Hospital.name,
+            Hospital.email,
+            Hospital.phone_number,
+            Hospital.location,
+        )
+    ).all()
+
+
+def list_users(
+    db: Session,
+    hospital_ids: Optional[Collection[str]] = None,
+    exclude_hospital_ids: Collection[str] = (),
+) -> Sequence[Row]:
+    # hospital_id in the User model is a foreign key (int), the readable 'hospital_id' string is joined in
+    stmt = select(
+        User.work_id,
+        User.first_name,
+        User.last_name,
+        User.email,
+        User.occupation,
+        User.department,
+        Hospital.hospital_id,
+    ).join(User.hospital)
+    if hospital_ids is not None:
+        stmt = stmt.where(Hospital.hospital_id.in_(hospital_ids))
+    if exclude_hospital_ids:
+        stmt = stmt.where(Hospital.hospital_id.not_in(exclude_hospital_ids))
+    return db.execute(stmt).all()
+
+
+def get_users_by_ids(db: Session, user_ids: Sequence[int]) -> Sequence[Row]:
+    """Users by primary key in one IN query, with their readable hospital_id."""
+    return db.execute(
+        select(
+            User.id,
+            User.work_id,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.occupation,
+            User.department,
+            Hospital.hospital_id,
+        ).join(User.hospital).where(User.id.in_(user_ids))
+    ).all()
+
+
+def get_hospitals_by_ids(db: Session, hospital_ids: Sequence[str]) -> Sequence[Row]:
+    """Hospitals by readable hospital_id in one IN query."""
+    return db.execute(
+        select(
+            Hospital.hospital_id,
+            Hospital.name,
+            Hospital.email,
+            Hospital.phone_number,
+            Hospital.location,
+        ).where(Hospital.hospital_id.in_(hospital_ids))
+    ).all()
+
+
+def get_user_id(db: Session, work_id: str) -> Optional[int]:
+    return db.execute(select(User.id).where(User.work_id == work_id)).scalar()
+
+
+def is_room_participant(db: Session, room_id: str, user_id: int) -> bool:
+    return db.execute(
+        select(Participant.id).where(
+            Participant.room_id == room_id,
+            Participant.participant_id == user_id,
+            Participant.participant_type == User.__name__,
+        )
+    ).first() is not None
+
+
+def list_user_chats(db: Session, user_id: int, room_ids: Optional[Sequence[str]] = None) -> List[InboxRoom]:
+    """
+    The user's rooms, most recently active first, each with its last message and participants.
+    Pass the room ids when they are already known (membership index) to skip the participants join.
+    """
+    # Latest message per room through the (room_id, timestamp) index, instead of loading every message
+    last_message = (
+        select(ChatMessage.id, ChatMessage.content, ChatMessage.timestamp, MessageSender.sender_id, MessageSender.sender_type)
+        .outerjoin(MessageSender, MessageSender.message_id == ChatMessage.id)
+        .where(ChatMessage.room_id == ChatRoom.id)
+        .order_by(ChatMessage.timestamp.desc())
+        .limit(1)
+        .lateral("last_message")
+    )
+
+    stmt = select(ChatRoom.id, ChatRoom.name, ChatRoom.created_at, last_message)
+    if room_ids is None:
+        stmt = stmt.join(Participant, Participant.room_id == ChatRoom.id).where(
+            Participant.participant_id == user_id, Participant.participant_type == User.__name__
+        )
+    elif not room_ids:
+        return []
+    else:
+        stmt = stmt.where(ChatRoom.id.in_(room_ids))
+
+    rows = db.execute(
+        stmt.outerjoin(last_message, true()).order_by(last_message.c.timestamp.desc().nulls_last())
+    ).all()
+
+    rooms = {}
+    for room_id, room_name, created_at, message_id, content, timestamp, sender_id, sender_type in rows:
+        rooms[room_id] = InboxRoom(
+            room_id=room_id,
+            room_name=room_name,
+            created_at=created_at,
+            last_message=MessageSummary(
+                id=message_id,
+                content=content,
+                timestamp=timestamp,
+                sender={"id": sender_id, "type": sender_type} if sender_id is not None else None,
+            ) if message_id is not None else None,
+        )
+
+    if rooms:
+        members = db.execute(
+            select(Participant.room_id, Participant.participant_id, Participant.participant_type)
+            .where(Participant.room_id.in_(rooms))
+        ).all()
+        for room_id, participant_id, participant_type in members:
+            rooms[room_id].participants.append({"participant_id": participant_id, "participant_type": participant_type})
+
+    return list(rooms.values())
+
+
+def list_room_messages(
+    db: Session,
+    room_id: str,
+    before: Optional[datetime] = None,
+    limit: int = 50,
+    before_id: Optional[uuid.UUID] = None,
+) -> Sequence[Row]:
+    """
+    One page of room history, newest first; pass the timestamp and id of the oldest message of a
+    page as `before` and `before_id` for the next. Without `before_id` every message sharing the
+    `before` timestamp is skipped.
+    """
+    stmt = (
+        select(
+            ChatMessage.id,
+            ChatMessage.content,
+            ChatMessage.timestamp,
+            MessageSender.sender_id,
+            MessageSender.sender_type,
+        )
+        .outerjoin(MessageSender, MessageSender.message_id == ChatMessage.id)
+        .where(ChatMessage.room_id == room_id)
+        .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+        .limit(limit)
+    )
+    if before is not None and before_id is not None:
+        # Same (timestamp, id) order as the page, so messages sharing the boundary timestamp are kept
+        stmt = stmt.where(tuple_(ChatMessage.timestamp, ChatMessage.id) < tuple_(before, before_id))
+    elif before is not None:
+        stmt = stmt.where(ChatMessage.timestamp < before)
+    return db.execute(stmt).all()
@@ -1,6 +1,34 @@
+import os
 import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "fakeredis://" runs against an in-process fake, for local load tests without a Redis server
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_fake_server = None
+
+def _get_fake_server():
+    global _fake_server
+    if _fake_server is None:
+        import fakeredis
+        _fake_server = fakeredis.FakeServer()
+    return _fake_server
 
 def get_redis_client():
-    pool = redis.ConnectionPool.from_url("redis://localhost:6379/0", decode_responses=True)
+    if REDIS_URL.startswith("fakeredis://"):
+        import fakeredis
+        return fakeredis.FakeRedis(server=_get_fake_server(), decode_responses=True)
+
+    pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
     client = redis.Redis(connection_pool=pool)
-    return client
\ No newline at end of file
+    return client
+
+def get_async_redis_client(decode_responses: bool = True):
+    if REDIS_URL.startswith("fakeredis://"):
+        import fakeredis
+        return fakeredis.FakeAsyncRedis(server=_get_fake_server(), decode_responses=decode_responses)
+
+    return aioredis.Redis.from_url(REDIS_URL, decode_responses=decode_responses)
@@ -0,0 +1,155 @@
+"""
+Incremental analytics rollups for the admin dashboard.
+
+    python -m services.rollups
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import Engine, select, text
+from models import RollupWatermark
+from services.logger import logger
+
+load_dotenv()
+
+# Watermarks under earlier names followed id order and are discarded, see refresh_rollups
+WATERMARK_NAME = "message_activity_by_time"
+# Messages folded per transaction
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", 50_000))
+# Messages younger than this are left for the next run, so rows still being committed are not skipped.
+# It must exceed the longest transaction writing messages.
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", 60))
+ROLLUP_INTERVAL = int(os.getenv("ROLLUP_INTERVAL", 60))
+
+# The watermark is the (timestamp, id) of the last folded message. Ids do not follow insert order
+# (legacy uuid4 rows sort above every UUIDv7), timestamps do once the settle lag has passed.
+# The plain timestamp bound lets Postgres prune old partitions.
+AFTER_WATERMARK = """
+    "timestamp" >= :last_timestamp AND "timestamp" < :until
+    AND ("timestamp", id) > (:last_timestamp, CAST(:last_id AS uuid))
+"""
+
+BATCH_BOUNDS_SQL = text(
+    f"""
+    SELECT id, "timestamp" FROM messages
+    WHERE {AFTER_WATERMARK}
+    ORDER BY "timestamp", id
+    OFFSET :offset LIMIT 1
+    """
+)
+
+LAST_MESSAGE_SQL = text(
+    f"""
+    SELECT id, "timestamp" FROM messages
+    WHERE {AFTER_WATERMARK}
+    ORDER BY "timestamp" DESC, id DESC LIMIT 1
+    """
+)
+
+FOLD_SQL = text(
+    """
+    WITH delta AS (
+        SELECT m."timestamp"::date AS day, u.id AS user_id, u.hospital_id, u.department, count(*) AS messages
+        FROM messages m
+        JOIN message_senders s ON s.message_id = m.id AND s.sender_type = 'User'
+        JOIN users u ON u.id = s.sender_id
+        WHERE m."timestamp" >= :last_timestamp AND m."timestamp" <= :upper_timestamp
+          AND (m."timestamp", m.id) > (:last_timestamp, CAST(:last_id AS uuid))
+          AND (m."timestamp", m.id) <= (:upper_timestamp, CAST(:upper_id AS uuid))
+        GROUP BY 1, 2, 3, 4
+    ),
+    activity AS (
+        INSERT INTO user_daily_activity (day, user_id, hospital_id, department, message_count)
+        SELECT day, user_id, hospital_id, department, messages FROM delta
+        ON CONFLICT (day, user_id) DO UPDATE
+            SET message_count = user_daily_activity.message_count + EXCLUDED.message_count
+        RETURNING day, user_id, (xmax = 0) AS first_activity
+    )
+    INSERT INTO department_daily_stats (day, hospital_id, department, message_count, active_users)
+    SELECT d.day, d.hospital_id, d.department, sum(d.messages), count(*) FILTER (WHERE a.first_activity)
+    FROM delta d
+    JOIN activity a ON a.day = d.day AND a.user_id = d.user_id
+    GROUP BY d.day, d.hospital_id, d.department
+    ON CONFLICT (day, hospital_id, department) DO UPDATE
+        SET message_count = department_daily_stats.message_count + EXCLUDED.message_count,
+            active_users = department_daily_stats.active_users + EXCLUDED.active_users
+    """
+)
+
+
+def refresh_rollups(engine: Engine, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """
+    Fold every message newer than the watermark into the daily rollups, one batch per transaction.
+    Each batch moves the watermark in the same transaction, so a message is never counted twice.
+    Without a watermark the rollups are rebuilt from the first message.
+    Returns the number of batches folded.
+    """
+    if engine.dialect.name != "postgresql":
+        return 0
+
+    until = datetime.now() - timedelta(seconds=ROLLUP_SETTLE_SECONDS)
+    batches = 0
+
+    while True:
+        with engine.begin() as conn:
+            # Several app workers run the refresher, only one folds a batch at a time
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": WATERMARK_NAME})
+            watermark = conn.execute(
+                select(RollupWatermark.last_message_id, RollupWatermark.last_timestamp)
+                .where(RollupWatermark.name == WATERMARK_NAME)
+            ).first()
+            if watermark:
+                last_id, last_timestamp = watermark
+            else:
+                # Counts folded under another watermark cannot be trusted to line up with this one
+                conn.execute(text("DELETE FROM user_daily_activity"))
+                conn.execute(text("DELETE FROM department_daily_stats"))
+                conn.execute(text("DELETE FROM rollup_watermarks"))
+                last_id, last_timestamp = uuid.UUID(int=0), datetime.min
+
+            # Raw SQL parameters, ids are passed as text and cast by Postgres
+            params = {"last_id": str(last_id), "last_timestamp": last_timestamp, "until": until}
+
+            # The last message of this batch, or the newest one if fewer than a full batch remain
+            bound = conn.execute(BATCH_BOUNDS_SQL, {**params, "offset": batch_size - 1}).first()
+            if bound is None:
+                bound = conn.execute(LAST_MESSAGE_SQL, params).first()
+            if bound is None:
+                return batches
+
+            upper_id, upper_timestamp = str(bound[0]), bound[1]
+            conn.execute(FOLD_SQL, {**params, "upper_id": upper_id, "upper_timestamp": upper_timestamp})
+
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO rollup_watermarks (name, last_message_id, last_timestamp, updated_at)
+                    VALUES (:name, :last_id, :last_timestamp, now())
+                    ON CONFLICT (name) DO UPDATE
+                        SET last_message_id = EXCLUDED.last_message_id,
+                            last_timestamp = EXCLUDED.last_timestamp,
+                            updated_at = EXCLUDED.updated_at
+                    """
+                ),
+                {"name": WATERMARK_NAME, "last_id": upper_id, "last_timestamp": upper_timestamp},
+            )
+        batches += 1
+        logger.info(f"Rolled up messages through {upper_timestamp}")
+
+
+async def run_rollup_refresher(engine: Engine, interval: int = ROLLUP_INTERVAL):
+    """Background task keeping the rollups at most `interval` seconds behind."""
+    while True:
+        try:
+            await asyncio.to_thread(refresh_rollups, engine)
+        except Exception as e:
+            logger.error(f"Analytics rollup refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    print(f"Folded {refresh_rollups(engine)} batches")
@@ -1,8 +1,17 @@
+import asyncio
 import os
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
+import socket
+import time
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Iterable, List, Optional
+import aiosmtplib
+from aiosmtplib import SMTPException, SMTPServerDisconnected
 from pydantic import EmailStr
-from jinja2 import Template
+from jinja2 import Environment, select_autoescape
 from dotenv import load_dotenv
+from services.logger import logger
 
 load_dotenv()
 
@@ -11,19 +20,13 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
 EMAIL_FROM_NAME = os.getenv("EMAIL_FROM_NAME", "DiagnoXis Support Team")
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=EMAIL_HOST_USER,
-    MAIL_PASSWORD=EMAIL_HOST_PASSWORD,
-    MAIL_FROM=EMAIL_HOST_USER,
-    MAIL_FROM_NAME=EMAIL_FROM_NAME,
-    MAIL_PORT=EMAIL_PORT,
-    MAIL_SERVER=EMAIL_HOST,
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
+EMAIL_STARTTLS = os.getenv("EMAIL_STARTTLS", "true").lower() in ("1", "true", "yes")
+EMAIL_VALIDATE_CERTS = os.getenv("EMAIL_VALIDATE_CERTS", "true").lower() in ("1", "true", "yes")
+EMAIL_TIMEOUT = float(os.getenv("EMAIL_TIMEOUT", 30))
+# Number of authenticated SMTP connections kept open and shared by all sends
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", 2))
+# Connections idle for longer than this are reopened, most servers drop them after a few minutes
+EMAIL_POOL_MAX_IDLE = float(os.getenv("EMAIL_POOL_MAX_IDLE", 120))
 
 EMAIL_TEMPLATE = """
 <!DOCTYPE html>
@@ -72,6 +75,165 @@ EMAIL_TEMPLATE = """
 </html>
 """
 
+# Compiled once at import, rendering per send only fills in the variables
+template_env = Environment(autoescape=select_autoescape(default_for_string=True))
+OTP_EMAIL_TEMPLATE = template_env.from_string(EMAIL_TEMPLATE)
+
+
+class _PooledConnection:
+    __slots__ = ("client", "last_used")
+
+    def __init__(self):
+        self.client: Optional[aiosmtplib.SMTP] = None
+        self.last_used = 0.0
+
+
+class SMTPConnectionPool:
+    """
+    A fixed set of long-lived, authenticated SMTP connections reused across sends.
+    Connections are opened lazily and reopened when the server dropped them or they sat idle too long.
+    """
+
+    def __init__(self, size: int = EMAIL_POOL_SIZE, max_idle: float = EMAIL_POOL_MAX_IDLE, **smtp_kwargs):
+        self.size = size
+        self.max_idle = max_idle
+        self.smtp_kwargs = smtp_kwargs
+        self.connects = 0
+        self._slots: List[_PooledConnection] = []
+        self._idle: Optional[asyncio.LifoQueue] = None
+        self._loop = None
+
+    def _queue(self) -> asyncio.LifoQueue:
+        loop = asyncio.get_running_loop()
+        if self._idle is None or self._loop is not loop:
+            # Connections are bound to the loop that opened them, start over on a new loop
+            self._abandon_slots()
+            self._slots = [_PooledConnection() for _ in range(self.size)]
+            self._idle = asyncio.LifoQueue()
+            for slot in self._slots:
+                self._idle.put_nowait(slot)
+            self._loop = loop
+        return self._idle
+
+    def _abandon_slots(self):
+        """Close the previous loop's connections, which cannot be used or QUIT from another loop."""
+        for slot in self._slots:
+            client, slot.client = slot.client, None
+            transport = client.transport if client is not None else None
+            if transport is None:
+                continue
+            if self._loop is not None and self._loop.is_running():
+                self._loop.call_soon_threadsafe(client.close)
+                continue
+            # A stopped loop never runs the transport's close callbacks, end the TCP connection directly
+            sock = transport.get_extra_info("socket")
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    async def _connected(self, slot: _PooledConnection) -> aiosmtplib.SMTP:
+        client = slot.client
+        stale = time.monotonic() - slot.last_used > self.max_idle
+        if client is not None and client.is_connected and not stale:
+            return client
+
+        await self._discard(slot)
+        client = aiosmtplib.SMTP(**self.smtp_kwargs)
+        # connect() runs STARTTLS and AUTH as configured, once per connection instead of once per email
+        try:
+            await client.connect()
+        except Exception:
+            client.close()
+            raise
+        self.connects += 1
+        slot.client = client
+        return client
+
+    async def _discard(self, slot: _PooledConnection):
+        client, slot.client = slot.client, None
+        if client is not None and client.is_connected:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+
+    @asynccontextmanager
+    async def _checkout(self):
+        queue = self._queue()
+        slot = await queue.get()
+        try:
+            yield slot
+        finally:
+            slot.last_used = time.monotonic()
+            queue.put_nowait(slot)
+
+    async def _send(self, slot: _PooledConnection, message: EmailMessage):
+        opened = slot.client
+        client = await self._connected(slot)
+        try:
+            return await client.send_message(message)
+        except (SMTPServerDisconnected, ConnectionError):
+            # Only a connection that sat in the pool can have been closed by the server in the meantime;
+            # a fresh one failing (or failing to open, SMTPConnectError) is not retried
+            if client is not opened:
+                raise
+            logger.info("SMTP connection dropped, reconnecting")
+            await self._discard(slot)
+            client = await self._connected(slot)
+            return await client.send_message(message)
+
+    async def send_message(self, message: EmailMessage):
+        async with self._checkout() as slot:
+            return await self._send(slot, message)
+
+    async def send_messages(self, messages: Iterable[EmailMessage]) -> List[Optional[Exception]]:
+        """
+        Send many messages over a single pooled connection.
+        Returns one entry per message: None when it was accepted, otherwise the SMTP or connection error.
+        """
+        results = []
+        unreachable = None
+        async with self._checkout() as slot:
+            for message in messages:
+                if unreachable is not None:
+                    results.append(unreachable)
+                    continue
+                try:
+                    await self._send(slot, message)
+                    results.append(None)
+                except (SMTPException, OSError) as e:
+                    results.append(e)
+                    if slot.client is None:
+                        # No connection could be opened, the rest of the batch would only wait for the same error
+                        unreachable = e
+        return results
+
+    async def close(self):
+        for slot in self._slots:
+            await self._discard(slot)
+
+
+smtp_pool = SMTPConnectionPool(
+    hostname=EMAIL_HOST,
+    port=EMAIL_PORT,
+    username=EMAIL_HOST_USER or None,
+    password=EMAIL_HOST_PASSWORD or None,
+    start_tls=EMAIL_STARTTLS,
+    validate_certs=EMAIL_VALIDATE_CERTS,
+    timeout=EMAIL_TIMEOUT,
+)
+
+
+def build_message(recipient: str, subject: str, html_content: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = formataddr((EMAIL_FROM_NAME, EMAIL_HOST_USER))
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(html_content, subtype="html")
+    return message
+
 def validate_email_content(email: EmailStr) -> bool:
     """Validate email for basic security (checks for XSS or injection)"""
     if not email:
@@ -92,22 +254,15 @@ async def send_otp_email(recipient: EmailStr, otp_code: str):
     if not validate_email_content(recipient):
         raise ValueError("Invalid or unsafe email address provided")
 
-    # Render the email HTML template with Jinja2
-    template = Template(EMAIL_TEMPLATE)
-    html_content = template.render(otp_code=otp_code)
+    # Render the precompiled email HTML template
+    html_content = OTP_EMAIL_TEMPLATE.render(otp_code=otp_code)
 
     # Prepare message
-    message = MessageSchema(
-        subject="Your OTP Code – DiagnoXis",
-        recipients=[recipient],
-        body=html_content,
-        subtype="html",
-    )
-
-    # Send email
-    fm = FastMail(conf)
+    message = build_message(recipient, "Your OTP Code – DiagnoXis", html_content)
+
+    # Send email over a pooled connection
     try:
-        await fm.send_message(message)
+        await smtp_pool.send_message(message)
         return {"status": "success", "message": f"OTP sent successfully to {recipient}"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,35 @@
+from typing import Any, List, Sequence
+from fastapi import responses
+from pydantic import TypeAdapter
+from schemas.admins_schema import DailyActivitySchema
+from schemas.chats_schema import RoomMessageSchema
+from schemas.hospitals_schema import HospitalBase
+from schemas.users_schema import UserSchema
+
+
+class ORJSONResponse(responses.ORJSONResponse):
+    """FastAPI's orjson response that also sends pre-serialized bytes as-is."""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return super().render(content)
+
+
+# Built once at import so the validator/serializer schemas are not rebuilt per request
+user_list_adapter = TypeAdapter(List[UserSchema])
+hospital_list_adapter = TypeAdapter(List[HospitalBase])
+daily_activity_list_adapter = TypeAdapter(List[DailyActivitySchema])
+room_message_list_adapter = TypeAdapter(List[RoomMessageSchema])
+
+
+def dump_rows(adapter: TypeAdapter, rows: Sequence[Any]) -> bytes:
+    """
+    Validate Core rows or ORM objects and serialize them to JSON bytes in one pass.
+    The result should be returned in an ORJSONResponse so FastAPI does not validate it a second time.
+    """
+    fields = getattr(rows[0], "_fields", None) if rows else None
+    if fields is not None:
+        # Core rows are zipped into dicts, much cheaper to validate than reading each field by attribute
+        return adapter.dump_json(adapter.validate_python([dict(zip(fields, row)) for row in rows]))
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
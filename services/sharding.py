@@ -0,0 +1,335 @@
+"""
+Per-hospital tenant routing across database shards.
+
+The hospital_shards table on the default database maps a hospital to the shard holding its users,
+chat rooms, messages and participants; hospitals without a row live on the default shard. Extra
+shards are configured with SHARD_DATABASE_URLS="name=url,name=url". Their order must not change:
+a shard's position fixes the residue of the integer ids it hands out, so ids stay unique across
+shards and rows keep them when a hospital is moved.
+
+    python -m services.sharding list
+    python -m services.sharding move HOSP-38A2E9A1 shard1 [--keep-source] [--no-wait]
+"""
+import argparse
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import Engine, delete, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from database import build_engine, engine, read_engine
+from models import (
+    Base,
+    ChatMessage,
+    ChatRoom,
+    DepartmentDailyStats,
+    Hospital,
+    HospitalShard,
+    MessageSender,
+    Participant,
+    User,
+    UserDailyActivity,
+)
+from services.logger import logger
+from services.partitions import create_partition, ensure_message_partitions, is_partitioned, list_partitions
+
+load_dotenv()
+
+DEFAULT_SHARD = "default"
+SHARD_DATABASE_URLS = os.getenv("SHARD_DATABASE_URLS", "")
+# Ids of shard n are n modulo the stride, so at most this many shards can exist
+SHARD_ID_STRIDE = int(os.getenv("SHARD_ID_STRIDE", 16))
+# How long a worker trusts a cached route; moves wait this long between their steps
+SHARD_ROUTE_TTL = float(os.getenv("SHARD_ROUTE_TTL", 30))
+MOVE_BATCH_SIZE = 5000
+
+# Tables whose serial ids are interleaved across shards
+STRIDED_TABLES = ("users", "participants", "message_senders", "change_log")
+
+
+class TenantReadOnly(Exception):
+    """The hospital is being moved between shards and does not accept writes."""
+
+
+def parse_shard_urls(value: str) -> Dict[str, str]:
+    shards = {}
+    for part in value.split(","):
+        if part.strip():
+            name, url = part.split("=", 1)
+            shards[name.strip()] = url.strip()
+    return shards
+
+
+class TenantRouter:
+    def __init__(self, default_engine: Engine, default_read_engine: Engine, shard_urls: Dict[str, str]):
+        self.engines: Dict[str, Engine] = {DEFAULT_SHARD: default_engine}
+        for name, url in shard_urls.items():
+            self.engines[name] = build_engine(url)
+        self.default_read_engine = default_read_engine
+        # hospital_id -> (shard, read_only, expires at)
+        self._routes: Dict[str, Tuple[str, bool, float]] = {}
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.engines) > 1
+
+    def route(self, hospital_id: Optional[str]) -> Tuple[str, bool]:
+        """(shard, read_only) of a hospital, cached for SHARD_ROUTE_TTL seconds."""
+        if not self.sharded or not hospital_id:
+            return DEFAULT_SHARD, False
+
+        now = time.monotonic()
+        cached = self._routes.get(hospital_id)
+        if cached is not None and cached[2] > now:
+            return cached[0], cached[1]
+
+        with self.engines[DEFAULT_SHARD].connect() as conn:
+            row = conn.execute(
+                select(HospitalShard.shard, HospitalShard.read_only).where(HospitalShard.hospital_id == hospital_id)
+            ).first()
+        shard, read_only = (row.shard, row.read_only) if row is not None else (DEFAULT_SHARD, False)
+        if shard not in self.engines:
+            # Serving from the wrong shard would silently show another tenant's view of the data
+            raise RuntimeError(f"Hospital {hospital_id} is routed to unknown shard {shard}")
+
+        self._routes[hospital_id] = (shard, read_only, now + SHARD_ROUTE_TTL)
+        return shard, read_only
+
+    def shard_of(self, bind: Engine) -> str:
+        """Name of the shard an engine belongs to; the replica and engines built outside the router count as default."""
+        for name, shard_engine in self.engines.items():
+            if shard_engine is bind:
+                return name
+        return DEFAULT_SHARD
+
+    def forget(self, hospital_id: str):
+        self._routes.pop(hospital_id, None)
+
+    def engine_for(self, hospital_id: Optional[str]) -> Engine:
+        return self.engines[self.route(hospital_id)[0]]
+
+    def read_engine_for(self, hospital_id: Optional[str]) -> Engine:
+        """The read replica for tenants on the default shard, the shard itself otherwise."""
+        shard = self.route(hospital_id)[0]
+        return self.default_read_engine if shard == DEFAULT_SHARD else self.engines[shard]
+
+    @contextmanager
+    def session(self, hospital_id: Optional[str], write: bool = True) -> Iterator[Session]:
+        shard, read_only = self.route(hospital_id)
+        if write and read_only:
+            raise TenantReadOnly(hospital_id)
+        with Session(self.engines[shard]) as session:
+            yield session
+
+    def id_residue(self, hospital_id: Optional[str]) -> Optional[int]:
+        """Residue modulo SHARD_ID_STRIDE of the ids the tenant's shard hands out, None when ids are not strided."""
+        shard = self.route(hospital_id)[0]
+        if not self.sharded or self.engines[shard].dialect.name != "postgresql":
+            return None
+        return list(self.engines).index(shard)
+
+    def hospitals_off_default(self) -> Set[str]:
+        if not self.sharded:
+            return set()
+        with self.engines[DEFAULT_SHARD].connect() as conn:
+            return set(conn.execute(
+                select(HospitalShard.hospital_id).where(HospitalShard.shard != DEFAULT_SHARD)
+            ).scalars())
+
+    def hospitals_by_shard(self) -> Dict[str, Set[str]]:
+        """Hospitals routed to each extra shard; the rest live on the default shard."""
+        if not self.sharded:
+            return {}
+        with self.engines[DEFAULT_SHARD].connect() as conn:
+            routes = conn.execute(
+                select(HospitalShard.hospital_id, HospitalShard.shard).where(HospitalShard.shard != DEFAULT_SHARD)
+            ).all()
+        shards: Dict[str, Set[str]] = {}
+        for hospital_id, shard in routes:
+            shards.setdefault(shard, set()).add(hospital_id)
+        return shards
+
+    def init_shards(self):
+        """Create the schema and message partitions on every extra shard and interleave their ids."""
+        for name, shard_engine in self.engines.items():
+            if name != DEFAULT_SHARD:
+                Base.metadata.create_all(bind=shard_engine)
+                ensure_message_partitions(shard_engine)
+        if self.sharded:
+            self.configure_id_sequences()
+
+    def configure_id_sequences(self):
+        """
+        Make shard n hand out ids congruent to n modulo SHARD_ID_STRIDE, starting above every id
+        in use on any shard. Sequences that already use the stride are left alone.
+        """
+        for table in STRIDED_TABLES:
+            floor = 0
+            for shard_engine in self.engines.values():
+                with shard_engine.connect() as conn:
+                    floor = max(floor, conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar())
+
+            for index, (name, shard_engine) in enumerate(self.engines.items()):
+                if shard_engine.dialect.name != "postgresql":
+                    continue
+                with shard_engine.begin() as conn:
+                    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+                    increment = conn.execute(
+                        text("SELECT increment_by FROM pg_sequences WHERE schemaname || '.' || sequencename = :sequence"),
+                        {"sequence": sequence},
+                    ).scalar()
+                    if increment == SHARD_ID_STRIDE:
+                        continue
+                    start = floor + 1 + (index - floor - 1) % SHARD_ID_STRIDE
+                    conn.execute(text(f"ALTER SEQUENCE {sequence} INCREMENT BY {SHARD_ID_STRIDE} RESTART WITH {start}"))
+                    logger.info(f"Shard {name}: {table} ids now start at {start}, step {SHARD_ID_STRIDE}")
+
+
+tenant_router = TenantRouter(engine, read_engine, parse_shard_urls(SHARD_DATABASE_URLS))
+
+
+def _insert(target: Engine, table):
+    dialect = postgresql if target.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table).on_conflict_do_nothing()
+
+
+def _copy_rows(source_conn, target_conn, table, stmt) -> int:
+    copied = 0
+    result = source_conn.execution_options(yield_per=MOVE_BATCH_SIZE).execute(stmt)
+    for batch in result.partitions():
+        # Re-running an interrupted move skips the rows that already made it
+        target_conn.execute(_insert(target_conn.engine, table), [dict(row._mapping) for row in batch])
+        copied += len(batch)
+    return copied
+
+
+def _set_route(hospital_id: str, shard: str, read_only: bool):
+    with Session(tenant_router.engines[DEFAULT_SHARD]) as db:
+        route = db.get(HospitalShard, hospital_id)
+        if route is None:
+            db.add(HospitalShard(hospital_id=hospital_id, shard=shard, read_only=read_only))
+        else:
+            route.shard, route.read_only = shard, read_only
+        db.commit()
+    tenant_router.forget(hospital_id)
+
+
+def move_hospital(hospital_id: str, target: str, keep_source: bool = False, wait: bool = True) -> Dict[str, int]:
+    """
+    Move a hospital's users, rooms, messages and rollups to another shard:
+    freeze writes, copy, switch the route, then delete the source rows once no worker reads them.
+    """
+    if target not in tenant_router.engines:
+        raise ValueError(f"Unknown shard {target}")
+    source, _ = tenant_router.route(hospital_id)
+    if source == target:
+        return {}
+    source_engine, target_engine = tenant_router.engines[source], tenant_router.engines[target]
+
+    _set_route(hospital_id, source, read_only=True)
+    if wait:
+        # Until every worker's cached route expired, some may still accept writes on the source
+        time.sleep(SHARD_ROUTE_TTL)
+
+    Base.metadata.create_all(bind=target_engine)
+    copied: Dict[str, int] = {}
+    with source_engine.connect() as source_conn, target_engine.begin() as target_conn:
+        hospital = source_conn.execute(select(Hospital).where(Hospital.hospital_id == hospital_id)).first()
+        if hospital is None:
+            raise ValueError(f"Hospital {hospital_id} not found on shard {source}")
+        hospital_pk = hospital.id
+
+        if is_partitioned(source_engine) and is_partitioned(target_engine):
+            for _, month in list_partitions(source_conn):
+                create_partition(target_conn, month)
+
+        hospital_users = select(User.id).where(User.hospital_id == hospital_pk)
+        member_rooms = select(Participant.room_id).where(
+            Participant.participant_type == User.__name__, Participant.participant_id.in_(hospital_users)
+        )
+        # Rooms with members of other hospitals stay where they are, moving them would take them away from those members
+        shared_rooms = select(Participant.room_id).where(
+            Participant.room_id.in_(member_rooms),
+            (Participant.participant_type != User.__name__) | Participant.participant_id.not_in(hospital_users),
+        )
+        room_ids = list(source_conn.execute(member_rooms.except_(shared_rooms)).scalars())
+        shared_room_ids = list(source_conn.execute(shared_rooms.distinct()).scalars())
+        if shared_room_ids:
+            logger.warning(f"{hospital_id}: {len(shared_room_ids)} rooms shared with other hospitals stay on {source}")
+        # Parents before children, so the target's foreign keys hold at every step
+        steps = [
+            (Hospital, Hospital.id == hospital_pk),
+            (User, User.hospital_id == hospital_pk),
+            (ChatRoom, ChatRoom.id.in_(room_ids)),
+            (Participant, Participant.room_id.in_(room_ids)),
+            (ChatMessage, ChatMessage.room_id.in_(room_ids)),
+            (MessageSender, MessageSender.message_id.in_(select(ChatMessage.id).where(ChatMessage.room_id.in_(room_ids)))),
+            (UserDailyActivity, UserDailyActivity.hospital_id == hospital_pk),
+            (DepartmentDailyStats, DepartmentDailyStats.hospital_id == hospital_pk),
+        ]
+        for model, condition in steps:
+            copied[model.__tablename__] = _copy_rows(source_conn, target_conn, model.__table__, select(model).where(condition))
+        memberships = source_conn.execute(
+            select(Participant.room_id, Participant.participant_type, Participant.participant_id).where(Participant.room_id.in_(room_ids))
+        ).all()
+        work_ids = list(source_conn.execute(select(User.work_id).where(User.hospital_id == hospital_pk)).scalars())
+
+    _set_route(hospital_id, target, read_only=False)
+    # The copy skipped the session hooks, and members are qualified by their shard in the Redis index
+    from services.memberships import member_ref, membership_index
+    membership_index.apply(added=[(room_id, member_ref(target, kind, member_id)) for room_id, kind, member_id in memberships])
+    logger.info(f"Moved {hospital_id} from {source} to {target}: {copied}")
+
+    if not keep_source:
+        if wait:
+            # Workers holding the old route keep reading the source until it expires
+            time.sleep(SHARD_ROUTE_TTL)
+        with source_engine.begin() as conn:
+            for model, condition in reversed(steps):
+                # The default shard keeps every hospital row, it backs the hospital listing
+                if model is Hospital and source == DEFAULT_SHARD:
+                    continue
+                conn.execute(delete(model.__table__).where(condition))
+        membership_index.apply(removed=[(room_id, member_ref(source, kind, member_id)) for room_id, kind, member_id in memberships])
+        membership_index.forget_users(source, work_ids)
+        logger.info(f"Deleted {hospital_id} rows from {source}")
+
+    # The default shard's user listing no longer includes (or now includes) this hospital's staff
+    from services.cache import query_cache
+    query_cache.invalidate(families=("user",))
+    return copied
+
+
+def list_routes() -> List[dict]:
+    with Session(tenant_router.engines[DEFAULT_SHARD]) as db:
+        return [
+            {"hospital_id": route.hospital_id, "shard": route.shard, "read_only": route.read_only}
+            for route in db.execute(select(HospitalShard).order_by(HospitalShard.hospital_id)).scalars()
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tenant shard routing")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("list", help="show hospitals routed away from the default shard")
+    move = subcommands.add_parser("move", help="move a hospital's data to another shard")
+    move.add_argument("hospital_id")
+    move.add_argument("shard")
+    move.add_argument("--keep-source", action="store_true", help="leave the copied rows on the source shard")
+    move.add_argument("--no-wait", action="store_true", help="skip the route TTL waits (only when no app workers are running)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print(f"shards: {', '.join(tenant_router.engines)}")
+        for route in list_routes():
+            print(f"{route['hospital_id']}: {route['shard']}{' (read only)' if route['read_only'] else ''}")
+    else:
+        tenant_router.init_shards()
+        for table, count in move_hospital(args.hospital_id, args.shard, args.keep_source, wait=not args.no_wait).items():
+            print(f"{table}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Bulk staff import from CSV.
+
+    python -m services.staff_import staff.csv [--dry-run]
+
+Expected header: work_id,first_name,last_name,email,occupation,department,hospital_id
+where hospital_id is the readable id (e.g. HOSP-38A2E9A1).
+"""
+import argparse
+import csv
+import io
+import re
+from typing import IO, Dict, Iterable, List
+from sqlalchemy import Engine, select, text
+from models import Hospital
+from services.cache import query_cache
+from services.logger import logger
+from services.sync import append_changes
+
+STAFF_COLUMNS = ("work_id", "first_name", "last_name", "email", "occupation", "department", "hospital_id")
+
+# Valid rows buffered before each COPY round trip
+IMPORT_BATCH_SIZE = 50_000
+# Per-row errors kept in the report, the total count is always exact
+MAX_REPORTED_ERRORS = 1000
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+STAGING_TABLE = "staff_import_staging"
+
+
+def _copy_batch(cursor, rows: List[tuple]):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {STAGING_TABLE} (line, {', '.join(STAFF_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def import_staff(engine: Engine, source: IO[str], dry_run: bool = False, excluded_hospitals: Iterable[str] = ()) -> dict:
+    """
+    Stream a staff CSV into a temporary staging table with COPY, then upsert it into users keyed by work_id.
+    Rows are validated while streaming; invalid rows are reported with their line number and skipped.
+    Rows of excluded_hospitals (those living on another shard than `engine`) are rejected.
+    """
+    excluded_hospitals = set(excluded_hospitals)
+    errors: List[dict] = []
+    error_count = 0
+    total_rows = 0
+
+    def reject(line: int, work_id, message: str):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line, "work_id": work_id or None, "error": message})
+
+    reader = csv.DictReader(source)
+    missing_columns = set(STAFF_COLUMNS) - set(reader.fieldnames or ())
+    if missing_columns:
+        reject(1, None, f"Missing columns: {', '.join(sorted(missing_columns))}")
+        return {"total_rows": 0, "imported": 0, "inserted": 0, "updated": 0, "error_count": error_count, "errors": errors}
+
+    with engine.connect() as conn:
+        # One lookup for every hospital instead of one per row
+        hospitals: Dict[str, int] = dict(conn.execute(select(Hospital.hospital_id, Hospital.id)).all())
+
+        conn.execute(text(
+            f"""
+            CREATE TEMP TABLE {STAGING_TABLE} (
+                line INTEGER NOT NULL,
+                work_id VARCHAR NOT NULL,
+                first_name VARCHAR NOT NULL,
+                last_name VARCHAR NOT NULL,
+                email VARCHAR NOT NULL,
+                occupation VARCHAR NOT NULL,
+                department VARCHAR NOT NULL,
+                hospital_id INTEGER NOT NULL
+            ) ON COMMIT DROP
+            """
+        ))
+        cursor = conn.connection.cursor()
+
+        seen_work_ids = set()
+        seen_emails = set()
+        batch: List[tuple] = []
+
+        for row in reader:
+            total_rows += 1
+            line = reader.line_num
+            values = {column: (row.get(column) or "").strip() for column in STAFF_COLUMNS}
+            work_id = values["work_id"]
+
+            empty = [column for column in STAFF_COLUMNS if not values[column]]
+            if empty:
+                reject(line, work_id, f"Missing value for {', '.join(empty)}")
+                continue
+
+            email = values["email"]
+            if not EMAIL_PATTERN.match(email):
+                reject(line, work_id, "Invalid email address")
+                continue
+
+            if values["hospital_id"] in excluded_hospitals:
+                reject(line, work_id, f"Hospital {values['hospital_id']} is not on this database shard")
+                continue
+            hospital_pk = hospitals.get(values["hospital_id"])
+            if hospital_pk is None:
+                reject(line, work_id, f"Unknown hospital {values['hospital_id']}")
+                continue
+
+            if work_id in seen_work_ids:
+                reject(line, work_id, "Duplicate work_id in file")
+                continue
+            if email in seen_emails:
+                reject(line, work_id, "Duplicate email in file")
+                continue
+            seen_work_ids.add(work_id)
+            seen_emails.add(email)
+
+            batch.append((
+                line, work_id, values["first_name"], values["last_name"], email,
+                values["occupation"], values["department"], hospital_pk,
+            ))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _copy_batch(cursor, batch)
+                batch = []
+
+        if batch:
+            _copy_batch(cursor, batch)
+
+        # An email already owned by a different work_id would abort the whole upsert, report those rows instead
+        conflicts = conn.execute(text(
+            f"""
+            DELETE FROM {STAGING_TABLE} s
+            USING users u
+            WHERE u.email = s.email AND u.work_id <> s.work_id
+            RETURNING s.line, s.work_id
+            """
+        )).all()
+        for line, work_id in sorted(conflicts):
+            reject(line, work_id, "Email already belongs to another user")
+
+        inserted, updated = conn.execute(text(
+            f"""
+            WITH upserted AS (
+                INSERT INTO users (work_id, first_name, last_name, email, occupation, department, hospital_id)
+                SELECT work_id, first_name, last_name, email, occupation, department, hospital_id
+                FROM {STAGING_TABLE}
+                ON CONFLICT (work_id) DO UPDATE SET
+                    first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name,
+                    email = EXCLUDED.email,
+                    occupation = EXCLUDED.occupation,
+                    department = EXCLUDED.department,
+                    hospital_id = EXCLUDED.hospital_id
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+            """
+        )).one()
+
+        # The staging table is dropped at the end of the transaction either way
+        if dry_run:
+            conn.rollback()
+        else:
+            staged = conn.execute(text(f"SELECT work_id FROM {STAGING_TABLE}")).scalars()
+            append_changes(conn, {("user", work_id): (False, None) for work_id in staged})
+            conn.commit()
+            # Raw SQL bypasses the session hooks, so cached user listings are invalidated here
+            query_cache.invalidate(families=("user",))
+
+    errors.sort(key=lambda error: error["line"])
+    logger.info(
+        f"Staff import{' (dry run)' if dry_run else ''}: {total_rows} rows, "
+        f"{inserted} inserted, {updated} updated, {error_count} rejected"
+    )
+    return {
+        "total_rows": total_rows,
+        "imported": inserted + updated,
+        "inserted": inserted,
+        "updated": updated,
+        "error_count": error_count,
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    import json
+    from database import engine
+    from services.sharding import tenant_router
+
+    parser = argparse.ArgumentParser(description="Import staff into the users table from a CSV file")
+    parser.add_argument("path")
+    parser.add_argument("--dry-run", action="store_true", help="validate and report without committing")
+    args = parser.parse_args()
+
+    with open(args.path, newline="", encoding="utf-8") as source:
+        print(json.dumps(import_staff(engine, source, dry_run=args.dry_run, excluded_hospitals=tenant_router.hospitals_off_default()), indent=2))
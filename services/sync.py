@@ -0,0 +1,334 @@
+"""
+Change feed for delta sync.
+
+Every committed change to a user, hospital, chat room, message or participant is appended to
+change_log, deletes included as tombstones. On Postgres each entry carries the id of the transaction
+that wrote it and cursors follow those ids, never passing the oldest transaction still running: a
+client resuming from its cursor never skips a change that committed later with a lower number, and
+writers don't wait on each other to append. SQLite runs one writer at a time, entry ids are the cursor.
+
+Entities are identified by the keys the listings expose (work_id, readable hospital_id, room id,
+message id, room and member), which are never updated in place.
+
+    python -m services.sync prune
+"""
+import argparse
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import BigInteger, Connection, Engine, String, and_, cast, delete, event, func, insert, or_, select, text, tuple_
+from sqlalchemy.orm import Session
+from models import ChangeLogEntry, ChatMessage, ChatRoom, Hospital, MessageSender, Participant, User
+from services.logger import logger
+from services.sharding import SHARD_ID_STRIDE, tenant_router
+
+load_dotenv()
+
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", 500))
+SYNC_MAX_PAGE_SIZE = int(os.getenv("SYNC_MAX_PAGE_SIZE", 2000))
+# Clients that have not synced for longer than this start over from the listings
+SYNC_RETENTION_DAYS = int(os.getenv("SYNC_RETENTION_DAYS", 30))
+SYNC_PRUNE_INTERVAL = int(os.getenv("SYNC_PRUNE_INTERVAL", 3600))
+PRUNE_BATCH_SIZE = 10_000
+# Transaction cursors start above any entry id handed out as a cursor before, so those are reset
+XACT_CURSOR_BASE = 2 ** 40
+
+# (entity, key) -> (deleted, room_id)
+Changes = Dict[Tuple[str, str], Tuple[bool, Optional[str]]]
+
+
+def participant_key(room_id: str, participant_type: str, participant_id: int) -> str:
+    return f"{room_id}:{participant_type}:{participant_id}"
+
+
+# (entity name, key, room_id) of a row of each synced model
+SYNCED_MODELS = {
+    User: lambda user: ("user", user.work_id, None),
+    Hospital: lambda hospital: ("hospital", hospital.hospital_id, None),
+    ChatRoom: lambda room: ("chat", room.id, room.id),
+    ChatMessage: lambda message: ("message", str(message.id), message.room_id),
+    Participant: lambda participant: (
+        "participant",
+        participant_key(participant.room_id, participant.participant_type, participant.participant_id),
+        participant.room_id,
+    ),
+}
+
+
+def record_changes(session: Session, changes: Iterable[Tuple[str, str, Optional[str]]], deleted: bool = False):
+    """Queue (entity, key, room_id) changes made with bulk statements (which skip the flush hooks) for the commit."""
+    pending: Changes = session.info.setdefault("sync_changes", {})
+    for entity, key, room_id in changes:
+        pending[(entity, key)] = (deleted, room_id)
+
+
+def append_changes(conn: Connection, changes: Changes):
+    """Append changes to the log inside the caller's transaction."""
+    if not changes:
+        return
+    stmt = insert(ChangeLogEntry)
+    if conn.dialect.name == "postgresql":
+        # Readers stop below the oldest transaction still running, so writers need no lock to keep commit order
+        stmt = stmt.values(xact_id=cast(cast(func.pg_current_xact_id(), String), BigInteger))
+    now = datetime.now()
+    conn.execute(stmt, [
+        {"entity": entity, "entity_key": key, "deleted": deleted, "room_id": room_id, "changed_at": now}
+        for (entity, key), (deleted, room_id) in changes.items()
+    ])
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, flush_context):
+    dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+    for objects, deleted in ((session.new, False), (dirty, False), (session.deleted, True)):
+        for obj in objects:
+            describe = SYNCED_MODELS.get(type(obj))
+            if describe is not None:
+                record_changes(session, (describe(obj),), deleted=deleted)
+
+
+@event.listens_for(Session, "before_commit")
+def _append_changes_on_commit(session: Session):
+    # The commit flushes after this hook, flush first so those changes are logged as well
+    session.flush()
+    changes = session.info.pop("sync_changes", None)
+    if changes:
+        append_changes(session.connection(), changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session: Session):
+    session.info.pop("sync_changes", None)
+
+
+def _load_users(db: Session, keys: Sequence[str]) -> Dict[str, dict]:
+    rows = db.execute(
+        select(
+            User.work_id,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.occupation,
+            User.department,
+            Hospital.hospital_id,
+        ).join(User.hospital).where(User.work_id.in_(keys))
+    ).all()
+    return {row.work_id: dict(row._mapping) for row in rows}
+
+
+def _load_hospitals(db: Session, keys: Sequence[str]) -> Dict[str, dict]:
+    rows = db.execute(
+        select(Hospital.hospital_id, Hospital.name, Hospital.email, Hospital.phone_number, Hospital.location)
+        .where(Hospital.hospital_id.in_(keys))
+    ).all()
+    return {row.hospital_id: dict(row._mapping) for row in rows}
+
+
+def _load_chats(db: Session, keys: Sequence[str]) -> Dict[str, dict]:
+    rows = db.execute(
+        select(ChatRoom.id.label("room_id"), ChatRoom.name.label("room_name"), ChatRoom.created_at)
+        .where(ChatRoom.id.in_(keys))
+    ).all()
+    return {row.room_id: dict(row._mapping) for row in rows}
+
+
+def _load_messages(db: Session, keys: Sequence[str]) -> Dict[str, dict]:
+    rows = db.execute(
+        select(
+            ChatMessage.id,
+            ChatMessage.room_id,
+            ChatMessage.content,
+            ChatMessage.timestamp,
+            MessageSender.sender_id,
+            MessageSender.sender_type,
+        )
+        .outerjoin(MessageSender, MessageSender.message_id == ChatMessage.id)
+        .where(ChatMessage.id.in_([uuid.UUID(key) for key in keys]))
+    ).all()
+    return {
+        str(message_id): {
+            "id": message_id,
+            "room_id": room_id,
+            "content": content,
+            "timestamp": timestamp,
+            "sender": {"id": sender_id, "type": sender_type} if sender_id is not None else None,
+        }
+        for message_id, room_id, content, timestamp, sender_id, sender_type in rows
+    }
+
+
+def _load_participants(db: Session, keys: Sequence[str]) -> Dict[str, dict]:
+    members = []
+    for key in keys:
+        room_id, participant_type, participant_id = key.rsplit(":", 2)
+        members.append((room_id, participant_type, int(participant_id)))
+    rows = db.execute(
+        select(Participant.room_id, Participant.participant_type, Participant.participant_id, Participant.joined_at)
+        .where(tuple_(Participant.room_id, Participant.participant_type, Participant.participant_id).in_(members))
+    ).all()
+    return {
+        participant_key(row.room_id, row.participant_type, row.participant_id): dict(row._mapping)
+        for row in rows
+    }
+
+
+# One IN query per entity for a page of changes
+LOADERS = {
+    "user": _load_users,
+    "hospital": _load_hospitals,
+    "chat": _load_chats,
+    "message": _load_messages,
+    "participant": _load_participants,
+}
+
+
+def _by_transaction(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _xact_cursor(db: Session, xact_id: int) -> int:
+    """Cursor of a transaction id; the shard's id residue keeps cursors of other shards recognizable."""
+    return XACT_CURSOR_BASE + xact_id * SHARD_ID_STRIDE + list(tenant_router.engines).index(tenant_router.shard_of(db.get_bind()))
+
+
+def _cursor_xact(cursor: int) -> int:
+    return (cursor - XACT_CURSOR_BASE) // SHARD_ID_STRIDE
+
+
+def log_bounds(db: Session) -> Tuple[int, int]:
+    """
+    (first, last) cursors that can resume: one below `first` missed pruned changes, one above
+    `last` was not handed out here. With an empty log both are the current head, so cursors are
+    kept across a pruning that emptied the log.
+    """
+    if _by_transaction(db):
+        # Transactions below the oldest one still running have all committed or rolled back,
+        # nothing at or below the head can still appear
+        horizon = db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+        head = _xact_cursor(db, horizon - 1)
+        low = db.execute(select(func.min(ChangeLogEntry.xact_id))).scalar()
+        if low is None:
+            return head, head
+        # Entries of newer transactions can be visible while an older one still runs
+        return min(_xact_cursor(db, max(low - 1, 0)), head), head
+
+    low, high = db.execute(select(func.min(ChangeLogEntry.id), func.max(ChangeLogEntry.id))).one()
+    if high is None:
+        return 0, 0
+    # The number before the oldest entry: nothing between it and that entry was pruned
+    return max(low - 1, 0), high
+
+
+def read_changes(db: Session, since: int, head: int, room_ids: Sequence[str], user_id: int, limit: int = SYNC_PAGE_SIZE) -> dict:
+    """
+    One page of changes after `since` visible to user `user_id`, a member of `room_ids`, each entity compacted to its
+    latest change with its current record. Records deleted since their change are sent as tombstones.
+    `head` is the last cursor from log_bounds; a partial page moves the cursor up to it.
+    """
+    by_transaction = _by_transaction(db)
+    position = ChangeLogEntry.xact_id if by_transaction else ChangeLogEntry.id
+    query = select(
+        ChangeLogEntry.id, position.label("position"), ChangeLogEntry.entity, ChangeLogEntry.entity_key, ChangeLogEntry.deleted
+    ).where(
+        or_(
+            ChangeLogEntry.room_id.is_(None),
+            ChangeLogEntry.room_id.in_(room_ids),
+            # Also tells members they were removed from a room
+            and_(ChangeLogEntry.entity == "participant", ChangeLogEntry.entity_key.endswith(participant_key("", User.__name__, user_id))),
+        ),
+    )
+    if by_transaction:
+        # Transactions above the head may still be joined by an older one committing
+        query = query.where(position > _cursor_xact(since), position <= _cursor_xact(head))
+    else:
+        query = query.where(position > since)
+    rows = db.execute(query.order_by(position, ChangeLogEntry.id).limit(limit)).all()
+
+    has_more = len(rows) == limit
+    if has_more and by_transaction:
+        # A cursor can only stop between transactions: the last one may continue on the next page
+        last = rows[-1].position
+        complete = [row for row in rows if row.position != last]
+        # One transaction filling the page on its own is sent whole
+        rows = complete or db.execute(query.where(position == last).order_by(ChangeLogEntry.id)).all()
+
+    def cursor(row) -> int:
+        return _xact_cursor(db, row.position) if by_transaction else row.position
+
+    latest: Dict[Tuple[str, str], Tuple[int, bool]] = {}
+    for row in rows:
+        latest.pop((row.entity, row.entity_key), None)
+        latest[(row.entity, row.entity_key)] = (cursor(row), row.deleted)
+
+    keys_by_entity: Dict[str, List[str]] = {}
+    for (entity, key), (_, deleted) in latest.items():
+        if not deleted:
+            keys_by_entity.setdefault(entity, []).append(key)
+    records = {entity: LOADERS[entity](db, keys) for entity, keys in keys_by_entity.items()}
+
+    changes = []
+    for (entity, key), (seq, deleted) in latest.items():
+        data = None if deleted else records[entity].get(key)
+        changes.append({"seq": seq, "entity": entity, "key": key, "deleted": data is None, "data": data})
+
+    return {
+        "changes": changes,
+        # Nothing at or below the head can still appear, skipping to it passes over changes of other rooms for good
+        "next": cursor(rows[-1]) if has_more else max(since, head, cursor(rows[-1]) if rows else 0),
+        "has_more": has_more,
+        "reset": False,
+    }
+
+
+def prune_changes(engine: Engine, retention_days: int = SYNC_RETENTION_DAYS) -> int:
+    """Delete log entries older than the retention, in batches; returns how many were deleted."""
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    # In cursor order, the first cursor that can resume is taken from the oldest entry left
+    position = ChangeLogEntry.xact_id if engine.dialect.name == "postgresql" else ChangeLogEntry.id
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            upper = conn.execute(
+                select(position)
+                .where(ChangeLogEntry.changed_at < cutoff)
+                .order_by(position)
+                .offset(PRUNE_BATCH_SIZE - 1)
+                .limit(1)
+            ).scalar()
+            if upper is None:
+                deleted += conn.execute(delete(ChangeLogEntry).where(ChangeLogEntry.changed_at < cutoff)).rowcount
+                break
+            deleted += conn.execute(
+                delete(ChangeLogEntry).where(position <= upper, ChangeLogEntry.changed_at < cutoff)
+            ).rowcount
+    if deleted:
+        logger.info(f"Pruned {deleted} change log entries older than {retention_days} days")
+    return deleted
+
+
+async def run_change_log_pruner(engine: Engine, interval: int = SYNC_PRUNE_INTERVAL):
+    """Background task dropping change log entries past the retention."""
+    while True:
+        try:
+            await asyncio.to_thread(prune_changes, engine)
+        except Exception as e:
+            logger.error(f"Change log pruning failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delta sync change log")
+    parser.add_argument("command", choices=["prune"])
+    parser.add_argument("--retention-days", type=int, default=SYNC_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    from services.sharding import tenant_router
+    for name, shard_engine in tenant_router.engines.items():
+        print(f"{name}: {prune_changes(shard_engine, args.retention_days)} entries pruned")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from .sync import router as sync_router
\ No newline at end of file
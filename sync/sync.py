@@ -0,0 +1,46 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, status
+from functions import db_dependency, user_dependency
+from models import Participant, User
+from services.memberships import member_ref, membership_index, session_shard
+from services.serializers import ORJSONResponse
+from services.sharding import SHARD_ID_STRIDE, tenant_router
+from services.sync import SYNC_MAX_PAGE_SIZE, SYNC_PAGE_SIZE, log_bounds, read_changes
+from sqlalchemy import select
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["Sync"],
+)
+
+
+@router.get("", response_class=ORJSONResponse)
+async def sync_changes(
+    db: db_dependency,
+    current_user: user_dependency,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_MAX_PAGE_SIZE),
+):
+    """
+    Users, hospitals and the caller's chats, messages and participants changed after `since`.
+    Without `since` only the current cursor is returned: take it, load the listings, then keep
+    passing the last `next` back. Fetch again while `has_more` is set; on `reset` the cursor is no
+    longer usable and the client starts over from the listings.
+    """
+    # Read from the primary: a replica behind the cursor's source would look like a reset
+    first, high = log_bounds(db)
+    residue = tenant_router.id_residue(current_user.hospital_id)
+    if since is None or since > high or since < first or (since and residue is not None and since % SHARD_ID_STRIDE != residue):
+        # No cursor yet, or one from before the retention or from another shard (0 is the start of any shard's log)
+        return ORJSONResponse({"changes": [], "next": high, "has_more": False, "reset": since is not None})
+
+    user_id = membership_index.user_id(db, current_user.work_id)
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    room_ids = membership_index.rooms_of(member_ref(session_shard(db), User.__name__, user_id))
+    if room_ids is None:
+        room_ids = db.execute(
+            select(Participant.room_id).where(Participant.participant_id == user_id, Participant.participant_type == User.__name__)
+        ).scalars().all()
+
+    return ORJSONResponse(read_changes(db, since, high, room_ids, user_id, limit))
@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+from sqlalchemy.orm import Session
+
+# Modules read their settings at import time; a throwaway sqlite file and an in-process Redis keep the tests self-contained
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "test_package.db"))
+os.environ.setdefault("REDIS_URL", "fakeredis://")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_SECRET_KEY", "test-access-secret")
+os.environ.setdefault("REFRESH_SECRET_KEY", "test-refresh-secret")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The app without its lifespan: no background tasks, shards or membership index build."""
+    from fastapi.testclient import TestClient
+    from database import init_db
+    import main
+
+    init_db()
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def hospital(client):
+    from database import engine
+    from models import Hospital
+
+    hospital_id = f"HOSP-{uuid.uuid4().hex[:8].upper()}"
+    with Session(engine) as db:
+        db.add(Hospital(hospital_id=hospital_id, name=hospital_id, email=f"{hospital_id}@example.com", phone_number=hospital_id, location="Test"))
+        db.commit()
+    return hospital_id
+
+
+@pytest.fixture
+def make_user(hospital):
+    """Create a staff member of the test hospital; returns (User.id, work_id, Authorization headers)."""
+    from database import engine
+    from functions import generate_jwt_token
+    from models import Hospital, User
+    from schemas.users_schema import UserSchema
+
+    def make(hospital_id: str = hospital):
+        work_id = f"EMP-{uuid.uuid4().hex[:8].upper()}"
+        with Session(engine) as db:
+            hospital_pk = db.query(Hospital.id).filter(Hospital.hospital_id == hospital_id).scalar()
+            user = User(work_id=work_id, first_name="Test", last_name="User", email=f"{work_id}@example.com",
+                        occupation="Doctor", department="Cardiology", hospital_id=hospital_pk)
+            db.add(user)
+            db.commit()
+            user_id = user.id
+        token = generate_jwt_token(UserSchema(work_id=work_id, first_name="Test", last_name="User",
+                                              email=f"{work_id}@example.com", occupation="Doctor",
+                                              department="Cardiology", hospital_id=hospital_id))
+        return user_id, work_id, {"Authorization": f"Bearer {token}"}
+
+    return make
+
+
+@pytest.fixture
+def room(make_user):
+    """A room with one member; returns (room_id, room name, the member's headers)."""
+    from database import engine
+    from models import ChatRoom, Participant
+
+    user_id, _, headers = make_user()
+    room_id, name = f"CHAT-{uuid.uuid4().hex[:8].upper()}", f"Ward {uuid.uuid4().hex[:8]}"
+    with Session(engine) as db:
+        db.add(ChatRoom(id=room_id, name=name))
+        db.add(Participant(room_id=room_id, participant_id=user_id, participant_type="User"))
+        db.commit()
+    return room_id, name, headers
+
+
+@pytest.fixture
+def admin_headers():
+    from functions import generate_jwt_token
+    from schemas.admins_schema import AdminSchema
+
+    admin = AdminSchema(admin_id=f"ADM-{uuid.uuid4().hex[:8].upper()}", username="compliance", email="compliance@example.com")
+    return {"Authorization": f"Bearer {generate_jwt_token(admin)}"}
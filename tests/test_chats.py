@@ -0,0 +1,35 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import engine
+from models import Participant
+
+
+def test_bulk_room_create_does_not_join_rooms_of_others(client, room, make_user):
+    room_id, name, _ = room
+    outsider_id, outsider_work_id, headers = make_user()
+
+    response = client.post("/chats/rooms/bulk", headers=headers, json={"rooms": [{"name": name, "participants": [outsider_work_id]}]})
+
+    assert response.status_code == 403
+    with Session(engine) as db:
+        members = db.execute(select(Participant.participant_id).where(Participant.room_id == room_id)).scalars().all()
+    assert outsider_id not in members
+
+
+def test_export_is_refused_to_staff_members(client, room, hospital):
+    room_id, _, member_headers = room
+
+    for params in ({"hospital_id": hospital, "room_id": room_id}, {"hospital_id": hospital}):
+        assert client.get("/chats/export", headers=member_headers, params=params).status_code == 401
+
+
+def test_admin_exports_a_room_of_the_hospital(client, room, hospital, admin_headers):
+    room_id, _, member_headers = room
+    client.post(f"/chats/{room_id}/messages", headers=member_headers, json={"content": "handover at 8"})
+
+    response = client.get("/chats/export", headers=admin_headers, params={"hospital_id": hospital, "room_id": room_id})
+
+    assert response.status_code == 200
+    assert b"handover at 8" in response.content
+    other = client.get("/chats/export", headers=admin_headers, params={"hospital_id": "HOSP-ELSEWHERE", "room_id": room_id})
+    assert other.status_code == 404
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import engine
+from models import Participant
+from services.memberships import READY_KEY, USER_IDS_KEY, member_ref, membership_index
+
+
+@pytest.fixture
+def built_index(client):
+    membership_index.rebuild(engine)
+    yield membership_index
+    membership_index.redis.delete(READY_KEY)
+
+
+def test_member_of_another_shard_with_the_same_id_is_not_a_member(client, built_index, room, make_user):
+    room_id, _, _ = room
+    outsider_id, _, headers = make_user()
+    # The same User.id handed out on another shard, in a room of that shard
+    built_index.apply(added=[(room_id, member_ref("shard1", "User", outsider_id))])
+
+    assert client.get(f"/chats/{room_id}/messages", headers=headers).status_code == 403
+
+
+def test_cached_user_ids_are_kept_per_shard(client, built_index, room, make_user):
+    room_id, _, _ = room
+    with Session(engine) as db:
+        member_id = db.execute(select(Participant.participant_id).where(Participant.room_id == room_id)).scalar_one()
+    _, outsider_work_id, headers = make_user()
+    # Another shard has a user with the outsider's work_id who is the room member's id there
+    built_index.redis.hset(USER_IDS_KEY.format(shard="shard1"), outsider_work_id, member_id)
+
+    assert client.get(f"/chats/{room_id}/messages", headers=headers).status_code == 403
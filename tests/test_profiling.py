@@ -0,0 +1,27 @@
+import asyncio
+import sys
+from services.profiling import RequestProfile
+
+
+async def wait_on_io():
+    await asyncio.sleep(0.05)
+
+
+async def profiled_request() -> RequestProfile:
+    # Marked like ProfilingMiddleware._profile: this frame is the request's root
+    profile = RequestProfile("GET", "/test", sys._getframe(), asyncio.current_task())
+    profile.start()
+    try:
+        await wait_on_io()
+    finally:
+        profile.stop()
+    return profile
+
+
+def test_suspended_request_is_sampled_as_await():
+    profile = asyncio.run(profiled_request())
+
+    awaits = {stack: count for stack, count in profile.samples.items() if stack.endswith("[await]")}
+    assert awaits, profile.samples
+    assert all(stack.split(";")[0].startswith("wait_on_io ") for stack in awaits)
+    assert any(stack.split(";")[1].startswith("sleep ") for stack in awaits)
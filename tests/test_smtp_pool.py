@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+import pytest
+from aiosmtplib import SMTPConnectError
+from benchmarks.bench_smtp_pool import SMTPStandIn, make_messages
+from services.send_email import SMTPConnectionPool
+
+
+@pytest.fixture
+def smtp_server():
+    """The SMTP stand-in on its own loop and thread, so it outlives the loops of the pool under test."""
+    server = SMTPStandIn()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    port = asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    yield server, port
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def make_pool(port: int, size: int = 1) -> SMTPConnectionPool:
+    return SMTPConnectionPool(size=size, hostname="127.0.0.1", port=port, start_tls=False, timeout=5)
+
+
+async def send_all(pool: SMTPConnectionPool, messages: list):
+    for message in messages:
+        await pool.send_message(message)
+
+
+def test_connection_is_reused_across_sends(smtp_server):
+    server, port = smtp_server
+    pool = make_pool(port)
+
+    async def run():
+        await send_all(pool, make_messages(5))
+        await pool.close()
+
+    asyncio.run(run())
+    assert server.messages == 5
+    assert server.connections == 1
+    assert pool.connects == 1
+
+
+def test_reconnects_after_the_server_drops_the_connection(smtp_server):
+    server, port = smtp_server
+    server.drop_every = 2
+    pool = make_pool(port)
+
+    async def run():
+        await send_all(pool, make_messages(5))
+        await pool.close()
+
+    asyncio.run(run())
+    assert server.messages == 5
+    assert server.connections == 3
+    assert pool.connects == 3
+
+
+def test_new_event_loop_closes_the_old_connections(smtp_server):
+    server, port = smtp_server
+    pool = make_pool(port)
+
+    asyncio.run(send_all(pool, make_messages(1)))
+    assert wait_for(lambda: server.connections == 1)
+    assert server.disconnects == 0
+
+    async def run():
+        await send_all(pool, make_messages(1))
+        # The connection opened on the first loop is shut down when the pool moves to this one
+        assert await asyncio.to_thread(wait_for, lambda: server.disconnects == 1)
+        await pool.close()
+
+    asyncio.run(run())
+    assert server.messages == 2
+    assert pool.connects == 2
+    assert wait_for(lambda: server.disconnects == 2)
+
+
+async def _close_listener(server: SMTPStandIn):
+    server.server.close()
+
+
+def stop_listening(server: SMTPStandIn):
+    """Refuse new connections while the open ones carry on."""
+    asyncio.run_coroutine_threadsafe(_close_listener(server), server.server.get_loop()).result()
+
+
+def test_failed_connect_is_not_retried_and_reported_per_message():
+    attempts = 0
+
+    async def hang_up(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nonlocal attempts
+        attempts += 1
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(hang_up, "127.0.0.1", 0)
+        pool = make_pool(server.sockets[0].getsockname()[1])
+        try:
+            return await pool.send_messages(make_messages(3)), pool.connects
+        finally:
+            server.close()
+
+    results, connects = asyncio.run(run())
+    assert len(results) == 3
+    assert all(isinstance(error, SMTPConnectError) for error in results)
+    # One attempt for the batch: neither the failed connect nor the later messages try again
+    assert attempts == 1
+    assert connects == 0
+
+
+def test_batch_keeps_the_results_of_accepted_messages_when_reconnecting_fails(smtp_server):
+    server, port = smtp_server
+    server.drop_every = 2
+    pool = make_pool(port)
+
+    async def run():
+        await pool.send_message(make_messages(1)[0])
+        await asyncio.to_thread(stop_listening, server)
+        # The second message is accepted and the connection dropped, the reconnect for the third is refused
+        return await pool.send_messages(make_messages(3))
+
+    results = asyncio.run(run())
+    assert results[0] is None
+    assert all(isinstance(error, SMTPConnectError) for error in results[1:])
+    assert server.messages == 2
+    assert pool.connects == 1
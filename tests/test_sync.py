@@ -0,0 +1,23 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from chats.chats import save_message
+from database import engine
+from models import Participant
+
+
+def test_sync_resumes_with_changes_of_the_callers_rooms(client, room, make_user):
+    room_id, _, member_headers = room
+    _, _, outsider_headers = make_user()
+    with Session(engine) as db:
+        member_id = db.execute(select(Participant.participant_id).where(Participant.room_id == room_id)).scalar_one()
+    cursor = client.get("/sync", headers=member_headers).json()["next"]
+
+    save_message(engine, room_id, member_id, "bed 4 discharged")
+
+    page = client.get("/sync", headers=member_headers, params={"since": cursor}).json()
+    assert not page["reset"] and not page["has_more"]
+    assert [change["data"]["content"] for change in page["changes"] if change["entity"] == "message"] == ["bed 4 discharged"]
+    assert page["next"] > cursor
+
+    outsider_page = client.get("/sync", headers=outsider_headers, params={"since": cursor}).json()
+    assert not any(change["entity"] == "message" for change in outsider_page["changes"])
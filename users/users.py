@@ -1,12 +1,27 @@
+import asyncio
 from typing import List
 from fastapi import APIRouter, HTTPException, status, Response
-from functions import db_dependency, decode_jwt_token, generate_jwt_token, otp_generator, user_dependency
-from models import ChatMessage, ChatRoom, Hospital, Participant, User
-from schemas.users_schema import OTPResendSchema, OTPSchema, UserLoginSchema, UserSchema, UserSchemaWithTokens
+from sqlalchemy.orm import Session
+from functions import db_dependency, decode_jwt_token, generate_jwt_token, loaders_dependency, otp_generator, user_dependency
+from models import Hospital, User
+from schemas.users_schema import (
+    OTPResendSchema,
+    OTPSchema,
+    UserBatchResultSchema,
+    UserBatchSchema,
+    UserLoginSchema,
+    UserSchema,
+    UserSchemaWithTokens,
+)
+from services.cache import cached, fenced_read_session
 from services.logger import logger
+from services.memberships import member_ref, membership_index, session_shard
 from services.redis_client import get_redis_client
 from services.send_email import send_otp_email
-from sqlalchemy.orm import selectinload
+from services.sharding import tenant_router
+from services.rate_limit import rate_limit
+from services.read_models import list_user_chats, list_users
+from services.serializers import ORJSONResponse, dump_rows, user_list_adapter
 
 router = APIRouter(
     prefix="/users",
@@ -15,46 +30,61 @@ router = APIRouter(
 
 redis_client = get_redis_client()
 
-@router.get("/", response_model=List[UserSchema])
-async def get_all_users(db: db_dependency):
+def list_users_on_every_shard() -> list:
+    """Each hospital's staff read from the shard it is routed to; copies left behind by a move are skipped."""
+    routed = tenant_router.hospitals_by_shard()
+    off_default = set().union(*routed.values())
+    rows = []
+    with fenced_read_session() as db:
+        rows.extend(list_users(db, exclude_hospital_ids=off_default))
+    for shard, hospital_ids in routed.items():
+        with Session(tenant_router.engines[shard]) as db:
+            rows.extend(list_users(db, hospital_ids=hospital_ids))
+    return rows
+
+@router.get("/", response_model=List[UserSchema], response_class=ORJSONResponse)
+@cached("user:*")
+async def get_all_users():
     """
     Fetch all users from the database and return them as a list of UserSchema objects.
     """
 
-    # Query all user records from the database
-    users = db.query(User).all()
-
-    updated_users = []
-
-    # Loop through each user and map their data into the Pydantic schema
-    for user in users:
-        # Since hospital_id in the User model is a foreign key reference (int),
-        # we fetch the related Hospital's 'hospital_id' string for clarity in the response.
-        updated_user = UserSchema(
-            work_id=user.work_id,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            email=user.email,
-            occupation=user.occupation,
-            department=user.department,
-            hospital_id=user.hospital.hospital_id  # Retrieve readable hospital_id string
-        )
-        updated_users.append(updated_user)
+    # Served from the Redis cache until a committed User/Hospital change bumps the "user:*" tag.
+    # The listing spans every shard, so the cached copy is the same whichever tenant missed.
+    # Misses read the default shard's replica once it has caught up with the last invalidating commit.
+    # Column projection, no ORM entities are built for the listing
+    rows = list_users_on_every_shard()
 
-    # Return the formatted list of user objects as JSON
-    return updated_users
+    # Validate and serialize in one pass; returning the bytes directly skips FastAPI's re-validation
+    return ORJSONResponse(dump_rows(user_list_adapter, rows))
 
-@router.post("/login/")
-async def login_user(request: UserLoginSchema, db: db_dependency):
+@router.post("/batch", response_model=UserBatchResultSchema, response_class=ORJSONResponse)
+async def get_users_batch(request: UserBatchSchema, loaders: loaders_dependency, current_user: user_dependency):
+    """
+    Resolve many User.ids (the participant_id/sender_id values of the chat endpoints) in one query.
+    Ids that match no user are listed in `missing`.
+    """
+    ids = list(dict.fromkeys(request.ids))
+    users = await loaders.users.load_many(ids)
+    return ORJSONResponse({
+        "users": [user for user in users if user is not None],
+        "missing": [user_id for user_id, user in zip(ids, users) if user is None],
+    })
+
+@router.post("/login/", dependencies=[rate_limit("login")])
+async def login_user(request: UserLoginSchema):
     if not request:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No data was provided")
     
-    user = db.query(User).where(User.work_id == request.work_id, User.email == request.email).first()
+    # No token yet, the hospital in the request picks the shard holding its staff
+    with tenant_router.session(request.hospital_id, write=False) as db:
+        user = db.query(User).where(User.work_id == request.work_id, User.email == request.email).first()
+        hospital = db.query(Hospital).where(Hospital.hospital_id == request.hospital_id).first()
+
     if not user:
         logger.warning(f"Unauthorized access by {request.email}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
-    hospital = db.query(Hospital).where(Hospital.hospital_id == request.hospital_id).first()
     if not hospital:
         logger.warning(f"Unauthorized access by {request.email}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Hospital not found")
@@ -70,6 +100,8 @@ async def login_user(request: UserLoginSchema, db: db_dependency):
         # Cache OTP in Redis for 10 minutes
         key = f"user:{request.email}"
         redis_client.set(key, new_otp, ex=60 * 10)
+        # Remembered so OTP verification can find the user's shard
+        redis_client.set(f"{key}:hospital", request.hospital_id, ex=60 * 10)
 
         # Send OTP email
         result = await send_otp_email(recipient=request.email, otp_code=new_otp)
@@ -85,8 +117,8 @@ async def login_user(request: UserLoginSchema, db: db_dependency):
     
     return result
 
-@router.post("/verify-otp/", response_model=UserSchemaWithTokens)
-async def verify_otp(request: OTPSchema, db: db_dependency):
+@router.post("/verify-otp/", response_model=UserSchemaWithTokens, dependencies=[rate_limit("verify-otp")])
+async def verify_otp(request: OTPSchema):
     if not request:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No info was provided")
     
@@ -104,12 +136,14 @@ async def verify_otp(request: OTPSchema, db: db_dependency):
     # Remove OTP after successful verification (prevent reuse)
     redis_client.delete(key)
     
-    # Retrieve user
-    user = db.query(User).filter(User.email == request.email).first()
+    # Retrieve user from the shard of the hospital given at login
+    with tenant_router.session(redis_client.get(f"{key}:hospital"), write=False) as db:
+        user = db.query(User).filter(User.email == request.email).first()
+        hospital = db.query(Hospital).where(Hospital.id == user.hospital_id).first() if user else None
+
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
-    hospital = db.query(Hospital).where(Hospital.id == user.hospital_id).first()
     if not hospital:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Hospital not found")
     
@@ -136,7 +170,7 @@ async def verify_otp(request: OTPSchema, db: db_dependency):
         "user_details": user_model,
     }
 
-@router.post("/resend-otp/")
+@router.post("/resend-otp/", dependencies=[rate_limit("resend-otp")])
 async def resend_otp_to_user(request: OTPResendSchema):
     if not request:
         logger.warning("No email was provided for resend OTP")
@@ -152,6 +186,7 @@ async def resend_otp_to_user(request: OTPResendSchema):
     # Generate and store new OTP
     new_otp = otp_generator()
     redis_client.set(key, new_otp, ex=600)
+    redis_client.expire(f"{key}:hospital", 600)
 
     # Send new OTP
     try:
@@ -167,64 +202,38 @@ async def resend_otp_to_user(request: OTPResendSchema):
 
     return result
 
-from sqlalchemy.orm import selectinload
-
-@router.get("/chats")
-async def get_all_personal_chats(db: db_dependency, current_user: user_dependency):
+@router.get("/chats", response_class=ORJSONResponse)
+async def get_all_personal_chats(
+    db: db_dependency,
+    loaders: loaders_dependency,
+    current_user: user_dependency,
+    expand_users: bool = False,
+):
+    """The caller's rooms; with `expand_users`, participants and last senders carry their user details."""
     if not current_user:
         raise HTTPException(status_code=401, detail="User must be logged in")
 
-    user = db.query(User).filter(User.work_id == current_user.work_id).first()
-    if not user:
+    user_id = membership_index.user_id(db, current_user.work_id)
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    participant_type = user.__class__.__name__
-
-    rooms = (
-        db.query(ChatRoom)
-        .options(
-            selectinload(ChatRoom.participants),
-            selectinload(ChatRoom.messages).selectinload(ChatMessage.sender_association)
-        )
-        .join(ChatRoom.participants)
-        .filter(
-            Participant.participant_id == user.id,
-            Participant.participant_type == participant_type
-        )
-        .order_by(ChatRoom.last_message.desc())  
-        .all()
-    )
-
-    chats_data = []
-    for room in rooms:
-        # Efficiently pick the last message already loaded in memory (since we preloaded messages)
-        last_message_obj = (
-            max(room.messages, key=lambda m: m.timestamp)
-            if room.messages else None
-        )
-
-        last_message_data = (
-            {
-                "id": last_message_obj.id,
-                "content": last_message_obj.content,
-                "timestamp": last_message_obj.timestamp,
-                "sender": {
-                    "id": last_message_obj.sender_association.sender_id,
-                    "type": last_message_obj.sender_association.sender_type,
-                } if last_message_obj.sender_association else None,
-            }
-            if last_message_obj else None
-        )
-
-        chats_data.append({
-            "room_id": room.id,
-            "room_name": room.name,
-            "participants": [
-                {"participant_id": p.participant_id, "participant_type": p.participant_type}
-                for p in room.participants
-            ],
-            "last_message": last_message_data,
-            "created_at": room.created_at,
-        })
-
-    return {"chats": chats_data}
\ No newline at end of file
+    # Room ids from the Redis membership index when it is built, otherwise joined from participants
+    room_ids = membership_index.rooms_of(member_ref(session_shard(db), User.__name__, user_id))
+    chats_data = list_user_chats(db, user_id, room_ids)
+
+    if expand_users:
+        async def expand(room):
+            # Looked up per room, the loader folds every room's ids into a single query
+            participants = [p for p in room.participants if p["participant_type"] == User.__name__]
+            users = await loaders.users.load_many(p["participant_id"] for p in participants)
+            for participant, user in zip(participants, users):
+                participant["user"] = user
+            sender = room.last_message.sender if room.last_message else None
+            if sender and sender["type"] == User.__name__:
+                # Usually a participant already loaded above
+                sender["user"] = await loaders.users.load(sender["id"])
+
+        await asyncio.gather(*(expand(room) for room in chats_data))
+
+    # orjson encodes the slotted read models and datetimes directly, without jsonable_encoder
+    return ORJSONResponse({"chats": chats_data})
\ No newline at end of file